@@ -1,12 +1,27 @@
 """
 Admin configuration for accounts app
 """
+import csv
+import io
+from django.conf import settings
 from django.contrib import admin
+from django.core.exceptions import PermissionDenied
+from django.core.mail import EmailMessage
+from django.db import transaction
+from django.http import StreamingHttpResponse
+from django.template.response import TemplateResponse
+from django.urls import path
+from django.utils import timezone
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
+from clinic_appointment.admin_utils import LargeTableAdmin
 from .models import (
     User, DoctorProfile, Branch, DoctorSchedule,
     PatientProfile, StaffProfile, StaffAuthorizationAttempt, RegistrationAttempt
 )
+from .directory import bump_directory_version
+from .onboarding import REPORT_FIELDS, PatientImporter
+from .principal import invalidate_principal
+from .tasks import queue_messages
 
 
 @admin.register(Branch)
@@ -19,7 +34,7 @@ class BranchAdmin(admin.ModelAdmin):
 
 
 @admin.register(User)
-class UserAdmin(BaseUserAdmin):
+class UserAdmin(LargeTableAdmin, BaseUserAdmin):
     """Custom admin for User model with enhanced display"""
     list_display = ('email', 'username', 'full_name', 'user_type', 'is_active', 'is_superuser', 'date_joined')
     list_filter = ('user_type', 'is_active', 'is_superuser', 'date_joined')
@@ -49,6 +64,7 @@ class DoctorProfileAdmin(admin.ModelAdmin):
     list_filter = ('branch', 'specialization', 'is_available', 'years_of_experience')
     search_fields = ('user__email', 'user__first_name', 'user__last_name', 'specialization', 'branch__name')
     raw_id_fields = ('user', 'branch')
+    list_select_related = ('user', 'branch')
 
 
 @admin.register(DoctorSchedule)
@@ -58,16 +74,57 @@ class DoctorScheduleAdmin(admin.ModelAdmin):
     list_filter = ('day_of_week', 'is_available', 'doctor__branch')
     search_fields = ('doctor__user__email', 'doctor__user__first_name', 'doctor__user__last_name')
     raw_id_fields = ('doctor',)
+    list_select_related = ('doctor__user',)
 
 
 @admin.register(PatientProfile)
-class PatientProfileAdmin(admin.ModelAdmin):
+class PatientProfileAdmin(LargeTableAdmin):
     """Admin for PatientProfile model"""
     list_display = ('patient_id', 'user', 'date_of_birth', 'gender', 'consent_treatment', 'created_at')
     list_filter = ('gender', 'consent_treatment', 'consent_data_sharing', 'created_at')
     search_fields = ('patient_id', 'user__email', 'user__first_name', 'user__last_name', 'insurance_number')
     raw_id_fields = ('user',)
+    list_select_related = ('user',)
     readonly_fields = ('patient_id', 'created_at', 'updated_at')
+    change_list_template = 'admin/accounts/patientprofile/change_list.html'
+    
+    def get_urls(self):
+        """Add the CSV import page"""
+        urls = [
+            path('import-csv/', self.admin_site.admin_view(self.import_csv_view),
+                 name='accounts_patientprofile_import_csv'),
+        ]
+        return urls + super().get_urls()
+    
+    def import_csv_view(self, request):
+        """Upload a CSV of patients and stream back the per-row result report"""
+        if not self.has_add_permission(request):
+            raise PermissionDenied
+        
+        if request.method == 'POST' and request.FILES.get('csv_file'):
+            upload = io.TextIOWrapper(request.FILES['csv_file'].file, encoding='utf-8-sig', newline='')
+            importer = PatientImporter(send_invites=not request.POST.get('no_invites'))
+            
+            def report():
+                buffer = io.StringIO()
+                writer = csv.DictWriter(buffer, fieldnames=REPORT_FIELDS)
+                writer.writeheader()
+                for result in importer.run(csv.DictReader(upload)):
+                    writer.writerow(result)
+                    yield buffer.getvalue()
+                    buffer.seek(0)
+                    buffer.truncate()
+            
+            response = StreamingHttpResponse(report(), content_type='text/csv')
+            response['Content-Disposition'] = 'attachment; filename="patient_import_report.csv"'
+            return response
+        
+        context = {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': 'Import patients from CSV',
+        }
+        return TemplateResponse(request, 'admin/accounts/patientprofile/import_csv.html', context)
 
 
 @admin.register(StaffProfile)
@@ -77,11 +134,12 @@ class StaffProfileAdmin(admin.ModelAdmin):
     list_filter = ('is_approved', 'mfa_enabled', 'department', 'role_title', 'created_at')
     search_fields = ('employee_id', 'user__email', 'user__first_name', 'user__last_name', 'license_number')
     raw_id_fields = ('user', 'approved_by')
+    list_select_related = ('user',)
     readonly_fields = ('created_at', 'updated_at', 'approved_at')
 
 
 @admin.register(StaffAuthorizationAttempt)
-class StaffAuthorizationAttemptAdmin(admin.ModelAdmin):
+class StaffAuthorizationAttemptAdmin(LargeTableAdmin):
     """Admin for StaffAuthorizationAttempt model"""
     list_display = ('ip_address', 'employee_id', 'success', 'attempt_count', 'locked_until', 'created_at')
     list_filter = ('success', 'created_at')
@@ -90,7 +148,7 @@ class StaffAuthorizationAttemptAdmin(admin.ModelAdmin):
 
 
 @admin.register(RegistrationAttempt)
-class RegistrationAttemptAdmin(admin.ModelAdmin):
+class RegistrationAttemptAdmin(LargeTableAdmin):
     """Admin for RegistrationAttempt model"""
     list_display = ('ip_address', 'user_type', 'email', 'success', 'created_at')
     list_filter = ('user_type', 'success', 'created_at')
@@ -104,28 +162,43 @@ class RegistrationAttemptAdmin(admin.ModelAdmin):
 
 @admin.action(description='Approve selected staff accounts')
 def approve_staff(modeladmin, request, queryset):
-    """Approve staff accounts and send activation email"""
-    from django.core.mail import send_mail
-    from django.conf import settings
+    """Approve and activate pending staff accounts, then queue activation emails"""
+    with transaction.atomic():
+        pending = list(
+            queryset.filter(is_approved=False).select_for_update()
+            .values_list('pk', 'user_id')
+        )
+        profile_ids = [pk for pk, _ in pending]
+        user_ids = [user_id for _, user_id in pending]
+        
+        # Two UPDATEs for the whole selection instead of two saves per account
+        now = timezone.now()
+        StaffProfile.objects.filter(pk__in=profile_ids).update(
+            is_approved=True, approved_by=request.user, approved_at=now, updated_at=now
+        )
+        User.objects.filter(pk__in=user_ids).update(is_active=True)
+        users = User.objects.filter(pk__in=user_ids).only(
+            'email', 'username', 'first_name', 'last_name'
+        )
+        # Queued in this transaction: the worker sends them only once it commits
+        queue_messages([staff_approval_email(user) for user in users])
+        
+        def after_commit():
+            # update() sends no post_save, so drop cached principals and
+            # the doctor directory here
+            for user_id in user_ids:
+                invalidate_principal(user_id)
+            bump_directory_version()
+        transaction.on_commit(after_commit)
     
-    approved_count = 0
-    for staff_profile in queryset:
-        if not staff_profile.is_approved:
-            staff_profile.is_approved = True
-            staff_profile.approved_by = request.user
-            staff_profile.approved_at = timezone.now()
-            staff_profile.save()
-            
-            # Activate user account
-            user = staff_profile.user
-            user.is_active = True
-            user.save()
-            
-            # Send activation email
-            try:
-                send_mail(
-                    subject='Your Staff Account Has Been Approved - Apex Dental Care',
-                    message=f'''
+    modeladmin.message_user(request, f'{len(pending)} staff account(s) approved and activated.')
+
+
+def staff_approval_email(user):
+    """Activation email for an approved staff account"""
+    return EmailMessage(
+        subject='Your Staff Account Has Been Approved - Apex Dental Care',
+        body=f'''
 Dear {user.get_full_name() or user.email},
 
 Your staff account at Apex Dental Care has been approved and activated.
@@ -138,28 +211,19 @@ Please log in and complete your profile setup.
 
 Best regards,
 Apex Dental Care Administration
-                    ''',
-                    from_email=settings.DEFAULT_FROM_EMAIL if hasattr(settings, 'DEFAULT_FROM_EMAIL') else 'noreply@apexdental.com',
-                    recipient_list=[user.email],
-                    fail_silently=True,
-                )
-            except Exception:
-                pass  # Email sending is optional
-            
-            approved_count += 1
-    
-    modeladmin.message_user(request, f'{approved_count} staff account(s) approved and activated.')
+        ''',
+        from_email=getattr(settings, 'DEFAULT_FROM_EMAIL', 'noreply@apexdental.com'),
+        to=[user.email],
+    )
 
 
 @admin.action(description='Reject selected staff accounts')
 def reject_staff(modeladmin, request, queryset):
-    """Reject staff accounts"""
-    rejected_count = 0
-    for staff_profile in queryset:
-        if not staff_profile.is_approved:
-            # Delete the user account
-            staff_profile.user.delete()
-            rejected_count += 1
+    """Reject pending staff accounts (deletes the users and, by cascade, their profiles)"""
+    user_ids = queryset.filter(is_approved=False).values_list('user_id', flat=True)
+    with transaction.atomic():
+        _, deleted = User.objects.filter(pk__in=list(user_ids)).delete()
+    rejected_count = deleted.get(User._meta.label, 0)
     
     modeladmin.message_user(request, f'{rejected_count} staff account(s) rejected and removed.')
 
@@ -171,6 +235,7 @@ class StaffProfileApprovalAdmin(admin.ModelAdmin):
     list_filter = ('is_approved', 'department', 'role_title', 'created_at')
     search_fields = ('employee_id', 'user__email', 'user__first_name', 'user__last_name', 'role_title')
     raw_id_fields = ('user', 'approved_by')
+    list_select_related = ('user',)
     readonly_fields = ('created_at', 'updated_at', 'approved_at')
     actions = [approve_staff, reject_staff]
     
@@ -183,6 +248,7 @@ class StaffProfileApprovalAdmin(admin.ModelAdmin):
         """Display user email"""
         return obj.user.email
     email.short_description = 'Email'
+    email.admin_order_field = 'user__email'
     
     def has_add_permission(self, request):
         """Only superusers can add staff profiles"""
@@ -9,6 +9,9 @@ from rest_framework.response import Response
 from rest_framework_simplejwt.tokens import RefreshToken
 from django.contrib.auth import get_user_model
 from .models import PatientProfile, StaffProfile, RegistrationAttempt
+from .ratelimit import REGISTRATION_RATE_LIMIT, is_staff_request, rate_limit
+from .security_events import record_security_event
+from .staff_tickets import StaffTicketError, get_staff_ticket, verify_staff_ticket
 from .serializers import (
     PatientRegistrationSerializer,
     UserSerializer
@@ -20,6 +23,7 @@ logger = logging.getLogger(__name__)
 User = get_user_model()
 
 
+@rate_limit('patient_register', REGISTRATION_RATE_LIMIT, 3600, exempt=is_staff_request)
 @api_view(['POST'])
 @permission_classes([AllowAny])
 def api_register_patient(request):
@@ -67,17 +71,13 @@ def api_register_patient(request):
             user = result['user']
             patient_profile = result['patient_profile']
             
-            # Track registration attempt
-            ip_address = request.META.get('REMOTE_ADDR')
-            try:
-                RegistrationAttempt.objects.create(
-                    ip_address=ip_address,
-                    user_type='PATIENT',
-                    email=user.email,
-                    success=True
-                )
-            except Exception:
-                pass
+            # Track registration attempt (buffered; written in batches off the request path)
+            record_security_event(RegistrationAttempt(
+                ip_address=request.META.get('REMOTE_ADDR'),
+                user_type='PATIENT',
+                email=user.email,
+                success=True
+            ))
             
             # Generate JWT tokens
             refresh = RefreshToken.for_user(user)
@@ -126,7 +126,9 @@ def api_register_staff(request):
     
     POST /api/auth/register/staff/
     
-    Note: Staff registration requires prior authorization via /api/staff/authorize/
+    Note: Staff registration requires prior authorization via /api/staff/authorize/,
+    which returns a signed `staff_ticket`. Send it back in the body or in an
+    X-Staff-Ticket header; employee_id is optional and must match the ticket.
     
     Request Body:
     {
@@ -137,6 +139,7 @@ def api_register_staff(request):
         "first_name": "Jane",
         "last_name": "Smith",
         "phone_number": "+96512345678",
+        "staff_ticket": "<ticket from /api/staff/authorize/>",
         "employee_id": "DOC001",
         "role_title": "Orthodontist",
         "department": "Dental",
@@ -151,15 +154,23 @@ def api_register_staff(request):
         "employee_id": "DOC001"
     }
     """
-    # Check if staff was authorized (in production, use session or token)
-    # For API, we'll require a separate authorization step
-    employee_id = request.data.get('employee_id')
-    if not employee_id:
+    if not isinstance(request.data, dict):
         return Response({
             'success': False,
-            'error': 'Employee ID is required. Please complete authorization first.'
+            'error': 'Request body must be a JSON object.'
         }, status=status.HTTP_400_BAD_REQUEST)
     
+    # Check authorization; the employee ID comes from the signed ticket
+    try:
+        employee_id = verify_staff_ticket(
+            request, get_staff_ticket(request, request.data), request.data.get('employee_id')
+        )
+    except StaffTicketError as e:
+        return Response({
+            'success': False,
+            'error': str(e)
+        }, status=status.HTTP_403_FORBIDDEN)
+    
     try:
         # Validate email domain
         email = request.data.get('email', '')
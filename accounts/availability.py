@@ -0,0 +1,144 @@
+"""
+Email/username availability checks for the registration form's live check.
+
+Each process keeps a Bloom filter of the registered emails and usernames.
+A filter miss means the value is definitely free, so no query runs. A
+possible hit is confirmed with an exact indexed lookup.
+
+The filter is built, and rebuilt every USER_AVAILABILITY_REBUILD_SECONDS,
+on a background thread; until the first build finishes every check runs the
+exact lookup. Users created by another process only reach this process's
+filter at the next rebuild, so the live check can briefly report a taken
+value as free. Registration itself never uses the filter: its serializer
+validates against the database.
+"""
+from decouple import config
+from django.contrib.auth import get_user_model
+from django.db import connection
+import hashlib
+import logging
+import math
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+USER_AVAILABILITY_CAPACITY = config('USER_AVAILABILITY_CAPACITY', default=100000, cast=int)
+USER_AVAILABILITY_ERROR_RATE = config('USER_AVAILABILITY_ERROR_RATE', default=0.01, cast=float)
+USER_AVAILABILITY_REBUILD_SECONDS = config('USER_AVAILABILITY_REBUILD_SECONDS', default=300, cast=int)
+
+
+class BloomFilter:
+    """
+    Fixed-size Bloom filter over strings.
+
+    Args:
+        capacity (int): Expected number of items
+        error_rate (float): Target false-positive rate at that capacity
+    """
+
+    def __init__(self, capacity, error_rate):
+        capacity = max(1, capacity)
+        self.size = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, value):
+        # Double hashing: two 64-bit halves of one digest give every probe
+        digest = hashlib.blake2b(value.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hash_count))
+
+    def add(self, value):
+        for position in self._positions(value):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, value):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(value))
+
+
+class UserIdentifierIndex:
+    """
+    Per-process membership filters for User.email and User.username.
+
+    Values are lowercased before hashing so the filter also flags
+    case variants; the confirming query decides the final answer.
+    """
+    FIELDS = ('email', 'username')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._filters = None
+        self._built_at = 0
+        self._build_thread = None
+
+    def _build(self):
+        User = get_user_model()
+        count = User.objects.count()
+        # Leave room to grow before the false-positive rate degrades
+        capacity = max(USER_AVAILABILITY_CAPACITY, count * 2)
+        filters = {field: BloomFilter(capacity, USER_AVAILABILITY_ERROR_RATE) for field in self.FIELDS}
+        for email, username in User.objects.values_list('email', 'username').iterator(chunk_size=5000):
+            filters['email'].add(email.lower())
+            filters['username'].add(username.lower())
+        logger.info(f"Built user availability filters for {count} user(s)")
+        return filters
+
+    def _rebuild(self):
+        try:
+            filters = self._build()
+        except Exception as e:
+            logger.error(f"Building user availability filters failed: {e}")
+            return
+        finally:
+            connection.close()
+        with self._lock:
+            self._filters = filters
+            self._built_at = time.monotonic()
+
+    def _get_filters(self):
+        """Current filters (None before the first build); starts a rebuild when due"""
+        with self._lock:
+            due = self._filters is None or time.monotonic() - self._built_at > USER_AVAILABILITY_REBUILD_SECONDS
+            if due and (self._build_thread is None or not self._build_thread.is_alive()):
+                self._build_thread = threading.Thread(
+                    target=self._rebuild,
+                    name='user-availability-filter',
+                    daemon=True
+                )
+                self._build_thread.start()
+            return self._filters
+
+    def add(self, email=None, username=None):
+        """Record a newly created user; a no-op until the filters are built"""
+        with self._lock:
+            if self._filters is None:
+                return
+            if email:
+                self._filters['email'].add(email.lower())
+            if username:
+                self._filters['username'].add(username.lower())
+
+    def might_exist(self, field, value):
+        """False means definitely not registered; True means check the database"""
+        filters = self._get_filters()
+        return filters is None or value.lower() in filters[field]
+
+    def is_available(self, field, value):
+        """
+        Check whether an email or username is free to register.
+
+        Args:
+            field (str): 'email' or 'username'
+            value (str): Value to check
+
+        Returns:
+            bool: True if no user has this value
+        """
+        if not self.might_exist(field, value):
+            return True
+        return not get_user_model().objects.filter(**{field: value}).exists()
+
+
+user_identifier_index = UserIdentifierIndex()
@@ -0,0 +1,79 @@
+"""
+Cached doctor directory snapshots.
+
+The doctors page, the per-branch doctor lists and the patient view of
+/api/doctors/ serialize the same users, profiles, branches and schedules,
+and that data changes a few times a day. Each response body is rendered
+once to JSON bytes and stored in the shared 'directory' cache (Redis in
+production) under a fixed key per snapshot, together with the directory
+version it was built from. Snapshots have their own alias so they never
+compete with rate-limit counters for memory.
+
+A lookup fetches the snapshot and the current version in one get_many
+call (a single MGET on Redis). The snapshot is served only if its version
+is current. Saving or deleting a doctor's User, a DoctorProfile, a Branch
+or a DoctorSchedule bumps the version after commit (see accounts.signals),
+which invalidates every snapshot at once. Snapshots are rebuilt lazily on
+the next request.
+"""
+from decouple import config
+from django.core.cache import caches
+from django.http import HttpResponse
+from rest_framework.renderers import JSONRenderer
+import time
+
+DOCTOR_DIRECTORY_TTL = config('DOCTOR_DIRECTORY_TTL', default=86400, cast=int)
+
+VERSION_KEY = 'doctor_directory:version'
+
+
+def _cache():
+    return caches['directory']
+
+
+def _init_version():
+    # Seeded from the clock, so a version lost to eviction or a cache restart
+    # never comes back with a value that old snapshots still carry
+    cache = _cache()
+    cache.add(VERSION_KEY, time.time_ns(), timeout=None)
+    return cache.get(VERSION_KEY)
+
+
+def bump_directory_version():
+    """Invalidate every directory snapshot"""
+    try:
+        _cache().incr(VERSION_KEY)
+    except ValueError:
+        _init_version()
+
+
+def cached_directory_response(name, build):
+    """
+    Serve a directory snapshot, building it on a miss.
+
+    Args:
+        name (str): Snapshot name, e.g. 'users:doctors' or 'branch:3:doctors'
+        build (callable): Returns the data to serialize, or an HttpResponse
+            (e.g. a 404) that is returned as is and not cached
+
+    Returns:
+        HttpResponse: JSON body, identical to what DRF's JSONRenderer emits
+    """
+    cache = _cache()
+    key = f'doctor_directory:{name}'
+    values = cache.get_many([VERSION_KEY, key])
+    version = values.get(VERSION_KEY)
+    entry = values.get(key)
+    if version is None:
+        version = _init_version()
+    elif entry is not None and entry[0] == version:
+        return HttpResponse(entry[1], content_type='application/json')
+
+    data = build()
+    if isinstance(data, HttpResponse):
+        return data
+    body = JSONRenderer().render(data)
+    # Stored under the version read before building: a bump that lands while
+    # building leaves this entry already stale
+    cache.set(key, (version, body), timeout=DOCTOR_DIRECTORY_TTL)
+    return HttpResponse(body, content_type='application/json')
@@ -0,0 +1,27 @@
+"""
+Password hashers with costs taken from the environment.
+
+The algorithm names match Django's stock hashers, so existing hashes keep
+verifying. When a stored hash was made with a different cost, Django's
+must_update() reports it and check_password() rehashes the password on
+the next successful login. Changing the cost therefore takes effect
+gradually, with no migration. Use `manage.py benchmark_password_hashers`
+to pick costs for the target machine.
+"""
+from decouple import config
+from django.contrib.auth.hashers import Argon2PasswordHasher, PBKDF2PasswordHasher
+
+
+class TunablePBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    """PBKDF2-SHA256 with PASSWORD_PBKDF2_ITERATIONS iterations"""
+    iterations = config('PASSWORD_PBKDF2_ITERATIONS', default=PBKDF2PasswordHasher.iterations, cast=int)
+
+
+class TunableArgon2PasswordHasher(Argon2PasswordHasher):
+    """
+    Argon2id with PASSWORD_ARGON2_TIME_COST, PASSWORD_ARGON2_MEMORY_COST (KiB)
+    and PASSWORD_ARGON2_PARALLELISM. Needs argon2-cffi.
+    """
+    time_cost = config('PASSWORD_ARGON2_TIME_COST', default=Argon2PasswordHasher.time_cost, cast=int)
+    memory_cost = config('PASSWORD_ARGON2_MEMORY_COST', default=Argon2PasswordHasher.memory_cost, cast=int)
+    parallelism = config('PASSWORD_ARGON2_PARALLELISM', default=Argon2PasswordHasher.parallelism, cast=int)
@@ -0,0 +1,120 @@
+"""
+Measure password hashing cost on this machine.
+
+Usage:
+    python manage.py benchmark_password_hashers
+    python manage.py benchmark_password_hashers --pbkdf2-iterations 300000,600000,870000
+    python manage.py benchmark_password_hashers --argon2-time-cost 2,3 --argon2-memory-cost 19456,65536 --target-ms 150
+
+Each candidate is timed hashing and verifying a password. Verify time is
+what a login pays; with --threads worker threads, threads / verify time is
+roughly the logins per second one worker can absorb. --target-ms suggests
+the strongest candidate that fits: Argon2 (memory-hard) ranks above PBKDF2,
+Argon2 settings rank by time_cost * memory_cost, PBKDF2 by iterations. The costs found here
+go into PASSWORD_PBKDF2_ITERATIONS / PASSWORD_ARGON2_* (see accounts/hashers.py).
+"""
+import statistics
+import time
+from django.core.management.base import BaseCommand
+from accounts.hashers import TunableArgon2PasswordHasher, TunablePBKDF2PasswordHasher
+
+
+def _int_list(value):
+    return [int(part) for part in value.split(',') if part.strip()]
+
+
+def pbkdf2_strength(iterations):
+    """Sort key for a PBKDF2 setting; compare with argon2_strength"""
+    return (0, iterations, 0)
+
+
+def argon2_strength(time_cost, memory_cost):
+    """Sort key for an Argon2 setting: memory-hard, so above any PBKDF2 setting"""
+    return (1, time_cost * memory_cost, memory_cost)
+
+
+class Command(BaseCommand):
+    help = 'Benchmark password hasher costs and suggest settings for a latency target'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--samples', type=int, default=10,
+                            help='Timed hash/verify rounds per candidate (default: 10)')
+        parser.add_argument('--pbkdf2-iterations', type=_int_list,
+                            default=[TunablePBKDF2PasswordHasher.iterations],
+                            help='Comma-separated PBKDF2 iteration counts to try')
+        parser.add_argument('--argon2-time-cost', type=_int_list,
+                            default=[TunableArgon2PasswordHasher.time_cost],
+                            help='Comma-separated Argon2 time costs to try')
+        parser.add_argument('--argon2-memory-cost', type=_int_list,
+                            default=[TunableArgon2PasswordHasher.memory_cost],
+                            help='Comma-separated Argon2 memory costs (KiB) to try')
+        parser.add_argument('--threads', type=int, default=2,
+                            help='Worker threads per process, for the logins/sec estimate (default: 2)')
+        parser.add_argument('--target-ms', type=float, default=None,
+                            help='Suggest the strongest candidate whose p95 verify time fits this budget')
+    
+    def _candidates(self, options):
+        for iterations in options['pbkdf2_iterations']:
+            hasher = type('BenchPBKDF2', (TunablePBKDF2PasswordHasher,), {'iterations': iterations})()
+            yield (
+                f'pbkdf2 iterations={iterations}',
+                'PASSWORD_HASHER=pbkdf2 PASSWORD_PBKDF2_ITERATIONS=%d' % iterations,
+                pbkdf2_strength(iterations),
+                hasher,
+            )
+        
+        for time_cost in options['argon2_time_cost']:
+            for memory_cost in options['argon2_memory_cost']:
+                hasher = type('BenchArgon2', (TunableArgon2PasswordHasher,), {
+                    'time_cost': time_cost, 'memory_cost': memory_cost,
+                })()
+                yield (
+                    f'argon2 t={time_cost} m={memory_cost}KiB p={hasher.parallelism}',
+                    f'PASSWORD_HASHER=argon2 PASSWORD_ARGON2_TIME_COST={time_cost} '
+                    f'PASSWORD_ARGON2_MEMORY_COST={memory_cost}',
+                    argon2_strength(time_cost, memory_cost),
+                    hasher,
+                )
+    
+    def handle(self, *args, **options):
+        password = 'Benchmark-Password-123'
+        results = []
+        
+        self.stdout.write(f"{'candidate':<40} {'hash ms':>9} {'verify p50':>11} {'verify p95':>11} {'logins/s':>9}")
+        for label, env, strength, hasher in self._candidates(options):
+            try:
+                encoded = hasher.encode(password, hasher.salt())
+            except ValueError as e:
+                # Missing optional library (e.g. argon2-cffi)
+                self.stdout.write(self.style.WARNING(f'{label:<40} skipped: {e}'))
+                continue
+            
+            hash_times = []
+            verify_times = []
+            for _ in range(options['samples']):
+                start = time.perf_counter()
+                encoded = hasher.encode(password, hasher.salt())
+                hash_times.append((time.perf_counter() - start) * 1000)
+                
+                start = time.perf_counter()
+                hasher.verify(password, encoded)
+                verify_times.append((time.perf_counter() - start) * 1000)
+            
+            verify_times.sort()
+            p50 = statistics.median(verify_times)
+            p95 = verify_times[min(len(verify_times) - 1, int(len(verify_times) * 0.95))]
+            logins_per_second = options['threads'] * 1000 / p50
+            results.append((label, env, strength, p95))
+            self.stdout.write(
+                f'{label:<40} {statistics.mean(hash_times):>9.1f} {p50:>11.1f} {p95:>11.1f} {logins_per_second:>9.1f}'
+            )
+        
+        if options['target_ms'] is not None:
+            fitting = [result for result in results if result[3] <= options['target_ms']]
+            if fitting:
+                label, env, _, p95 = max(fitting, key=lambda result: result[2])
+                self.stdout.write(self.style.SUCCESS(
+                    f'Suggested for {options["target_ms"]:.0f} ms: {label} (p95 {p95:.1f} ms)\n  {env}'
+                ))
+            else:
+                self.stdout.write(self.style.WARNING(f'No candidate verifies within {options["target_ms"]:.0f} ms.'))
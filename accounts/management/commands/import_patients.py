@@ -0,0 +1,64 @@
+"""
+Bulk-import patients from a CSV file.
+
+Usage:
+    python manage.py import_patients patients.csv
+    python manage.py import_patients patients.csv --report results.csv --no-invites
+
+Columns match patient self-registration (email, username, first_name,
+last_name, phone_number, date_of_birth, consent_treatment, ...). The
+password column is optional; patients without one get an invite email
+with a link to set their password.
+"""
+import csv
+from django.core.management.base import BaseCommand, CommandError
+from accounts.onboarding import REPORT_FIELDS, PatientImporter
+
+
+class Command(BaseCommand):
+    help = 'Bulk-import patients from CSV in chunks, writing a per-row result report'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('csv_file', help='CSV file with a header row')
+        parser.add_argument('--report', help='Write the per-row report here instead of stdout')
+        parser.add_argument('--chunk-size', type=int, default=500,
+                            help='Rows inserted per bulk_create (default: 500)')
+        parser.add_argument('--hash-workers', type=int, default=None,
+                            help='Processes used to hash passwords (default: CPU count)')
+        parser.add_argument('--no-invites', action='store_true',
+                            help='Do not email set-password links to patients without a password')
+    
+    def handle(self, *args, **options):
+        importer = PatientImporter(
+            chunk_size=options['chunk_size'],
+            send_invites=not options['no_invites'],
+            hash_workers=options['hash_workers']
+        )
+        
+        try:
+            source = open(options['csv_file'], newline='', encoding='utf-8-sig')
+        except OSError as e:
+            raise CommandError(f'Cannot open {options["csv_file"]}: {e}')
+        
+        report_file = open(options['report'], 'w', newline='') if options['report'] else None
+        writer = csv.DictWriter(report_file or self.stdout, fieldnames=REPORT_FIELDS)
+        writer.writeheader()
+        
+        created = failed = 0
+        try:
+            with source:
+                for result in importer.run(csv.DictReader(source)):
+                    writer.writerow(result)
+                    if result['status'] == 'created':
+                        created += 1
+                    else:
+                        failed += 1
+        finally:
+            if report_file:
+                report_file.close()
+        
+        summary = f'{created} patient(s) created, {failed} row(s) failed.'
+        if failed:
+            self.stderr.write(self.style.WARNING(summary))
+        else:
+            self.stderr.write(self.style.SUCCESS(summary))
@@ -0,0 +1,52 @@
+"""
+Delete old StaffAuthorizationAttempt and RegistrationAttempt rows.
+
+Usage:
+    python manage.py prune_security_events
+    python manage.py prune_security_events --days 30 --batch-size 2000
+
+Rows are deleted oldest first in primary-key chunks, each in its own short
+transaction, so a large backlog never holds long locks.
+"""
+from datetime import timedelta
+from decouple import config
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from accounts.models import RegistrationAttempt, StaffAuthorizationAttempt
+
+SECURITY_EVENT_RETENTION_DAYS = config('SECURITY_EVENT_RETENTION_DAYS', default=90, cast=int)
+
+
+class Command(BaseCommand):
+    help = 'Delete security events older than the retention period, in chunks'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=SECURITY_EVENT_RETENTION_DAYS,
+                            help=f'Keep this many days of events (default: {SECURITY_EVENT_RETENTION_DAYS})')
+        parser.add_argument('--batch-size', type=int, default=5000,
+                            help='Rows deleted per chunk (default: 5000)')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only count the rows that would be deleted')
+    
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        
+        for model in (StaffAuthorizationAttempt, RegistrationAttempt):
+            name = model._meta.verbose_name_plural
+            old_rows = model.objects.filter(created_at__lt=cutoff)
+            
+            if options['dry_run']:
+                self.stdout.write(f'{old_rows.count()} {name} older than {cutoff.date()} would be deleted.')
+                continue
+            
+            total = 0
+            while True:
+                # Ids grow with created_at, so old rows sit at the start of the
+                # primary key index and the scan stops after one chunk
+                ids = list(old_rows.order_by('id').values_list('id', flat=True)[:options['batch_size']])
+                if not ids:
+                    break
+                deleted, _ = model.objects.filter(id__in=ids).delete()
+                total += deleted
+            
+            self.stdout.write(self.style.SUCCESS(f'Deleted {total} {name} older than {cutoff.date()}.'))
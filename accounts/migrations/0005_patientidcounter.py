@@ -0,0 +1,48 @@
+# Generated by Django 4.2.7 on 2026-10-19 19:28
+
+from datetime import datetime
+from django.db import migrations, models
+
+
+def seed_counters(apps, schema_editor):
+    """Start each day's counter after the highest PAT-YYYYMMDD-NNNN already issued"""
+    PatientProfile = apps.get_model('accounts', 'PatientProfile')
+    PatientIdCounter = apps.get_model('accounts', 'PatientIdCounter')
+    
+    last_values = {}
+    for patient_id in PatientProfile.objects.filter(patient_id__startswith='PAT-').values_list('patient_id', flat=True).iterator():
+        try:
+            _, date_part, number = patient_id.split('-')
+            day = datetime.strptime(date_part, '%Y%m%d').date()
+            number = int(number)
+        except ValueError:
+            continue
+        last_values[day] = max(last_values.get(day, 0), number)
+    
+    PatientIdCounter.objects.bulk_create(
+        [PatientIdCounter(day=day, last_value=value) for day, value in last_values.items()],
+        batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0004_alter_user_managers_remove_user_is_staff_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PatientIdCounter',
+            fields=[
+                ('day', models.DateField(primary_key=True, serialize=False)),
+                ('last_value', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Patient ID Counter',
+                'verbose_name_plural': 'Patient ID Counters',
+                'db_table': 'patient_id_counters',
+            },
+        ),
+        migrations.RunPython(seed_counters, migrations.RunPython.noop),
+    ]
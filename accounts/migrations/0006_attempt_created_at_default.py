@@ -0,0 +1,24 @@
+# Generated by Django 4.2.7 on 2026-10-19 19:34
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0005_patientidcounter'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='registrationattempt',
+            name='created_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+        migrations.AlterField(
+            model_name='staffauthorizationattempt',
+            name='created_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 4.2.7 on 2026-10-19 19:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0007_revokedtoken'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='doctorprofile',
+            name='next_free_slot',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='doctorprofile',
+            index=models.Index(fields=['specialization', 'branch', 'consultation_fee'], name='doctor_prof_special_fbc130_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='doctorprofile',
+            index=models.Index(fields=['branch', 'consultation_fee'], name='doctor_prof_branch__360470_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='doctorprofile',
+            index=models.Index(fields=['specialization', 'next_free_slot'], name='doctor_prof_special_4d4c5f_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='doctorprofile',
+            index=models.Index(fields=['next_free_slot'], name='doctor_prof_next_fr_3c9d2d_idx'),
+        ),
+    ]
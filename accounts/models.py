@@ -4,6 +4,7 @@ Custom User model with roles (Patient, Doctor, Admin)
 from django.contrib.auth.models import AbstractUser, BaseUserManager
 from django.db import models
 from django.core.validators import MinValueValidator, MaxValueValidator
+from django.utils import timezone
 
 
 class UserManager(BaseUserManager):
@@ -126,6 +127,8 @@ class DoctorProfile(models.Model):
     years_of_experience = models.IntegerField(default=0)
     consultation_fee = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
     is_available = models.BooleanField(default=True)
+    # Earliest unbooked slot, kept current by appointments.availability.refresh_next_free_slots
+    next_free_slot = models.DateTimeField(blank=True, null=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
@@ -133,6 +136,13 @@ class DoctorProfile(models.Model):
         db_table = 'doctor_profiles'
         verbose_name = 'Doctor Profile'
         verbose_name_plural = 'Doctor Profiles'
+        indexes = [
+            # Doctor search: equality filters first, then the range/sort column
+            models.Index(fields=['specialization', 'branch', 'consultation_fee']),
+            models.Index(fields=['branch', 'consultation_fee']),
+            models.Index(fields=['specialization', 'next_free_slot']),
+            models.Index(fields=['next_free_slot']),
+        ]
     
     def __str__(self):
         branch_name = self.branch.name if self.branch else "No Branch"
@@ -205,29 +215,32 @@ class PatientProfile(models.Model):
     def save(self, *args, **kwargs):
         """Auto-generate patient ID if not provided"""
         if not self.patient_id:
-            # Generate patient ID: PAT-YYYYMMDD-XXXX
-            from datetime import datetime
-            prefix = "PAT"
-            date_part = datetime.now().strftime("%Y%m%d")
-            # Get last patient ID for today
-            last_patient = PatientProfile.objects.filter(
-                patient_id__startswith=f"{prefix}-{date_part}"
-            ).order_by('-patient_id').first()
-            
-            if last_patient and last_patient.patient_id:
-                try:
-                    last_num = int(last_patient.patient_id.split('-')[-1])
-                    new_num = last_num + 1
-                except (ValueError, IndexError):
-                    new_num = 1
-            else:
-                new_num = 1
-            
-            self.patient_id = f"{prefix}-{date_part}-{new_num:04d}"
+            # PAT-YYYYMMDD-NNNN, from the per-day counter (widens past 9999)
+            from .patient_ids import next_patient_id
+            self.patient_id = next_patient_id()
         
         super().save(*args, **kwargs)
 
 
+class PatientIdCounter(models.Model):
+    """
+    Per-day counter behind PatientProfile.patient_id.
+    
+    Incremented with a single atomic upsert, so concurrent registrations
+    never read the same number and never retry on the unique constraint.
+    """
+    day = models.DateField(primary_key=True)
+    last_value = models.BigIntegerField(default=0)
+    
+    class Meta:
+        db_table = 'patient_id_counters'
+        verbose_name = 'Patient ID Counter'
+        verbose_name_plural = 'Patient ID Counters'
+    
+    def __str__(self):
+        return f"{self.day}: {self.last_value}"
+
+
 class StaffProfile(models.Model):
     """
     Extended profile for staff members (doctors, nurses, admin, etc.)
@@ -267,7 +280,7 @@ class StaffAuthorizationAttempt(models.Model):
     success = models.BooleanField(default=False)
     attempt_count = models.IntegerField(default=1)
     locked_until = models.DateTimeField(blank=True, null=True)
-    created_at = models.DateTimeField(auto_now_add=True)
+    created_at = models.DateTimeField(default=timezone.now, editable=False)  # Set at record time, not at the batched insert
     
     class Meta:
         db_table = 'staff_authorization_attempts'
@@ -290,7 +303,7 @@ class RegistrationAttempt(models.Model):
     email = models.EmailField(blank=True, null=True)
     success = models.BooleanField(default=False)
     error_message = models.TextField(blank=True, null=True)
-    created_at = models.DateTimeField(auto_now_add=True)
+    created_at = models.DateTimeField(default=timezone.now, editable=False)  # Set at record time, not at the batched insert
     
     class Meta:
         db_table = 'registration_attempts'
@@ -305,3 +318,22 @@ class RegistrationAttempt(models.Model):
         return f"{self.ip_address} - {self.user_type} - {'Success' if self.success else 'Failed'}"
 
 
+
+
+class RevokedToken(models.Model):
+    """
+    Refresh tokens revoked by rotation, keyed by their jti claim.
+    
+    Rows are only needed until the token would have expired anyway and are
+    pruned automatically after that (see accounts.revocation).
+    """
+    jti = models.CharField(max_length=255, primary_key=True)
+    expires_at = models.DateTimeField(db_index=True)
+    
+    class Meta:
+        db_table = 'revoked_tokens'
+        verbose_name = 'Revoked Token'
+        verbose_name_plural = 'Revoked Tokens'
+    
+    def __str__(self):
+        return f"{self.jti} (until {self.expires_at})"
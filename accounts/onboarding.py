@@ -0,0 +1,264 @@
+"""
+Bulk patient onboarding from CSV.
+
+Used by the import_patients management command and the "Import CSV" page in
+the PatientProfile admin. Compared with registering patients one at a time
+through PatientRegistrationSerializer:
+
+- email/username uniqueness is checked against sets loaded by one query,
+  not two queries per row
+- passwords are hashed in a process pool; rows without a password get an
+  unusable password and a queued invite email with a set-password link
+- users and profiles are inserted with bulk_create in chunks, and each
+  chunk's patient IDs come from one counter write
+- a result is yielded for every row as soon as its chunk is done, so
+  callers can stream the report
+"""
+from concurrent.futures import ProcessPoolExecutor
+from decouple import config
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.tokens import default_token_generator
+from django.core.mail import EmailMessage
+from django.db import IntegrityError, transaction
+from django.utils.encoding import force_bytes
+from django.utils.http import urlsafe_base64_encode
+from rest_framework import serializers
+from .availability import user_identifier_index
+from .models import PatientProfile
+from .patient_ids import allocate_patient_ids
+from .serializers import PatientRegistrationSerializer
+from .tasks import queue_messages
+import django
+import logging
+
+logger = logging.getLogger(__name__)
+User = get_user_model()
+
+# Link in invite emails; uid/token are accepted by /api/auth/users/reset_password_confirm/
+PATIENT_INVITE_URL = config(
+    'PATIENT_INVITE_URL',
+    default='http://localhost:8000/password/reset/confirm/{uid}/{token}'
+)
+
+REPORT_FIELDS = ['line', 'email', 'status', 'patient_id', 'errors']
+
+PROFILE_FIELDS = (
+    'date_of_birth', 'gender', 'emergency_contact_name', 'emergency_contact_phone',
+    'medical_conditions', 'allergies', 'current_medications', 'dental_history',
+    'insurance_provider', 'insurance_number', 'consent_treatment', 'consent_data_sharing',
+)
+
+
+class PatientImportRowSerializer(PatientRegistrationSerializer):
+    """
+    Validate one CSV row.
+
+    Same field rules as self-registration, except the password is optional
+    (no confirmation column) and uniqueness is checked by the importer.
+    """
+    password = serializers.CharField(required=False, allow_blank=True, write_only=True)
+    password2 = None
+
+    def validate_email(self, value):
+        return value
+
+    def validate_username(self, value):
+        return value
+
+    def validate_password(self, value):
+        if not value:
+            return value
+        return super().validate_password(value)
+
+    def validate(self, attrs):
+        if not attrs.get('consent_treatment', False):
+            raise serializers.ValidationError({
+                'consent_treatment': "You must consent to treatment to proceed."
+            })
+        return attrs
+
+
+def _format_errors(errors):
+    """Flatten serializer errors into 'field: message; ...'"""
+    parts = []
+    for field, messages in errors.items():
+        message = messages[0] if isinstance(messages, list) and messages else messages
+        parts.append(f"{field}: {message}")
+    return '; '.join(parts)
+
+
+class PatientImporter:
+    """
+    Import patients from parsed CSV rows.
+
+    Args:
+        chunk_size (int): Rows validated, hashed and inserted together
+        send_invites (bool): Email a set-password link to rows without a password
+        hash_workers (int): Processes used for password hashing (None = CPU count)
+    """
+
+    def __init__(self, chunk_size=500, send_invites=True, hash_workers=None):
+        self.chunk_size = chunk_size
+        self.send_invites = send_invites
+        self.hash_workers = hash_workers
+        self._pool = None
+
+    def run(self, rows):
+        """
+        Import rows and yield one result dict per row (see REPORT_FIELDS).
+
+        Args:
+            rows (iterable): Dicts keyed by CSV header, e.g. from csv.DictReader
+        """
+        # One query for everything already taken; rows claim values as they go
+        self.taken_emails = set()
+        self.taken_usernames = set()
+        for email, username in User.objects.values_list('email', 'username').iterator():
+            self.taken_emails.add(email.lower())
+            self.taken_usernames.add(username.lower())
+
+        try:
+            chunk = []
+            # Line 1 is the header
+            for line, row in enumerate(rows, start=2):
+                chunk.append((line, row))
+                if len(chunk) >= self.chunk_size:
+                    yield from self._import_chunk(chunk)
+                    chunk = []
+            if chunk:
+                yield from self._import_chunk(chunk)
+        finally:
+            if self._pool:
+                self._pool.shutdown()
+                self._pool = None
+
+    def _hash_passwords(self, passwords):
+        """Hash passwords in the process pool; blanks become unusable passwords"""
+        to_hash = [password for password in passwords if password]
+        if len(to_hash) > 1:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.hash_workers, initializer=django.setup)
+            hashed = iter(self._pool.map(make_password, to_hash, chunksize=max(1, len(to_hash) // 32)))
+        else:
+            hashed = iter([make_password(password) for password in to_hash])
+        return [next(hashed) if password else make_password(None) for password in passwords]
+
+    def _validate(self, row):
+        """Return (validated_data, None) or (None, error message)"""
+        # Blank cells count as missing, so optional columns can be left empty
+        data = {key.strip(): value.strip() for key, value in row.items() if key and value and value.strip()}
+        serializer = PatientImportRowSerializer(data=data)
+        if not serializer.is_valid():
+            return None, _format_errors(serializer.errors)
+
+        email = serializer.validated_data['email'].lower()
+        username = serializer.validated_data['username'].lower()
+        if email in self.taken_emails:
+            return None, 'email: This email is already registered.'
+        if username in self.taken_usernames:
+            return None, 'username: This username is already taken.'
+        self.taken_emails.add(email)
+        self.taken_usernames.add(username)
+        return serializer.validated_data, None
+
+    def _import_chunk(self, chunk):
+        results = {}
+        valid = []
+        for line, row in chunk:
+            data, error = self._validate(row)
+            if error:
+                results[line] = {'line': line, 'email': (row.get('email') or '').strip(),
+                                 'status': 'error', 'patient_id': '', 'errors': error}
+            else:
+                valid.append((line, data))
+
+        if valid:
+            hashes = self._hash_passwords([data.get('password') for _, data in valid])
+            users = []
+            profiles = []
+            for (line, data), password_hash in zip(valid, hashes):
+                users.append(User(
+                    email=User.objects.normalize_email(data['email']),
+                    username=data['username'],
+                    first_name=data['first_name'],
+                    last_name=data['last_name'],
+                    phone_number=data['phone_number'],
+                    date_of_birth=data['date_of_birth'],
+                    user_type='PATIENT',
+                    password=password_hash,
+                ))
+                profiles.append(PatientProfile(**{field: data.get(field) for field in PROFILE_FIELDS}))
+
+            try:
+                with transaction.atomic():
+                    created = self._insert(users, profiles)
+            except IntegrityError:
+                # Someone registered one of these addresses since the prefetch;
+                # retry row by row so only the conflicting rows fail
+                created = self._insert_one_by_one(users, profiles)
+
+            invites = []
+            for (line, data), user, profile in zip(valid, users, profiles):
+                if id(user) in created:
+                    results[line] = {'line': line, 'email': user.email, 'status': 'created',
+                                     'patient_id': profile.patient_id, 'errors': ''}
+                    if not data.get('password'):
+                        invites.append(user)
+                else:
+                    results[line] = {'line': line, 'email': user.email, 'status': 'error',
+                                     'patient_id': '', 'errors': 'email or username already registered.'}
+
+            if invites and self.send_invites:
+                self._send_invites(invites)
+
+        for line, _ in chunk:
+            yield results[line]
+
+    def _insert(self, users, profiles):
+        """bulk_create users, then their profiles with pre-allocated patient IDs"""
+        User.objects.bulk_create(users)
+        # bulk_create sends no post_save, so update the availability filter here
+        for user in users:
+            user_identifier_index.add(user.email, user.username)
+        for user, profile, patient_id in zip(users, profiles, allocate_patient_ids(len(users))):
+            profile.user = user
+            profile.patient_id = patient_id
+        PatientProfile.objects.bulk_create(profiles)
+        return {id(user) for user in users}
+
+    def _insert_one_by_one(self, users, profiles):
+        created = set()
+        for user, profile in zip(users, profiles):
+            user.pk = None
+            try:
+                with transaction.atomic():
+                    created |= self._insert([user], [profile])
+            except IntegrityError:
+                logger.warning(f"Skipped patient import for {user.email}: already registered")
+        return created
+
+    def _send_invites(self, users):
+        """Queue set-password emails for the job worker"""
+        messages = []
+        for user in users:
+            link = PATIENT_INVITE_URL.format(
+                uid=urlsafe_base64_encode(force_bytes(user.pk)),
+                token=default_token_generator.make_token(user)
+            )
+            messages.append(EmailMessage(
+                subject='Welcome to Apex Dental Care - Set Your Password',
+                body=f'''
+Dear {user.get_full_name() or user.email},
+
+Your patient account at Apex Dental Care has been created.
+
+Set your password to log in:
+{link}
+
+Best regards,
+Apex Dental Care
+                ''',
+                to=[user.email],
+            ))
+        queue_messages(messages)
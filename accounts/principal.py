@@ -0,0 +1,197 @@
+"""
+Per-process cache of authenticated users (principals) for JWT requests.
+
+CachedJWTAuthentication resolves the token's user id here first. An entry
+holds the pickled User, loaded with its doctor/patient/staff profiles via
+select_related, plus a `principal` bundle with the role and profile ids.
+Role checks and profile lookups in views therefore cost no queries on a hit.
+
+Each entry carries the user's generation, a counter kept in the shared
+'principal' cache (Redis in production). A lookup reads the current
+generation (one cache GET) and serves the entry only if it matches. Saving
+a user or one of its profiles increments the generation once the change is
+committed, so every worker drops its copy on its next lookup, and a load
+that read the old rows is stored under the old generation and never served.
+Entries also expire after PRINCIPAL_CACHE_TTL (default 60 seconds).
+"""
+from collections import OrderedDict
+from decouple import config
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.db import transaction
+import pickle
+import threading
+import time
+
+PRINCIPAL_CACHE_SIZE = config('PRINCIPAL_CACHE_SIZE', default=2048, cast=int)
+PRINCIPAL_CACHE_TTL = config('PRINCIPAL_CACHE_TTL', default=60, cast=int)
+# A generation that expires is re-seeded with a new value, which only costs a miss
+PRINCIPAL_GENERATION_TTL = 86400
+
+
+def build_principal(user):
+    """Role and profile-id bundle for a user loaded with its profiles"""
+    doctor_profile = getattr(user, 'doctor_profile', None) if user.is_staff() else None
+    patient_profile = getattr(user, 'patient_profile', None) if user.is_patient() else None
+    staff_profile = getattr(user, 'staff_profile', None) if user.is_staff() else None
+    return {
+        'user_id': user.pk,
+        'user_type': user.user_type,
+        'is_superuser': user.is_superuser,
+        'is_doctor': doctor_profile is not None,
+        'doctor_profile_id': doctor_profile.pk if doctor_profile else None,
+        'branch_id': doctor_profile.branch_id if doctor_profile else None,
+        'patient_profile_id': patient_profile.pk if patient_profile else None,
+        'patient_id': patient_profile.patient_id if patient_profile else None,
+        'staff_profile_id': staff_profile.pk if staff_profile else None,
+    }
+
+
+class PrincipalCache:
+    """
+    Bounded LRU of authenticated users with a TTL per entry.
+
+    Besides the user, an entry can carry named payloads (e.g. the serialized
+    /api/users/me/ response) that are dropped together with it.
+    """
+
+    def __init__(self, max_entries, ttl, cache_alias='principal'):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.cache_alias = cache_alias
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _generation_key(self, user_id):
+        return f'principal:generation:{user_id}'
+
+    def _seed_generation(self, key):
+        # Seeded from the clock, so a generation lost to eviction or a cache
+        # restart never comes back with a value that old entries still carry
+        cache = caches[self.cache_alias]
+        cache.add(key, time.time_ns(), timeout=PRINCIPAL_GENERATION_TTL)
+        return cache.get(key)
+
+    def generation(self, user_id):
+        """Current generation of the user, shared by every process"""
+        key = self._generation_key(user_id)
+        generation = caches[self.cache_alias].get(key)
+        if generation is None:
+            generation = self._seed_generation(key)
+        return generation
+
+    def _fresh_entry(self, user_id, generation):
+        entry = self._entries.get(user_id)
+        if entry is None:
+            return None
+        stored_generation, stored_at, _, _ = entry
+        if stored_generation != generation or time.monotonic() - stored_at >= self.ttl:
+            del self._entries[user_id]
+            return None
+        return entry
+
+    def get(self, user_id, generation):
+        """Return a private copy of the user cached under generation, or None"""
+        with self._lock:
+            entry = self._fresh_entry(user_id, generation)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            user_bytes = entry[2]
+        # Each request gets its own instance, so views can't mutate the cached one
+        return pickle.loads(user_bytes)
+
+    def set(self, user_id, user, generation):
+        """Store a user loaded while the given generation was current"""
+        user_bytes = pickle.dumps(user, pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            self._entries[user_id] = (generation, time.monotonic(), user_bytes, {})
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def get_payload(self, user_id, name, generation):
+        with self._lock:
+            entry = self._fresh_entry(user_id, generation)
+            return entry[3].get(name) if entry else None
+
+    def set_payload(self, user_id, name, data, generation):
+        """Attach data to the user's entry, if it is still current"""
+        with self._lock:
+            entry = self._fresh_entry(user_id, generation)
+            if entry:
+                entry[3][name] = data
+
+    def invalidate(self, user_id):
+        """Bump the shared generation, which invalidates the user in every process"""
+        key = self._generation_key(user_id)
+        try:
+            caches[self.cache_alias].incr(key)
+        except ValueError:
+            self._seed_generation(key)
+        with self._lock:
+            if self._entries.pop(user_id, None) is not None:
+                self.invalidations += 1
+
+    def stats(self):
+        """Counters and current size"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else None,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+            }
+
+
+principal_cache = PrincipalCache(PRINCIPAL_CACHE_SIZE, PRINCIPAL_CACHE_TTL)
+
+
+def load_principal(user_id):
+    """
+    Return the user for user_id with profiles and `principal` attached.
+
+    Args:
+        user_id: Primary key from the token
+
+    Returns:
+        User: Cached copy or freshly loaded instance
+
+    Raises:
+        User.DoesNotExist: If there is no such user
+    """
+    generation = principal_cache.generation(user_id)
+    user = principal_cache.get(user_id, generation)
+    if user is not None:
+        return user
+
+    user = get_user_model().objects.select_related(
+        'doctor_profile', 'patient_profile', 'staff_profile'
+    ).get(pk=user_id)
+    user.principal = build_principal(user)
+    user.principal['generation'] = generation
+    principal_cache.set(user_id, user, generation)
+    return user
+
+
+def invalidate_principal(user_id):
+    """
+    Forget the cached principal for a user (call on user/profile changes).
+
+    Runs once the current transaction commits: a load that reads the rows
+    before then is stored under the old generation and never served.
+    """
+    if user_id is not None:
+        transaction.on_commit(lambda: principal_cache.invalidate(user_id))
@@ -0,0 +1,204 @@
+"""
+Sliding-window rate limiting on the shared 'ratelimit' cache.
+
+Each key gets one counter per fixed window, bumped with cache.incr (atomic
+INCR on Redis). The sliding estimate weights the previous window by how
+much of it still overlaps the last `window` seconds:
+
+    estimate = previous * (1 - elapsed / window) + current
+
+A request reserves its slot first (increment, then decide on the value the
+increment returned), so concurrent requests can't all pass one check
+before any of them is counted. Requests that turn out not to count, e.g.
+successful logins on a failures-only limit, give their slot back. That
+costs one increment and one cache read per request, with no database
+access. Set REDIS_URL so every worker shares the
+counters; without it the cache is per-process (fine for local development).
+"""
+from functools import wraps
+from decouple import config
+from django.core.cache import caches
+from django.http import JsonResponse
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.exceptions import InvalidToken
+from .authentication import CachedJWTAuthentication
+import math
+import time
+
+# Anonymous patient registrations per IP per hour (form and API share the
+# budget); signed-in staff registering patients at the front desk are exempt
+REGISTRATION_RATE_LIMIT = config('REGISTRATION_RATE_LIMIT', default=10, cast=int)
+# Failed JWT logins per IP per 5 minutes
+LOGIN_FAILURE_LIMIT = config('LOGIN_FAILURE_LIMIT', default=10, cast=int)
+# Live email/username availability checks per IP per minute
+AVAILABILITY_CHECK_RATE_LIMIT = config('AVAILABILITY_CHECK_RATE_LIMIT', default=30, cast=int)
+
+# Reverse proxies in front of the app that append to X-Forwarded-For (1 on
+# Railway). Set 0 when clients connect directly.
+TRUSTED_PROXY_COUNT = config('TRUSTED_PROXY_COUNT', default=1, cast=int)
+
+
+def get_client_ip(request):
+    """
+    Client IP as recorded by the outermost trusted proxy.
+
+    Each proxy appends the address it received the request from, so only the
+    last TRUSTED_PROXY_COUNT X-Forwarded-For hops can be trusted; earlier
+    hops are whatever the client sent. Falls back to REMOTE_ADDR.
+    """
+    if TRUSTED_PROXY_COUNT:
+        hops = [hop.strip() for hop in request.META.get('HTTP_X_FORWARDED_FOR', '').split(',') if hop.strip()]
+        if len(hops) >= TRUSTED_PROXY_COUNT:
+            return hops[-TRUSTED_PROXY_COUNT]
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def is_staff_request(request):
+    """
+    True for requests from a signed-in, active staff user.
+
+    Checks the session user first, then a Bearer token (through the
+    principal cache, so no query on a hit). A bad token just means the
+    request is not exempt; the view's own authentication still applies.
+    """
+    user = getattr(request, 'user', None)
+    if user is None or not user.is_authenticated:
+        try:
+            result = CachedJWTAuthentication().authenticate(request)
+        except (AuthenticationFailed, InvalidToken):
+            return False
+        user = result[0] if result else None
+    return bool(user and user.is_authenticated and user.is_staff())
+
+
+class SlidingWindowLimiter:
+    """
+    Allow at most `limit` counted events per key in any `window` seconds.
+
+    Args:
+        scope (str): Namespace for the cache keys, e.g. 'staff_auth'
+        limit (int): Events allowed per window
+        window (int): Window length in seconds
+    """
+
+    def __init__(self, scope, limit, window):
+        self.scope = scope
+        self.limit = limit
+        self.window = window
+
+    @property
+    def cache(self):
+        return caches['ratelimit']
+
+    def _keys(self, key, now):
+        index = int(now // self.window)
+        return (
+            f'rl:{self.scope}:{key}:{index}',
+            f'rl:{self.scope}:{key}:{index - 1}',
+            now - index * self.window,
+        )
+
+    def count(self, key):
+        """Sliding-window estimate of events for key (rounded down)"""
+        current_key, previous_key, elapsed = self._keys(key, time.time())
+        values = self.cache.get_many([current_key, previous_key])
+        previous_weight = 1 - elapsed / self.window
+        return int(values.get(previous_key, 0) * previous_weight + values.get(current_key, 0))
+
+    def reserve(self, key):
+        """
+        Count one event for key before acting on it.
+
+        Returns:
+            tuple: (allowed, estimate, reservation). allowed is False once the
+                estimate including this event is over the limit; pass
+                reservation to refund() if the event should not count.
+        """
+        current_key, previous_key, elapsed = self._keys(key, time.time())
+        self.cache.add(current_key, 0, timeout=self.window * 2)
+        try:
+            current = self.cache.incr(current_key)
+        except ValueError:
+            # Expired between add() and incr()
+            self.cache.set(current_key, 1, timeout=self.window * 2)
+            current = 1
+        previous = self.cache.get(previous_key, 0)
+        estimate = int(previous * (1 - elapsed / self.window) + current)
+        return estimate <= self.limit, estimate, current_key
+
+    def refund(self, reservation):
+        """Give back a slot taken by reserve()"""
+        try:
+            self.cache.decr(reservation)
+        except ValueError:
+            # The window's counter already expired
+            pass
+
+    def retry_after(self, key):
+        """Seconds until the estimate drops below the limit, assuming no new events"""
+        current_key, previous_key, elapsed = self._keys(key, time.time())
+        values = self.cache.get_many([current_key, previous_key])
+        current = values.get(current_key, 0)
+        previous = values.get(previous_key, 0)
+
+        if current >= self.limit:
+            # Wait out this window, then for the current count to decay in the next
+            wait = (self.window - elapsed) + self.window * (1 - (self.limit - 1) / current)
+        elif previous:
+            wait = self.window * (1 - (self.limit - 1 - current) / previous) - elapsed
+        else:
+            wait = 0
+        return max(1, math.ceil(wait))
+
+    def reset(self, key):
+        current_key, previous_key, _ = self._keys(key, time.time())
+        self.cache.delete_many([current_key, previous_key])
+
+
+def rate_limit(scope, limit, window, key=get_client_ip, counts=None, exempt=None):
+    """
+    Decorator returning 429 once a client exceeds the limit.
+
+    Works on plain Django views and DRF views (outermost decorator).
+
+    Args:
+        scope (str): Namespace for the counters
+        limit (int): Requests allowed per window
+        window (int): Window length in seconds
+        key (callable): Maps the request to the client key (default: client IP)
+        counts (callable): Maps the response to whether the request counts
+            against the limit, e.g. only failed logins (default: every request)
+        exempt (callable): Maps the request to True to skip the limit, e.g.
+            is_staff_request (default: no exemptions)
+    """
+    limiter = SlidingWindowLimiter(scope, limit, window)
+
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapped(request, *args, **kwargs):
+            if exempt is not None and exempt(request):
+                return view_func(request, *args, **kwargs)
+            client_key = key(request)
+            allowed, _, reservation = limiter.reserve(client_key)
+            if not allowed:
+                # Rejected requests don't extend the lockout
+                limiter.refund(reservation)
+                response = JsonResponse({
+                    'success': False,
+                    'error': 'Too many requests. Please try again later.'
+                }, status=429)
+                response['Retry-After'] = str(limiter.retry_after(client_key))
+                return response
+
+            try:
+                response = view_func(request, *args, **kwargs)
+            except Exception:
+                limiter.refund(reservation)
+                raise
+            if counts is not None and not counts(response):
+                limiter.refund(reservation)
+            return response
+
+        wrapped.limiter = limiter
+        return wrapped
+    return decorator
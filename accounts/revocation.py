@@ -0,0 +1,169 @@
+"""
+Revocation store for rotated refresh tokens.
+
+With ROTATE_REFRESH_TOKENS and BLACKLIST_AFTER_ROTATION, every refresh
+revokes the token it was given. Revoked jtis are written to the compact
+RevokedToken table (jti primary key + expires_at) and mirrored in:
+
+- a per-process Bloom filter: a miss means "not revoked by this process
+  or before the last rebuild", with no I/O
+- the shared 'ratelimit' cache (Redis in production) with a TTL of the
+  token's remaining lifetime, so revocations made by other workers are
+  seen without a database read
+
+Only a Bloom hit falls through to the table, which is the authority. The
+insert itself is the final guard: the jti is the primary key, so two
+concurrent refreshes with the same token cannot both succeed.
+
+The filter is built from unexpired rows on a background thread, and rebuilt
+every REVOKED_TOKEN_REBUILD_SECONDS (which also drops expired jtis from it);
+until the first build finishes every check reads the table. Expired rows
+are pruned in small chunks at most every REVOKED_TOKEN_PRUNE_SECONDS.
+"""
+from datetime import datetime, timezone as dt_timezone
+from decouple import config
+from django.core.cache import caches
+from django.db import IntegrityError, connection, transaction
+from django.utils import timezone
+from .availability import BloomFilter
+from .models import RevokedToken
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+REVOKED_TOKEN_CAPACITY = config('REVOKED_TOKEN_CAPACITY', default=100000, cast=int)
+REVOKED_TOKEN_REBUILD_SECONDS = config('REVOKED_TOKEN_REBUILD_SECONDS', default=600, cast=int)
+REVOKED_TOKEN_PRUNE_SECONDS = config('REVOKED_TOKEN_PRUNE_SECONDS', default=3600, cast=int)
+REVOKED_TOKEN_PRUNE_BATCH = 5000
+
+
+class RevocationStore:
+    """Bloom filter + shared cache in front of the RevokedToken table"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._filter = None
+        self._built_at = 0
+        self._build_thread = None
+        # jtis revoked here while a build runs; added to the new filter
+        self._revoked_during_build = []
+        self._pruned_at = time.monotonic()
+
+    def _cache_key(self, jti):
+        return f'revoked:{jti}'
+
+    def _build(self):
+        live = RevokedToken.objects.filter(expires_at__gt=timezone.now())
+        bloom = BloomFilter(max(REVOKED_TOKEN_CAPACITY, live.count() * 2), 0.001)
+        for jti in live.values_list('jti', flat=True).iterator(chunk_size=5000):
+            bloom.add(jti)
+        return bloom
+
+    def _rebuild(self):
+        try:
+            bloom = self._build()
+        except Exception as e:
+            logger.error(f"Building the revoked token filter failed: {e}")
+            with self._lock:
+                self._revoked_during_build.clear()
+            return
+        finally:
+            connection.close()
+        with self._lock:
+            for jti in self._revoked_during_build:
+                bloom.add(jti)
+            self._revoked_during_build.clear()
+            self._filter = bloom
+            self._built_at = time.monotonic()
+
+    def _get_filter(self):
+        """Current filter (None before the first build); starts a rebuild when due"""
+        with self._lock:
+            due = self._filter is None or time.monotonic() - self._built_at > REVOKED_TOKEN_REBUILD_SECONDS
+            if due and (self._build_thread is None or not self._build_thread.is_alive()):
+                self._build_thread = threading.Thread(
+                    target=self._rebuild,
+                    name='revoked-token-filter',
+                    daemon=True
+                )
+                self._build_thread.start()
+            return self._filter
+
+    def is_revoked(self, jti):
+        """
+        Check whether a jti has been revoked.
+
+        Until the first filter build finishes, every check goes to the
+        table.
+
+        Returns:
+            bool: True if the token must be rejected
+        """
+        bloom = self._get_filter()
+        if bloom is None or jti in bloom:
+            return RevokedToken.objects.filter(jti=jti, expires_at__gt=timezone.now()).exists()
+        return bool(caches['ratelimit'].get(self._cache_key(jti)))
+
+    def revoke(self, jti, exp):
+        """
+        Revoke a jti until its expiry.
+
+        Args:
+            jti (str): Token id
+            exp (int): The token's exp claim (Unix timestamp)
+
+        Returns:
+            bool: False if the jti was already revoked (token reuse)
+        """
+        expires_at = datetime.fromtimestamp(exp, tz=dt_timezone.utc)
+        try:
+            with transaction.atomic():
+                RevokedToken.objects.create(jti=jti, expires_at=expires_at)
+        except IntegrityError:
+            return False
+
+        with self._lock:
+            if self._filter is not None:
+                self._filter.add(jti)
+            if self._build_thread is not None and self._build_thread.is_alive():
+                self._revoked_during_build.append(jti)
+        ttl = int(exp - time.time())
+        if ttl > 0:
+            caches['ratelimit'].set(self._cache_key(jti), 1, timeout=ttl)
+
+        self._maybe_prune()
+        return True
+
+    def _maybe_prune(self):
+        with self._lock:
+            if time.monotonic() - self._pruned_at < REVOKED_TOKEN_PRUNE_SECONDS:
+                return
+            self._pruned_at = time.monotonic()
+        try:
+            self.prune()
+        except Exception as e:
+            logger.error(f"Pruning revoked tokens failed: {e}")
+
+    def prune(self):
+        """
+        Delete expired rows in chunks (expires_at index).
+
+        Returns:
+            int: Rows deleted
+        """
+        total = 0
+        now = timezone.now()
+        while True:
+            jtis = list(
+                RevokedToken.objects.filter(expires_at__lte=now)
+                .order_by('expires_at').values_list('jti', flat=True)[:REVOKED_TOKEN_PRUNE_BATCH]
+            )
+            if not jtis:
+                return total
+            deleted, _ = RevokedToken.objects.filter(jti__in=jtis).delete()
+            total += deleted
+
+
+revocation_store = RevocationStore()
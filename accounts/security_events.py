@@ -0,0 +1,189 @@
+"""
+Buffered logging of security events (StaffAuthorizationAttempt, RegistrationAttempt).
+
+Request handlers call record_security_event() with an unsaved model instance.
+Events are queued in memory and a background thread writes them with
+bulk_create once SECURITY_EVENT_BATCH_SIZE events are waiting or every
+SECURITY_EVENT_FLUSH_SECONDS, so a burst of failed attempts costs one INSERT
+per batch instead of one per request. Lockout decisions do not read these
+tables (see accounts.ratelimit), so the delay doesn't weaken them.
+
+Events are cleaned when recorded (over-long strings truncated, invalid IPs
+replaced) so one bad value can't fail a whole batch. If a batch still fails
+it is retried row by row and rows that fail again are logged and dropped; if
+the database is unreachable the batch is re-queued for the next flush.
+
+Events still in memory when a process is killed are lost. The queue is
+capped at SECURITY_EVENT_MAX_BUFFER; beyond that the oldest events are
+dropped and counted, rather than letting a flood exhaust memory.
+"""
+from collections import deque
+from decouple import config
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_ipv46_address
+from django.db import InterfaceError, OperationalError, close_old_connections, models
+import atexit
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+SECURITY_EVENT_BATCH_SIZE = config('SECURITY_EVENT_BATCH_SIZE', default=100, cast=int)
+SECURITY_EVENT_FLUSH_SECONDS = config('SECURITY_EVENT_FLUSH_SECONDS', default=5, cast=float)
+SECURITY_EVENT_MAX_BUFFER = config('SECURITY_EVENT_MAX_BUFFER', default=10000, cast=int)
+
+# Stored when the client address is not a valid IP (ip_address is NOT NULL)
+UNKNOWN_IP = '0.0.0.0'
+
+
+def clean_security_event(event):
+    """Truncate over-long strings and replace invalid IPs so the row can be inserted"""
+    for field in event._meta.concrete_fields:
+        value = getattr(event, field.attname)
+        if isinstance(field, models.GenericIPAddressField):
+            try:
+                validate_ipv46_address(value)
+            except ValidationError:
+                setattr(event, field.attname, None if field.null else UNKNOWN_IP)
+        elif isinstance(value, str) and field.max_length and len(value) > field.max_length:
+            setattr(event, field.attname, value[:field.max_length])
+    return event
+
+
+class SecurityEventBuffer:
+    """
+    In-memory queue of unsaved security events, flushed in batches.
+
+    Args:
+        batch_size (int): Queue length that triggers an early flush
+        flush_seconds (float): Maximum time an event waits before being written
+        max_buffer (int): Events kept in memory before the oldest are dropped
+    """
+
+    def __init__(self, batch_size, flush_seconds, max_buffer):
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self._events = deque(maxlen=max_buffer)
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self.dropped = 0
+
+    def record(self, event):
+        """Queue an unsaved model instance for the next batch"""
+        clean_security_event(event)
+        with self._lock:
+            if len(self._events) == self._events.maxlen:
+                self.dropped += 1
+            self._events.append(event)
+            pending = len(self._events)
+            self._ensure_thread()
+        if pending >= self.batch_size:
+            self._wakeup.set()
+
+    def _ensure_thread(self):
+        # Started lazily so it is created in the serving process, after any fork
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='security-event-flusher', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_seconds)
+            self._wakeup.clear()
+            close_old_connections()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Security event flush failed: {e}")
+
+    def _requeue(self, events):
+        """Put unwritten events back ahead of newer ones, dropping the oldest if full"""
+        with self._lock:
+            queued = list(events) + list(self._events)
+            overflow = len(queued) - self._events.maxlen
+            if overflow > 0:
+                self.dropped += overflow
+                queued = queued[overflow:]
+            self._events.clear()
+            self._events.extend(queued)
+
+    def _write_rows(self, model, events, later):
+        """
+        Insert events one by one after their batch failed. Rows that fail
+        again are logged and dropped; if the database becomes unreachable the
+        rest, and the later batches, are re-queued.
+
+        Returns:
+            int: Number of events written
+        """
+        written = 0
+        for position, event in enumerate(events):
+            try:
+                model.objects.bulk_create([event])
+                written += 1
+            except (OperationalError, InterfaceError):
+                self._requeue(events[position:] + later)
+                raise
+            except Exception as e:
+                logger.error(f"Dropped {model.__name__} event that could not be written: {e}")
+        return written
+
+    def flush(self):
+        """
+        Write every queued event with one bulk_create per model.
+
+        Returns:
+            int: Number of events written
+        """
+        # One flush at a time, so a failed batch is re-queued ahead of newer events
+        with self._flush_lock:
+            with self._lock:
+                events = list(self._events)
+                self._events.clear()
+                dropped, self.dropped = self.dropped, 0
+
+            if dropped:
+                logger.warning(f"Dropped {dropped} security event(s): buffer full")
+            if not events:
+                return 0
+
+            by_model = {}
+            for event in events:
+                by_model.setdefault(type(event), []).append(event)
+            batches = list(by_model.items())
+
+            written = 0
+            for position, (model, model_events) in enumerate(batches):
+                later = [event for _, batch in batches[position + 1:] for event in batch]
+                try:
+                    model.objects.bulk_create(model_events, batch_size=self.batch_size)
+                    written += len(model_events)
+                except (OperationalError, InterfaceError):
+                    # Database unreachable: keep everything unwritten for the next flush
+                    self._requeue(model_events + later)
+                    raise
+                except Exception as e:
+                    # A bad row fails the whole batch; find and drop it
+                    logger.warning(f"{model.__name__} batch failed ({e}); retrying row by row")
+                    written += self._write_rows(model, model_events, later)
+            return written
+
+
+security_event_buffer = SecurityEventBuffer(
+    SECURITY_EVENT_BATCH_SIZE, SECURITY_EVENT_FLUSH_SECONDS, SECURITY_EVENT_MAX_BUFFER
+)
+
+
+def record_security_event(event):
+    """Queue a StaffAuthorizationAttempt or RegistrationAttempt for batched insert"""
+    security_event_buffer.record(event)
+
+
+@atexit.register
+def _flush_on_exit():
+    try:
+        security_event_buffer.flush()
+    except Exception as e:
+        logger.error(f"Security event flush at exit failed: {e}")
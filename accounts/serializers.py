@@ -2,8 +2,12 @@
 Serializers for accounts app
 """
 from rest_framework import serializers
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer, TokenVerifySerializer
+from rest_framework_simplejwt.settings import api_settings as jwt_api_settings
+from rest_framework_simplejwt.tokens import UntypedToken
 from django.contrib.auth import get_user_model
 from .models import DoctorProfile, Branch, DoctorSchedule, PatientProfile, StaffProfile
+from .tokens import RevocableRefreshToken
 
 User = get_user_model()
 
@@ -24,7 +28,10 @@ class UserSerializer(serializers.ModelSerializer):
     def get_doctor_profile(self, obj):
         """Get doctor profile if user is staff"""
         if obj.is_staff() and hasattr(obj, 'doctor_profile'):
-            return DoctorProfileSerializer(obj.doctor_profile).data
+            serializer = DoctorProfileSerializer(obj.doctor_profile)
+            # The nested user is obj itself; serializing it again recurses forever
+            serializer.fields.pop('user')
+            return serializer.data
         return None
 
     def get_patient_profile(self, obj):
@@ -300,6 +307,47 @@ class DoctorProfileSerializer(serializers.ModelSerializer):
         return obj.user.get_full_name() or obj.user.email
 
 
+class DoctorSearchSerializer(serializers.Serializer):
+    """Query parameters for /api/doctors/search/"""
+    SORT_CHOICES = ('next_slot', 'fee', '-fee', 'experience')
+
+    specialization = serializers.CharField(required=False, max_length=100)
+    branch = serializers.IntegerField(required=False, min_value=1)
+    min_fee = serializers.DecimalField(required=False, max_digits=10, decimal_places=2, min_value=0)
+    max_fee = serializers.DecimalField(required=False, max_digits=10, decimal_places=2, min_value=0)
+    available_within_days = serializers.IntegerField(required=False, min_value=0, max_value=365)
+    available_before = serializers.DateField(required=False)
+    sort = serializers.ChoiceField(choices=SORT_CHOICES, required=False, default='next_slot')
+
+    def validate(self, attrs):
+        if 'min_fee' in attrs and 'max_fee' in attrs and attrs['min_fee'] > attrs['max_fee']:
+            raise serializers.ValidationError({'min_fee': 'min_fee cannot be greater than max_fee.'})
+        if 'available_within_days' in attrs and 'available_before' in attrs:
+            raise serializers.ValidationError('Use either available_within_days or available_before, not both.')
+        return attrs
+
+
+class DoctorSearchResultSerializer(serializers.ModelSerializer):
+    """Flat doctor summary for search results (no schedules or nested user)"""
+    user_id = serializers.IntegerField(read_only=True)
+    name = serializers.SerializerMethodField()
+    branch = serializers.SerializerMethodField()
+
+    class Meta:
+        model = DoctorProfile
+        fields = ('id', 'user_id', 'name', 'branch', 'specialization',
+                  'years_of_experience', 'consultation_fee', 'next_free_slot')
+        read_only_fields = fields
+
+    def get_name(self, obj):
+        return obj.user.get_full_name() or obj.user.email
+
+    def get_branch(self, obj):
+        if obj.branch is None:
+            return None
+        return {'id': obj.branch.id, 'name': obj.branch.name}
+
+
 class DoctorProfileCreateSerializer(serializers.ModelSerializer):
     """Serializer for creating/updating doctor profiles"""
     branch_id = serializers.IntegerField(write_only=True, required=False)
@@ -327,3 +375,19 @@ class DoctorProfileCreateSerializer(serializers.ModelSerializer):
             **validated_data
         )
         return doctor_profile
+
+
+class RevokingTokenRefreshSerializer(TokenRefreshSerializer):
+    """Token refresh that rejects and revokes rotated refresh tokens"""
+    token_class = RevocableRefreshToken
+
+
+class RevokingTokenVerifySerializer(TokenVerifySerializer):
+    """Token verify that also rejects revoked refresh tokens"""
+
+    def validate(self, attrs):
+        data = super().validate(attrs)
+        token = UntypedToken(attrs['token'])
+        if token.get(jwt_api_settings.TOKEN_TYPE_CLAIM) == RevocableRefreshToken.token_type:
+            RevocableRefreshToken(attrs['token'])
+        return data
@@ -0,0 +1,67 @@
+"""
+Signal handlers for accounts app
+"""
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from .availability import user_identifier_index
+from .directory import bump_directory_version
+from .models import Branch, DoctorProfile, DoctorSchedule, PatientProfile, StaffProfile
+from .principal import invalidate_principal
+
+User = get_user_model()
+
+
+@receiver(post_save, sender=User)
+def track_new_user_identifiers(sender, instance, created, **kwargs):
+    """Keep the registration availability filter in sync with new users"""
+    if created:
+        user_identifier_index.add(instance.email, instance.username)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_user_principal(sender, instance, **kwargs):
+    """Drop the cached principal when the user changes"""
+    invalidate_principal(instance.pk)
+
+
+@receiver(post_save, sender=DoctorProfile)
+@receiver(post_delete, sender=DoctorProfile)
+@receiver(post_save, sender=PatientProfile)
+@receiver(post_delete, sender=PatientProfile)
+@receiver(post_save, sender=StaffProfile)
+@receiver(post_delete, sender=StaffProfile)
+def invalidate_profile_principal(sender, instance, **kwargs):
+    """Drop the cached principal when one of the user's profiles changes"""
+    invalidate_principal(instance.user_id)
+
+
+@receiver(post_save, sender=DoctorSchedule)
+@receiver(post_delete, sender=DoctorSchedule)
+def invalidate_schedule_principal(sender, instance, **kwargs):
+    """Schedules are part of the cached /api/users/me/ payload"""
+    invalidate_principal(DoctorProfile.objects.filter(pk=instance.doctor_id).values_list('user_id', flat=True).first())
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_directory_for_user(sender, instance, update_fields=None, **kwargs):
+    """Staff users appear in the doctor directory; logins (last_login only) don't change it"""
+    if instance.user_type != 'STAFF' or (update_fields and set(update_fields) <= {'last_login'}):
+        return
+    transaction.on_commit(bump_directory_version)
+
+
+@receiver(post_save, sender=DoctorProfile)
+@receiver(post_delete, sender=DoctorProfile)
+@receiver(post_save, sender=StaffProfile)
+@receiver(post_delete, sender=StaffProfile)
+@receiver(post_save, sender=Branch)
+@receiver(post_delete, sender=Branch)
+@receiver(post_save, sender=DoctorSchedule)
+@receiver(post_delete, sender=DoctorSchedule)
+def invalidate_directory(sender, **kwargs):
+    """Bump the doctor directory version once the change is committed"""
+    transaction.on_commit(bump_directory_version)
@@ -0,0 +1,109 @@
+"""
+Signed staff-authorization tickets.
+
+Passing staff authorization (employee ID + registration code) issues a
+short-lived ticket signed with SECRET_KEY via django.core.signing. Staff
+registration verifies it, with no session row to write or read.
+
+A ticket carries the employee ID and a fingerprint of the client (IP and
+User-Agent), so it cannot be replayed from another client or for another
+employee. It expires after STAFF_TICKET_MAX_AGE seconds. Tickets are not
+tracked server-side. Reuse is bounded by the expiry and by
+StaffProfile.employee_id being unique.
+
+The HTML flow carries the ticket in an HttpOnly, SameSite=Strict cookie.
+API clients send it back as `staff_ticket` in the body or in an
+X-Staff-Ticket header.
+"""
+from decouple import config
+from django.core import signing
+from .ratelimit import get_client_ip
+import hashlib
+
+STAFF_TICKET_MAX_AGE = config('STAFF_TICKET_MAX_AGE', default=900, cast=int)
+STAFF_TICKET_COOKIE = 'staff_ticket'
+STAFF_TICKET_SALT = 'accounts.staff-authorization'
+
+
+class StaffTicketError(Exception):
+    """Raised when a staff ticket is missing, invalid, expired or bound elsewhere"""
+    pass
+
+
+def _client_fingerprint(request):
+    client = f"{get_client_ip(request)}|{request.META.get('HTTP_USER_AGENT', '')}"
+    return hashlib.sha256(client.encode('utf-8')).hexdigest()[:16]
+
+
+def issue_staff_ticket(request, employee_id):
+    """
+    Sign a ticket for an authorized employee ID, bound to this client.
+
+    Returns:
+        str: The ticket
+    """
+    return signing.dumps(
+        {'employee_id': employee_id, 'client': _client_fingerprint(request)},
+        salt=STAFF_TICKET_SALT
+    )
+
+
+def get_staff_ticket(request, data=None):
+    """Find the ticket in the request body, X-Staff-Ticket header or cookie"""
+    return (
+        (data or {}).get('staff_ticket')
+        or request.META.get('HTTP_X_STAFF_TICKET')
+        or request.COOKIES.get(STAFF_TICKET_COOKIE)
+    )
+
+
+def verify_staff_ticket(request, ticket, employee_id=None):
+    """
+    Check a ticket and return the employee ID it was issued for.
+
+    Args:
+        request: Current request (for the client binding)
+        ticket (str): Ticket from get_staff_ticket()
+        employee_id (str): If given, must match the ticket
+
+    Returns:
+        str: The authorized employee ID
+
+    Raises:
+        StaffTicketError: With a user-facing message
+    """
+    if not ticket:
+        raise StaffTicketError('Authorization required. Please complete authorization first.')
+    if not isinstance(ticket, str):
+        # Request bodies are JSON, so the ticket may be any type
+        raise StaffTicketError('Invalid authorization. Please authorize again.')
+    try:
+        payload = signing.loads(ticket, salt=STAFF_TICKET_SALT, max_age=STAFF_TICKET_MAX_AGE)
+    except signing.SignatureExpired:
+        raise StaffTicketError('Authorization expired. Please authorize again.')
+    except signing.BadSignature:
+        raise StaffTicketError('Invalid authorization. Please authorize again.')
+
+    if payload.get('client') != _client_fingerprint(request):
+        raise StaffTicketError('Authorization was issued to a different client. Please authorize again.')
+    if employee_id and employee_id != payload.get('employee_id'):
+        raise StaffTicketError('Employee ID does not match the authorization.')
+    return payload['employee_id']
+
+
+def set_staff_ticket_cookie(response, request, ticket):
+    """Attach the ticket as an HttpOnly cookie that expires with it"""
+    response.set_cookie(
+        STAFF_TICKET_COOKIE, ticket,
+        max_age=STAFF_TICKET_MAX_AGE,
+        httponly=True,
+        samesite='Strict',
+        secure=request.is_secure(),
+    )
+    return response
+
+
+def clear_staff_ticket_cookie(response):
+    """Drop the ticket cookie once registration has used it"""
+    response.delete_cookie(STAFF_TICKET_COOKIE, samesite='Strict')
+    return response
@@ -0,0 +1,29 @@
+"""
+Background jobs for the accounts app (run by manage.py runworker)
+"""
+from django.core.mail import EmailMessage
+from jobs.queue import enqueue_many, job
+
+
+@job('accounts.send_email', max_attempts=5)
+def send_email(subject, body, to, from_email=None):
+    """Send one email; SMTP errors raise so the job is retried with backoff"""
+    EmailMessage(subject=subject, body=body, from_email=from_email, to=to).send()
+
+
+def queue_messages(messages):
+    """
+    Queue EmailMessage objects for delivery by the job worker.
+
+    Call inside the transaction that makes the email true (e.g. an approval),
+    so nothing is sent if it rolls back. One job per message, so a bad
+    address is retried or failed on its own.
+
+    Returns:
+        int: Number of messages queued
+    """
+    return enqueue_many('accounts.send_email', [
+        {'subject': message.subject, 'body': message.body,
+         'to': list(message.to), 'from_email': message.from_email}
+        for message in messages
+    ])
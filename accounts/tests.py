@@ -0,0 +1,658 @@
+"""
+Tests for the accounts app.
+
+The 'ratelimit' cache is per-process LocMemCache here (no REDIS_URL), so
+tests clear it in setUp.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from importlib import import_module
+from io import StringIO
+from unittest import mock
+import time
+from django.apps import apps as django_apps
+from django.core.cache import caches
+from django.core.management import call_command
+from django.db import IntegrityError, OperationalError, connections
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+from jobs.models import Job
+from . import views
+from .admin import approve_staff, reject_staff
+from .availability import BloomFilter, UserIdentifierIndex
+from .directory import cached_directory_response
+from .management.commands.benchmark_password_hashers import argon2_strength, pbkdf2_strength
+from .models import (
+    Branch, DoctorProfile, PatientIdCounter, PatientProfile, RegistrationAttempt, RevokedToken,
+    StaffAuthorizationAttempt, StaffProfile, User
+)
+from .onboarding import PatientImporter
+from .patient_ids import PatientIdAllocator, allocate_patient_ids, reserve_patient_numbers
+from .principal import PrincipalCache, load_principal
+from .ratelimit import (
+    AVAILABILITY_CHECK_RATE_LIMIT, REGISTRATION_RATE_LIMIT, SlidingWindowLimiter, get_client_ip, rate_limit
+)
+from .revocation import RevocationStore
+from .security_events import UNKNOWN_IP, SecurityEventBuffer
+from .staff_tickets import StaffTicketError, issue_staff_ticket, verify_staff_ticket
+from .serializers import PatientRegistrationSerializer
+from .tokens import RevocableRefreshToken
+
+
+def make_user(username, user_type='PATIENT', **fields):
+    return User.objects.create_user(
+        username=username, email=f'{username}@apexdental.com', password='Passw0rd!', user_type=user_type, **fields
+    )
+
+
+class UserAvailabilityTests(TestCase):
+    """Bloom filter behind the live availability check"""
+
+    def setUp(self):
+        caches['ratelimit'].clear()
+        self.user = make_user('Sara')
+        self.index = UserIdentifierIndex()
+
+    def _build_now(self):
+        # _rebuild runs on its own thread and connection; build inline instead
+        self.index._filters = self.index._build()
+        self.index._built_at = time.monotonic()
+
+    def test_bloom_filter_has_no_false_negatives(self):
+        bloom = BloomFilter(capacity=1000, error_rate=0.01)
+        values = [f'user{i}@example.com' for i in range(1000)]
+        for value in values:
+            bloom.add(value)
+        self.assertTrue(all(value in bloom for value in values))
+        false_positives = sum(f'other{i}@example.com' in bloom for i in range(1000))
+        self.assertLess(false_positives, 50)
+
+    def test_exact_lookup_until_the_filter_is_built(self):
+        with mock.patch('accounts.availability.threading.Thread') as thread:
+            self.assertTrue(self.index.might_exist('email', 'nobody@example.com'))
+            thread.return_value.start.assert_called_once()
+            self.assertFalse(self.index.is_available('email', 'Sara@apexdental.com'))
+            self.assertTrue(self.index.is_available('email', 'nobody@example.com'))
+
+    def test_filter_answers_misses_without_a_query(self):
+        self._build_now()
+        with self.assertNumQueries(0):
+            self.assertTrue(self.index.is_available('username', 'someone-else'))
+        self.assertFalse(self.index.is_available('username', 'Sara'))
+
+        self.index.add(email='new@apexdental.com', username='new')
+        self.assertTrue(self.index.might_exist('username', 'NEW'))
+
+    def test_registration_checks_the_database(self):
+        serializer = PatientRegistrationSerializer()
+        with mock.patch('accounts.availability.user_identifier_index.is_available', return_value=True):
+            with self.assertRaises(ValidationError):
+                serializer.validate_email('Sara@apexdental.com')
+            with self.assertRaises(ValidationError):
+                serializer.validate_username('Sara')
+        self.assertEqual(serializer.validate_username('someone-else'), 'someone-else')
+
+    def test_live_check_is_rate_limited(self):
+        with mock.patch('accounts.availability.user_identifier_index.is_available', return_value=True):
+            for _ in range(AVAILABILITY_CHECK_RATE_LIMIT):
+                response = self.client.get('/api/register/check/', {'username': 'someone-else'})
+                self.assertEqual(response.status_code, 200)
+            response = self.client.get('/api/register/check/', {'username': 'someone-else'})
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response)
+
+
+class RateLimitTests(TestCase):
+    """Sliding-window limiter: client keys, reservations, refunds and exemptions"""
+
+    def setUp(self):
+        caches['ratelimit'].clear()
+        self.factory = RequestFactory()
+
+    def test_client_ip_ignores_client_supplied_hops(self):
+        request = self.factory.get('/', HTTP_X_FORWARDED_FOR='1.2.3.4, 203.0.113.7', REMOTE_ADDR='10.0.0.2')
+        with mock.patch('accounts.ratelimit.TRUSTED_PROXY_COUNT', 1):
+            self.assertEqual(get_client_ip(request), '203.0.113.7')
+        with mock.patch('accounts.ratelimit.TRUSTED_PROXY_COUNT', 0):
+            self.assertEqual(get_client_ip(request), '10.0.0.2')
+        with mock.patch('accounts.ratelimit.TRUSTED_PROXY_COUNT', 3):
+            self.assertEqual(get_client_ip(request), '10.0.0.2')
+
+    def test_concurrent_reservations_never_exceed_the_limit(self):
+        limiter = SlidingWindowLimiter('test', 5, 3600)
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            results = list(pool.map(lambda _: limiter.reserve('client')[0], range(40)))
+        self.assertEqual(results.count(True), 5)
+
+    def test_requests_that_do_not_count_are_refunded(self):
+        @rate_limit('test_failures', 2, 3600, counts=lambda response: response.status_code == 401)
+        def view(request):
+            return HttpResponse(status=int(request.GET['status']))
+
+        for _ in range(5):
+            self.assertEqual(view(self.factory.get('/', {'status': 200})).status_code, 200)
+        self.assertEqual(view.limiter.count('127.0.0.1'), 0)
+
+        for _ in range(2):
+            self.assertEqual(view(self.factory.get('/', {'status': 401})).status_code, 401)
+        response = view(self.factory.get('/', {'status': 200}))
+        self.assertEqual(response.status_code, 429)
+        # The rejected request was refunded too
+        self.assertEqual(view.limiter.count('127.0.0.1'), 2)
+
+    def test_staff_authorization_locks_after_failures_only(self):
+        valid = {'employee_id': 'EMP001', 'registration_code': 'APEX2024'}
+        invalid = {'employee_id': 'EMP001', 'registration_code': 'wrong'}
+        with mock.patch('accounts.views.record_security_event'):
+            for _ in range(3):
+                response = self.client.post('/api/staff/authorize/', valid, content_type='application/json')
+                self.assertEqual(response.status_code, 200)
+            for remaining in (4, 3, 2, 1, 0):
+                response = self.client.post('/api/staff/authorize/', invalid, content_type='application/json')
+                self.assertEqual(response.json()['attempts_remaining'], remaining)
+            response = self.client.post('/api/staff/authorize/', valid, content_type='application/json')
+        self.assertEqual(response.status_code, 429)
+
+    def test_registration_limit_exempts_signed_in_staff(self):
+        urls = ('/api/register/patient/', '/api/auth/register/patient/')
+        for _ in range(REGISTRATION_RATE_LIMIT):
+            self.assertEqual(self.client.post(urls[0], {}, content_type='application/json').status_code, 400)
+        for url in urls:
+            self.assertEqual(self.client.post(url, {}, content_type='application/json').status_code, 429, url)
+
+        # Front desk on the same IP: session and JWT staff callers are not limited
+        staff = make_user('frontdesk', 'STAFF')
+        jwt_client = APIClient()
+        jwt_client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(staff)}')
+        self.client.force_login(staff)
+        for url in urls:
+            self.assertEqual(self.client.post(url, {}, content_type='application/json').status_code, 400, url)
+            self.assertEqual(jwt_client.post(url, {}, format='json').status_code, 400, url)
+
+        # Patients and bad tokens still are
+        self.client.force_login(make_user('patient'))
+        self.assertEqual(self.client.post(urls[0], {}, content_type='application/json').status_code, 429)
+        jwt_client.credentials(HTTP_AUTHORIZATION='Bearer not-a-token')
+        self.assertEqual(jwt_client.post(urls[1], {}, format='json').status_code, 429)
+
+
+def staff_attempt(employee_id='EMP001', ip_address='203.0.113.7'):
+    return StaffAuthorizationAttempt(
+        ip_address=ip_address, employee_id=employee_id, registration_code='wrong', success=False
+    )
+
+
+@mock.patch.object(SecurityEventBuffer, '_ensure_thread')
+class SecurityEventBufferTests(TestCase):
+    """Batched security event writes and what happens when a batch fails"""
+
+    def setUp(self):
+        self.buffer = SecurityEventBuffer(batch_size=100, flush_seconds=3600, max_buffer=3)
+
+    def test_events_are_cleaned_on_record(self, _):
+        self.buffer.record(staff_attempt(employee_id='E' * 50, ip_address='not-an-ip'))
+        self.assertEqual(self.buffer.flush(), 1)
+        attempt = StaffAuthorizationAttempt.objects.get()
+        self.assertEqual((attempt.employee_id, attempt.ip_address), ('E' * 20, UNKNOWN_IP))
+
+    def test_bad_row_is_dropped_not_retried_forever(self, _):
+        insert = StaffAuthorizationAttempt.objects.bulk_create
+
+        def bulk_create(events, **kwargs):
+            if any(event.employee_id == 'BAD' for event in events):
+                raise IntegrityError('bad row')
+            return insert(events, **kwargs)
+
+        for employee_id in ('EMP001', 'BAD', 'EMP002'):
+            self.buffer.record(staff_attempt(employee_id))
+        with mock.patch.object(StaffAuthorizationAttempt.objects, 'bulk_create', side_effect=bulk_create):
+            self.assertEqual(self.buffer.flush(), 2)
+        self.assertEqual(self.buffer.flush(), 0)
+        self.assertEqual(
+            sorted(StaffAuthorizationAttempt.objects.values_list('employee_id', flat=True)), ['EMP001', 'EMP002']
+        )
+
+    def test_unreachable_database_requeues_dropping_the_oldest(self, _):
+        old = [staff_attempt(f'OLD{i}') for i in range(2)]
+        for event in old:
+            self.buffer.record(event)
+        registration = RegistrationAttempt(ip_address='203.0.113.7', user_type='PATIENT')
+        self.buffer.record(registration)
+        new = [staff_attempt(f'NEW{i}') for i in range(2)]
+
+        def bulk_create(events, **kwargs):
+            # Requests keep recording while the flush waits on the database
+            for event in new:
+                self.buffer.record(event)
+            raise OperationalError('connection refused')
+
+        with mock.patch.object(StaffAuthorizationAttempt.objects, 'bulk_create', side_effect=bulk_create):
+            with self.assertRaises(OperationalError):
+                self.buffer.flush()
+        self.assertEqual(list(self.buffer._events), [registration] + new)
+        self.assertEqual(self.buffer.dropped, 2)
+
+
+class PatientIdTests(TestCase):
+    """Per-day patient ID counter, block allocation and the 0005 seed"""
+
+    day = date(2026, 3, 14)
+
+    def setUp(self):
+        patcher = mock.patch('accounts.patient_ids.timezone.localdate', return_value=self.day)
+        self.localdate = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_ids_are_sequential_within_a_day(self):
+        allocator = PatientIdAllocator()
+        ids = [allocator.next_id() for _ in range(3)]
+        self.assertEqual(ids, [f'PAT-20260314-000{n}' for n in (1, 2, 3)])
+        profile = PatientProfile.objects.create(user=make_user('sara'))
+        self.assertEqual(profile.patient_id, 'PAT-20260314-0004')
+
+    def test_counter_resets_the_next_day(self):
+        allocator = PatientIdAllocator()
+        allocator.next_id()
+        self.localdate.return_value = self.day + timedelta(days=1)
+        self.assertEqual(allocator.next_id(), 'PAT-20260315-0001')
+        self.assertEqual(
+            dict(PatientIdCounter.objects.values_list('day', 'last_value')),
+            {self.day: 1, self.day + timedelta(days=1): 1}
+        )
+
+    def test_blocks_hand_out_consecutive_ids(self):
+        allocator = PatientIdAllocator(block_size=3)
+        with self.captureOnCommitCallbacks(execute=True):
+            first = allocator.next_id()
+        with self.assertNumQueries(0):
+            pooled = [allocator.next_id(), allocator.next_id()]
+        self.assertEqual([first] + pooled, [f'PAT-20260314-000{n}' for n in (1, 2, 3)])
+        # Another process's block starts after this one
+        self.assertEqual(PatientIdAllocator(block_size=3).next_id(), 'PAT-20260314-0004')
+        self.assertEqual(allocate_patient_ids(2), ['PAT-20260314-0007', 'PAT-20260314-0008'])
+
+    def test_generic_backend_path_matches_the_upsert(self):
+        self.assertEqual(list(reserve_patient_numbers(self.day, 2)), [1, 2])
+        with mock.patch.object(connections['default'], 'vendor', 'mysql'):
+            self.assertEqual(list(reserve_patient_numbers(self.day, 3)), [3, 4, 5])
+        self.assertEqual(list(reserve_patient_numbers(self.day)), [6])
+
+    def test_seed_migration_starts_above_existing_ids(self):
+        for username, patient_id in (('a', 'PAT-20260314-0041'), ('b', 'PAT-20260314-0007'),
+                                     ('c', 'PAT-20260313-0002'), ('d', 'LEGACY-17')):
+            PatientProfile.objects.create(user=make_user(username), patient_id=patient_id)
+        seed_counters = import_module('accounts.migrations.0005_patientidcounter').seed_counters
+        seed_counters(django_apps, None)
+
+        self.assertEqual(list(reserve_patient_numbers(self.day)), [42])
+        self.assertEqual(list(reserve_patient_numbers(self.day - timedelta(days=1))), [3])
+
+
+def patient_row(username, **fields):
+    row = {
+        'email': f'{username}@example.com', 'username': username, 'first_name': 'Test',
+        'last_name': 'Patient', 'phone_number': '+96550000000', 'date_of_birth': '1990-01-01',
+        'consent_treatment': 'true', 'password': '',
+    }
+    row.update(fields)
+    return row
+
+
+class PatientImportTests(TestCase):
+    """PatientImporter: duplicates, the row-by-row fallback, passwords and invites"""
+
+    def setUp(self):
+        make_user('sara')
+        # Hash in threads: a process pool would not see the test database settings
+        patcher = mock.patch('accounts.onboarding.ProcessPoolExecutor', ThreadPoolExecutor)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def run_import(self, rows, **options):
+        return list(PatientImporter(**options).run(rows))
+
+    def test_duplicates_in_any_case_are_rejected(self):
+        results = self.run_import([
+            patient_row('new1', email='SARA@apexdental.com'),  # Existing user
+            patient_row('SARA'),                               # Existing username
+            patient_row('new2'),
+            patient_row('new3', email='NEW2@Example.com'),     # Earlier in the file
+            patient_row('NEW2', email='other@example.com'),
+            patient_row('new4'),                               # Same phone as new2: allowed
+        ])
+        self.assertEqual([result['status'] for result in results],
+                         ['error', 'error', 'created', 'error', 'error', 'created'])
+        self.assertIn('email', results[0]['errors'])
+        self.assertIn('username', results[1]['errors'])
+        self.assertEqual([result['line'] for result in results], list(range(2, 8)))
+
+    def test_integrity_error_falls_back_to_row_by_row(self):
+        def rows():
+            yield patient_row('first')
+            # Registered by someone else after the importer loaded taken values
+            make_user('late')
+            yield patient_row('late', email='late-import@example.com')
+            yield patient_row('last')
+
+        results = self.run_import(rows())
+        self.assertEqual([result['status'] for result in results], ['created', 'error', 'created'])
+        self.assertEqual(results[1]['errors'], 'email or username already registered.')
+        created = PatientProfile.objects.filter(user__username__in=['first', 'last'])
+        self.assertEqual(created.count(), 2)
+        self.assertTrue(all(profile.patient_id.startswith('PAT-') for profile in created))
+
+    def test_passwords_and_invites(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            results = self.run_import([
+                patient_row('withpass', password='Str0ngpass'),
+                patient_row('another', password='An0therpass'),
+                patient_row('invited'),
+            ], chunk_size=10)
+        self.assertEqual({result['status'] for result in results}, {'created'})
+
+        users = {user.username: user for user in User.objects.filter(username__in=['withpass', 'another', 'invited'])}
+        self.assertTrue(users['withpass'].check_password('Str0ngpass'))
+        self.assertTrue(users['another'].check_password('An0therpass'))
+        self.assertFalse(users['invited'].has_usable_password())
+
+        jobs = Job.objects.filter(name='accounts.send_email')
+        self.assertEqual([job.payload['to'] for job in jobs], [['invited@example.com']])
+        self.assertIn('/password/reset/confirm/', jobs[0].payload['body'])
+
+    def test_no_invites_option(self):
+        self.run_import([patient_row('invited')], send_invites=False)
+        self.assertFalse(Job.objects.exists())
+
+
+class StaffApprovalAdminTests(TestCase):
+    """Bulk approve/reject actions of the staff approval admin"""
+
+    def setUp(self):
+        self.admin_user = make_user('admin', 'STAFF', is_superuser=True)
+        self.request = RequestFactory().post('/admin/accounts/staffprofile/')
+        self.request.user = self.admin_user
+        self.modeladmin = mock.Mock()
+        self.pending = [self.make_staff(f'pending{i}', approved=False) for i in range(2)]
+        self.approved = self.make_staff('approved', approved=True)
+
+    def make_staff(self, username, approved):
+        user = make_user(username, 'STAFF', is_active=approved)
+        return StaffProfile.objects.create(user=user, employee_id=username.upper(), role_title='Dentist',
+                                           is_approved=approved)
+
+    @mock.patch('accounts.admin.bump_directory_version')
+    @mock.patch('accounts.admin.invalidate_principal')
+    def test_approve_only_pending_and_invalidate_on_commit(self, invalidate, bump):
+        with self.captureOnCommitCallbacks() as callbacks:
+            approve_staff(self.modeladmin, self.request, StaffProfile.objects.all())
+        invalidate.assert_not_called()
+        bump.assert_not_called()
+        for callback in callbacks:
+            callback()
+        self.assertEqual(sorted(call.args[0] for call in invalidate.call_args_list),
+                         sorted(profile.user_id for profile in self.pending))
+        bump.assert_called_once()
+
+        for profile in self.pending:
+            profile.refresh_from_db()
+            self.assertEqual((profile.is_approved, profile.approved_by), (True, self.admin_user))
+            self.assertTrue(User.objects.get(pk=profile.user_id).is_active)
+        self.approved.refresh_from_db()
+        self.assertIsNone(self.approved.approved_at)  # Untouched
+        self.modeladmin.message_user.assert_called_once_with(self.request, '2 staff account(s) approved and activated.')
+
+    def test_approval_emails_are_queued_once_per_user(self):
+        approve_staff(self.modeladmin, self.request, StaffProfile.objects.all())
+        approve_staff(self.modeladmin, self.request, StaffProfile.objects.all())  # Nothing pending now
+        recipients = sorted(job.payload['to'][0] for job in Job.objects.filter(name='accounts.send_email'))
+        self.assertEqual(recipients, ['pending0@apexdental.com', 'pending1@apexdental.com'])
+
+    @mock.patch('accounts.signals.invalidate_principal')
+    def test_reject_deletes_only_pending(self, invalidate):
+        reject_staff(self.modeladmin, self.request, StaffProfile.objects.all())
+        self.assertEqual(list(StaffProfile.objects.all()), [self.approved])
+        self.assertFalse(User.objects.filter(username__startswith='pending').exists())
+        self.assertTrue({profile.user_id for profile in self.pending}
+                        <= {call.args[0] for call in invalidate.call_args_list})
+        self.modeladmin.message_user.assert_called_once_with(self.request, '2 staff account(s) rejected and removed.')
+
+
+class PrincipalCacheTests(TestCase):
+    """Cached JWT principals and their invalidation across processes"""
+
+    def setUp(self):
+        caches['principal'].clear()
+        self.user = make_user('sara')
+        # This process's cache; `other_worker` shares the generations but not the entries
+        self.cache = PrincipalCache(max_entries=10, ttl=60)
+        self.other_worker = PrincipalCache(max_entries=10, ttl=60)
+        for target in ('accounts.principal.principal_cache', 'accounts.views.principal_cache'):
+            patcher = mock.patch(target, self.cache)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _cache_on_other_worker(self):
+        generation = self.other_worker.generation(self.user.pk)
+        self.other_worker.set(self.user.pk, load_principal(self.user.pk), generation)
+        self.assertIsNotNone(self.other_worker.get(self.user.pk, generation))
+
+    def test_hit_needs_no_queries(self):
+        load_principal(self.user.pk)
+        with self.assertNumQueries(0):
+            user = load_principal(self.user.pk)
+        self.assertEqual(user.principal['user_type'], 'PATIENT')
+
+    def test_deactivation_invalidates_every_worker(self):
+        self._cache_on_other_worker()
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+        self.assertEqual(client.get('/api/users/me/').status_code, 200)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = False
+            self.user.save()
+
+        self.assertIsNone(self.other_worker.get(self.user.pk, self.other_worker.generation(self.user.pk)))
+        self.assertEqual(client.get('/api/users/me/').status_code, 401)
+
+    def test_role_change_invalidates_every_worker(self):
+        self._cache_on_other_worker()
+        load_principal(self.user.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.user_type = 'STAFF'
+            self.user.save()
+
+        self.assertIsNone(self.other_worker.get(self.user.pk, self.other_worker.generation(self.user.pk)))
+        self.assertEqual(load_principal(self.user.pk).principal['user_type'], 'STAFF')
+
+    def test_load_that_raced_a_change_is_not_served(self):
+        generation = self.cache.generation(self.user.pk)
+        stale = load_principal(self.user.pk)
+        self.cache.invalidate(self.user.pk)  # Commits while the load was in flight
+        self.cache.set(self.user.pk, stale, generation)
+        self.assertIsNone(self.cache.get(self.user.pk, self.cache.generation(self.user.pk)))
+
+    def test_entries_are_bounded(self):
+        for user in [self.user] + [make_user(f'user{i}') for i in range(12)]:
+            load_principal(user.pk)
+        self.assertEqual(self.cache.stats()['size'], 10)
+
+
+class RevocationTests(TestCase):
+    """Rotated refresh tokens are revoked and cannot be reused"""
+
+    def setUp(self):
+        caches['ratelimit'].clear()
+        self.user = make_user('sara')
+        self.store = RevocationStore()
+        # No background builds: tests build the filter inline when they need it
+        for patcher in (mock.patch('accounts.tokens.revocation_store', self.store),
+                        mock.patch('accounts.revocation.threading.Thread')):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _build_now(self):
+        # _rebuild runs on its own thread and connection; build inline instead
+        self.store._filter = self.store._build()
+        self.store._built_at = time.monotonic()
+
+    def test_rotated_refresh_token_cannot_be_reused(self):
+        refresh = str(RevocableRefreshToken.for_user(self.user))
+        response = self.client.post('/api/auth/jwt/refresh/', {'refresh': refresh})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('refresh', response.json())
+
+        response = self.client.post('/api/auth/jwt/refresh/', {'refresh': refresh})
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(RevokedToken.objects.count(), 1)
+
+    def test_verify_rejects_a_revoked_token(self):
+        token = RevocableRefreshToken.for_user(self.user)
+        self.assertEqual(self.client.post('/api/auth/jwt/verify/', {'token': str(token)}).status_code, 200)
+        token.blacklist()
+        self.assertEqual(self.client.post('/api/auth/jwt/verify/', {'token': str(token)}).status_code, 401)
+
+    def test_table_is_read_until_the_filter_is_built(self):
+        token = RevocableRefreshToken.for_user(self.user)
+        RevokedToken.objects.create(jti=token['jti'], expires_at=timezone.now() + timedelta(hours=1))
+        # Not in the shared cache: only the table knows about this revocation
+        self.assertTrue(self.store.is_revoked(token['jti']))
+
+        self._build_now()
+        with self.assertNumQueries(0):
+            self.assertFalse(self.store.is_revoked('never-revoked'))
+        self.assertTrue(self.store.is_revoked(token['jti']))
+
+    def test_revocations_during_a_build_reach_the_new_filter(self):
+        self.store._build_thread = mock.Mock(**{'is_alive.return_value': True})
+        token = RevocableRefreshToken.for_user(self.user)
+        self.assertTrue(self.store.revoke(token['jti'], token['exp']))
+        with mock.patch.object(RevocationStore, '_build', return_value=BloomFilter(100, 0.001)):
+            self.store._rebuild()
+        self.assertIn(token['jti'], self.store._filter)
+
+    def test_prune_deletes_only_expired_rows(self):
+        now = timezone.now()
+        RevokedToken.objects.bulk_create([
+            RevokedToken(jti=f'old{i}', expires_at=now - timedelta(minutes=1)) for i in range(3)
+        ] + [RevokedToken(jti='live', expires_at=now + timedelta(hours=1))])
+        with mock.patch('accounts.revocation.REVOKED_TOKEN_PRUNE_BATCH', 2):
+            self.assertEqual(self.store.prune(), 3)
+        self.assertEqual(list(RevokedToken.objects.values_list('jti', flat=True)), ['live'])
+
+
+class PasswordHasherBenchmarkTests(TestCase):
+    """Suggestion ranking of benchmark_password_hashers --target-ms"""
+
+    def test_strength_ordering(self):
+        self.assertGreater(argon2_strength(1, 19456), pbkdf2_strength(10_000_000))
+        self.assertGreater(argon2_strength(3, 65536), argon2_strength(2, 65536))
+        self.assertGreater(pbkdf2_strength(600_000), pbkdf2_strength(300_000))
+
+    def test_suggests_the_strongest_fitting_candidate_in_any_order(self):
+        out = StringIO()
+        call_command(
+            'benchmark_password_hashers', samples=1, pbkdf2_iterations=[2000, 8000, 1000],
+            argon2_time_cost=[], target_ms=10_000, stdout=out
+        )
+        self.assertIn('PASSWORD_PBKDF2_ITERATIONS=8000', out.getvalue())
+
+
+class StaffTicketTests(TestCase):
+    """Signed staff-authorization tickets and the staff registration endpoints"""
+
+    def setUp(self):
+        caches['ratelimit'].clear()
+        self.factory = RequestFactory()
+
+    def test_ticket_is_bound_to_client_and_employee(self):
+        request = self.factory.post('/', HTTP_USER_AGENT='browser')
+        ticket = issue_staff_ticket(request, 'EMP001')
+        self.assertEqual(verify_staff_ticket(request, ticket), 'EMP001')
+
+        with self.assertRaisesMessage(StaffTicketError, 'different client'):
+            verify_staff_ticket(self.factory.post('/', HTTP_USER_AGENT='other'), ticket)
+        with self.assertRaisesMessage(StaffTicketError, 'does not match'):
+            verify_staff_ticket(request, ticket, employee_id='EMP002')
+        with self.assertRaisesMessage(StaffTicketError, 'Invalid authorization'):
+            verify_staff_ticket(request, ticket + 'x')
+        with mock.patch('accounts.staff_tickets.STAFF_TICKET_MAX_AGE', -1):
+            with self.assertRaisesMessage(StaffTicketError, 'expired'):
+                verify_staff_ticket(request, ticket)
+
+    def test_non_object_body_is_rejected(self):
+        for url in ('/api/staff/register/', '/api/auth/register/staff/'):
+            response = self.client.post(url, ['staff_ticket'], content_type='application/json')
+            self.assertEqual(response.status_code, 400, url)
+
+    def test_non_string_ticket_is_rejected(self):
+        request = self.factory.post('/')
+        for ticket in (123, ['ticket'], {'employee_id': 'EMP001'}):
+            with self.assertRaisesMessage(StaffTicketError, 'Invalid authorization'):
+                verify_staff_ticket(request, ticket)
+        for url in ('/api/staff/register/', '/api/auth/register/staff/'):
+            response = self.client.post(url, {'staff_ticket': 123, 'username': 'drnoor'},
+                                        content_type='application/json')
+            self.assertEqual(response.status_code, 403, url)
+
+    def test_authorize_then_register(self):
+        with mock.patch('accounts.views.record_security_event'):
+            response = self.client.post(
+                '/api/staff/authorize/', {'employee_id': 'EMP002', 'registration_code': 'APEX2024'},
+                content_type='application/json'
+            )
+        self.assertEqual(response.status_code, 200)
+
+        # The ticket travels in the cookie set by authorize
+        response = self.client.post('/api/staff/register/', {
+            'username': 'drnoor', 'email': 'noor@apexdental.com',
+            'password': 'Str0ng-Passphrase', 're_password': 'Str0ng-Passphrase',
+        }, content_type='application/json')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response.json()['employee_id'], 'EMP002')
+        user = User.objects.get(username='drnoor')
+        self.assertFalse(user.is_active)
+        self.assertEqual(user.staff_profile.employee_id, 'EMP002')
+
+
+class DoctorDirectoryTests(TestCase):
+    """Cached directory snapshots behind /api/doctors/ and branch doctor lists"""
+
+    def setUp(self):
+        caches['directory'].clear()
+        self.branch = Branch.objects.create(name='Salmiya', address='Salem Al Mubarak St')
+        for i in range(3):
+            DoctorProfile.objects.create(
+                user=make_user(f'doctor{i}', 'STAFF'), branch=self.branch, specialization='Orthodontics'
+            )
+        self.client = APIClient()
+        self.client.force_authenticate(make_user('patient'))
+
+    def test_list_snapshot_is_keyed_on_the_whole_query(self):
+        names = []
+
+        def record(name, build):
+            names.append(name)
+            return cached_directory_response(name, build)
+
+        with mock.patch.object(views, 'cached_directory_response', side_effect=record):
+            self.assertEqual(len(self.client.get('/api/doctors/').json()['results']), 3)
+            self.client.get('/api/doctors/?page=1&format=json')
+            # Same parameters in another order hit the same snapshot
+            with self.assertNumQueries(0):
+                self.client.get('/api/doctors/?format=json&page=1')
+        self.assertEqual(len(set(names)), 2)
+        self.assertEqual(names[1], names[2])
+
+    def test_branch_is_resolved_before_the_snapshot(self):
+        url = f'/api/branches/{self.branch.pk}/doctors/'
+        self.assertEqual(len(self.client.get(url).json()), 3)
+        self.assertTrue(caches['directory'].get(f'doctor_directory:branch:{self.branch.pk}:doctors'))
+
+        # Deactivating bumps the version only after commit, so the snapshot is still there
+        Branch.objects.filter(pk=self.branch.pk).update(is_active=False)
+        self.assertEqual(self.client.get(url).status_code, 404)
@@ -0,0 +1,28 @@
+"""
+JWT token classes for accounts app
+"""
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+from .revocation import revocation_store
+
+
+class RevocableRefreshToken(RefreshToken):
+    """
+    RefreshToken checked against the revocation store.
+
+    simplejwt calls blacklist() after rotation when BLACKLIST_AFTER_ROTATION
+    is set; here that records the jti in accounts.revocation instead of the
+    token_blacklist app's tables.
+    """
+
+    def verify(self, *args, **kwargs):
+        if revocation_store.is_revoked(self.payload[api_settings.JTI_CLAIM]):
+            raise TokenError(_("Token is blacklisted"))
+        super().verify(*args, **kwargs)
+
+    def blacklist(self):
+        if not revocation_store.revoke(self.payload[api_settings.JTI_CLAIM], self.payload['exp']):
+            # Another request rotated this token first
+            raise TokenError(_("Token is blacklisted"))
@@ -9,7 +9,8 @@ from .views import (
     login_view, register_view, doctors_view, 
     appointments_view, index_view,
     access_view, patient_register_view, staff_authorize_view, staff_register_view,
-    patient_register_api, staff_authorize_api, staff_register_api
+    patient_register_api, staff_authorize_api, staff_register_api,
+    check_availability_api
 )
 
 router = DefaultRouter()
@@ -28,6 +29,7 @@ urlpatterns = [
     # REFACTOR: Patient registration flow
     path('access/patient/', patient_register_view, name='patient_register'),
     path('api/register/patient/', patient_register_api, name='patient_register_api'),
+    path('api/register/check/', check_availability_api, name='check_availability_api'),
     
     # REFACTOR: Staff authorization and registration flow
     path('access/staff/authorize/', staff_authorize_view, name='staff_authorize'),
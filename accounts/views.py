@@ -7,26 +7,49 @@ from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from django.contrib.auth import get_user_model
-from django.utils import timezone
-from django.core.cache import cache
 from django.http import JsonResponse
 from django.views.decorators.http import require_http_methods
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
-from datetime import timedelta
+from django.db.models import F
+from django.utils import timezone
+from datetime import datetime, time, timedelta
+from urllib.parse import urlencode
 import json
 import hashlib
 from .models import (
     DoctorProfile, Branch, DoctorSchedule, PatientProfile, StaffProfile, 
     StaffAuthorizationAttempt, RegistrationAttempt
 )
+from .directory import cached_directory_response
+from .principal import principal_cache
+from .ratelimit import (
+    AVAILABILITY_CHECK_RATE_LIMIT, REGISTRATION_RATE_LIMIT, SlidingWindowLimiter, get_client_ip,
+    is_staff_request, rate_limit
+)
+from .security_events import record_security_event
+from .staff_tickets import (
+    StaffTicketError, clear_staff_ticket_cookie, get_staff_ticket,
+    issue_staff_ticket, set_staff_ticket_cookie, verify_staff_ticket
+)
 from .serializers import (
     UserSerializer, DoctorProfileSerializer, DoctorProfileCreateSerializer,
-    BranchSerializer, DoctorScheduleSerializer, UserCreateSerializer
+    BranchSerializer, DoctorScheduleSerializer, UserCreateSerializer,
+    DoctorSearchSerializer, DoctorSearchResultSerializer
 )
 
 User = get_user_model()
 
+# Failed staff authorizations per IP in 15 minutes before lockout
+staff_auth_limiter = SlidingWindowLimiter('staff_auth', 5, 900)
+
+
+def directory_users():
+    """Users with everything UserSerializer nests, loaded in four queries"""
+    return User.objects.select_related(
+        'doctor_profile__branch', 'patient_profile', 'staff_profile'
+    ).prefetch_related('doctor_profile__schedules')
+
 
 # REFACTOR: Template views for patient/staff registration flows
 def access_view(request):
@@ -56,10 +79,12 @@ def staff_register_view(request):
     REFACTOR: Staff registration form (after authorization)
     Secure, admin-approved staff onboarding with email domain validation
     """
-    # Check if authorization session exists
-    if 'staff_authorized' not in request.session:
+    # Check for a valid authorization ticket (signed cookie, no session lookup)
+    try:
+        verify_staff_ticket(request, get_staff_ticket(request))
+    except StaffTicketError as e:
         return render(request, 'staff_authorize.html', {
-            'error': 'Please complete authorization first.'
+            'error': str(e)
         })
     return render(request, 'staff_register.html')
 
@@ -83,31 +108,19 @@ def staff_authorize_api(request):
         registration_code = data.get('registration_code', '').strip()
         
         # Get client IP
-        ip_address = request.META.get('HTTP_X_FORWARDED_FOR', '').split(',')[0].strip()
-        if not ip_address:
-            ip_address = request.META.get('REMOTE_ADDR', '')
-        
-        # Check if IP is locked
-        cache_key = f'staff_auth_locked_{ip_address}'
-        if cache.get(cache_key):
-            return JsonResponse({
-                'error': 'Too many failed attempts. Please try again in 15 minutes.'
-            }, status=429)
-        
-        # Get recent attempts for this IP
-        recent_attempts = StaffAuthorizationAttempt.objects.filter(
-            ip_address=ip_address,
-            created_at__gte=timezone.now() - timedelta(minutes=15)
-        ).order_by('-created_at')
-        
-        failed_count = recent_attempts.filter(success=False).count()
-        
-        # Lock after 5 failed attempts
-        if failed_count >= 5:
-            cache.set(cache_key, True, 900)  # 15 minutes
-            return JsonResponse({
+        ip_address = get_client_ip(request)
+        
+        # Lock after 5 failed attempts in 15 minutes (shared counter, no DB reads).
+        # The attempt takes its slot up front and gets it back if it succeeds.
+        allowed, attempt_count, reservation = staff_auth_limiter.reserve(ip_address)
+        if not allowed:
+            staff_auth_limiter.refund(reservation)
+            response = JsonResponse({
                 'error': 'Too many failed attempts. Please try again in 15 minutes.'
             }, status=429)
+            response['Retry-After'] = str(staff_auth_limiter.retry_after(ip_address))
+            return response
+        failed_count = attempt_count - 1
         
         # Validate credentials (in production, check against database)
         # For now, using placeholder validation
@@ -119,25 +132,26 @@ def staff_authorize_api(request):
             registration_code == valid_registration_code
         )
         
-        # Record attempt
-        attempt = StaffAuthorizationAttempt.objects.create(
+        # Record attempt (buffered; written in batches off the request path)
+        record_security_event(StaffAuthorizationAttempt(
             ip_address=ip_address,
             employee_id=employee_id,
             registration_code=registration_code,
             success=is_valid,
-            attempt_count=failed_count + 1
-        )
+            attempt_count=attempt_count
+        ))
         
         if is_valid:
-            # Store in session for registration
-            request.session['staff_authorized'] = True
-            request.session['staff_employee_id'] = employee_id
-            request.session['staff_authorized_at'] = timezone.now().isoformat()
-            
-            return JsonResponse({
+            staff_auth_limiter.refund(reservation)
+            # Signed ticket for registration: cookie for the HTML flow,
+            # body field for API clients
+            ticket = issue_staff_ticket(request, employee_id)
+            response = JsonResponse({
                 'success': True,
-                'message': 'Authorization successful. Proceeding to registration...'
+                'message': 'Authorization successful. Proceeding to registration...',
+                'staff_ticket': ticket
             })
+            return set_staff_ticket_cookie(response, request, ticket)
         else:
             # Check if CAPTCHA needed (after 2 failures)
             needs_captcha = failed_count >= 2
@@ -156,6 +170,7 @@ def staff_authorize_api(request):
 
 @csrf_exempt
 @require_http_methods(["POST"])
+@rate_limit('patient_register', REGISTRATION_RATE_LIMIT, 3600, exempt=is_staff_request)
 def patient_register_api(request):
     """
     Patient registration API endpoint
@@ -288,6 +303,51 @@ def patient_register_api(request):
         }, status=400)
 
 
+@require_http_methods(["GET"])
+@rate_limit('availability_check', AVAILABILITY_CHECK_RATE_LIMIT, 60)
+def check_availability_api(request):
+    """
+    Live availability check for the registration form
+    GET /api/register/check/?email=... or ?username=...
+    Answered from the in-memory filter; only possible matches hit the database.
+    Rate limited per IP so it can't be used to enumerate registered users.
+    """
+    from django.core.validators import validate_email
+    from django.core.exceptions import ValidationError
+    from .availability import user_identifier_index
+    
+    results = {}
+    email = request.GET.get('email', '').strip()
+    username = request.GET.get('username', '').strip()
+    
+    if not email and not username:
+        return JsonResponse({'error': 'Provide an email or username to check.'}, status=400)
+    
+    if email:
+        try:
+            validate_email(email)
+        except ValidationError:
+            results['email'] = {'available': False, 'message': 'Please enter a valid email address.'}
+        else:
+            available = user_identifier_index.is_available('email', email)
+            results['email'] = {
+                'available': available,
+                'message': '' if available else 'This email is already registered. Please use a different email or try logging in.'
+            }
+    
+    if username:
+        if not 3 <= len(username) <= 150:
+            results['username'] = {'available': False, 'message': 'Username must be between 3 and 150 characters.'}
+        else:
+            available = user_identifier_index.is_available('username', username)
+            results['username'] = {
+                'available': available,
+                'message': '' if available else 'This username is already taken. Please choose a different username.'
+            }
+    
+    return JsonResponse(results)
+
+
 @csrf_exempt
 @require_http_methods(["POST"])
 def staff_register_api(request):
@@ -295,16 +355,20 @@ def staff_register_api(request):
     Staff registration API endpoint
     Creates user with staff role and StaffProfile (inactive, needs approval)
     """
-    # Check authorization
-    if 'staff_authorized' not in request.session:
-        return JsonResponse({
-            'error': 'Authorization required. Please complete authorization first.'
-        }, status=403)
-    
     try:
         data = json.loads(request.body)
-        employee_id = request.session.get('staff_employee_id')
-        
+    except ValueError:
+        return JsonResponse({'error': 'Invalid request body.'}, status=400)
+    if not isinstance(data, dict):
+        return JsonResponse({'error': 'Request body must be a JSON object.'}, status=400)
+    
+    # Check authorization; the employee ID comes from the signed ticket
+    try:
+        employee_id = verify_staff_ticket(request, get_staff_ticket(request, data))
+    except StaffTicketError as e:
+        return JsonResponse({'error': str(e)}, status=403)
+    
+    try:
         # Validate email domain
         email = data.get('email', '')
         if not email.endswith('@apexdental.com'):  # Replace with actual domain
@@ -362,17 +426,14 @@ def staff_register_api(request):
                 is_approved=False  # Needs admin approval
             )
             
-            # Clear session
-            request.session.pop('staff_authorized', None)
-            request.session.pop('staff_employee_id', None)
-            
             # TODO: Notify admin of pending approval
             
-            return JsonResponse({
+            response = JsonResponse({
                 'success': True,
                 'message': 'Registration submitted successfully. Your account is pending admin approval.',
                 'employee_id': employee_id
             })
+            return clear_staff_ticket_cookie(response)
         else:
             error_message = 'Registration failed. '
             errors = []
@@ -431,16 +492,26 @@ class UserViewSet(viewsets.ReadOnlyModelViewSet):
     
     @action(detail=False, methods=['get'], permission_classes=[IsAuthenticated])
     def doctors(self, request):
-        """Get list of all staff (doctors) with their profiles"""
-        doctors = User.objects.filter(user_type='STAFF', is_active=True)
-        serializer = self.get_serializer(doctors, many=True)
-        return Response(serializer.data)
+        """Get list of all staff (doctors) with their profiles (cached snapshot)"""
+        def build():
+            doctors = directory_users().filter(user_type='STAFF', is_active=True)
+            return self.get_serializer(doctors, many=True).data
+        return cached_directory_response('users:doctors', build)
     
     @action(detail=False, methods=['get'], permission_classes=[IsAuthenticated])
     def me(self, request):
-        """Get current user's profile"""
+        """Get current user's profile (cached with the principal until the user or a profile changes)"""
+        principal = getattr(request.user, 'principal', None)
+        if principal:
+            data = principal_cache.get_payload(request.user.pk, 'me', principal['generation'])
+            if data is not None:
+                return Response(data)
+        
         serializer = self.get_serializer(request.user)
-        return Response(serializer.data)
+        data = serializer.data
+        if principal:
+            principal_cache.set_payload(request.user.pk, 'me', data, principal['generation'])
+        return Response(data)
 
 
 class DoctorProfileViewSet(viewsets.ModelViewSet):
@@ -459,7 +530,7 @@ class DoctorProfileViewSet(viewsets.ModelViewSet):
     
     def get_queryset(self):
         """Filter queryset based on user role"""
-        queryset = super().get_queryset()
+        queryset = super().get_queryset().select_related('user', 'branch').prefetch_related('schedules').order_by('pk')
         
         # Patients can see all doctor profiles
         if self.request.user.is_patient():
@@ -475,6 +546,86 @@ class DoctorProfileViewSet(viewsets.ModelViewSet):
         
         return queryset
     
+    def list(self, request, *args, **kwargs):
+        """Patients get a cached snapshot of each page; staff lists are per user"""
+        if not request.user.is_patient():
+            return super().list(request, *args, **kwargs)
+        
+        def build():
+            response = super(DoctorProfileViewSet, self).list(request, *args, **kwargs)
+            return response.data
+        # Every parameter can shape the page (and its next/previous links),
+        # so the key covers the whole query string in a canonical order
+        query = urlencode(sorted(
+            (name, value) for name, values in request.query_params.lists() for value in values
+        ))
+        query_hash = hashlib.sha256(query.encode('utf-8')).hexdigest()[:32]
+        return cached_directory_response(f'profiles:{request.get_host()}:{query_hash}', build)
+    
+    SEARCH_ORDERING = {
+        'next_slot': (F('next_free_slot').asc(nulls_last=True), 'pk'),
+        'fee': ('consultation_fee', 'pk'),
+        '-fee': ('-consultation_fee', 'pk'),
+        'experience': ('-years_of_experience', 'pk'),
+    }
+    
+    @action(detail=False, methods=['get'], permission_classes=[IsAuthenticated])
+    def search(self, request):
+        """
+        Search available doctors.
+        
+        Query parameters (all optional):
+            specialization: Exact specialization, e.g. Orthodontics
+            branch: Branch ID
+            min_fee, max_fee: Consultation fee bounds
+            available_within_days: Next free slot within N days (0 = today)
+            available_before: Next free slot on or before this date (YYYY-MM-DD)
+            sort: next_slot (default), fee, -fee or experience
+        
+        Filters and sorts on stored columns only, so each page is one
+        indexed query with no writes. next_free_slot is kept current by
+        appointments.signals and the schedule_reminders loop; slots that
+        have already passed never satisfy the availability filters.
+        """
+        params = DoctorSearchSerializer(data=request.query_params)
+        if not params.is_valid():
+            return Response({
+                'error': 'Invalid search parameters.',
+                'errors': params.errors
+            }, status=status.HTTP_400_BAD_REQUEST)
+        filters = params.validated_data
+        
+        now = timezone.now()
+        queryset = DoctorProfile.objects.filter(
+            is_available=True, user__is_active=True
+        ).select_related('user', 'branch')
+        if 'specialization' in filters:
+            queryset = queryset.filter(specialization=filters['specialization'])
+        if 'branch' in filters:
+            queryset = queryset.filter(branch_id=filters['branch'])
+        if 'min_fee' in filters:
+            queryset = queryset.filter(consultation_fee__gte=filters['min_fee'])
+        if 'max_fee' in filters:
+            queryset = queryset.filter(consultation_fee__lte=filters['max_fee'])
+        if 'available_within_days' in filters or 'available_before' in filters:
+            queryset = queryset.filter(next_free_slot__gte=now)
+        if 'available_within_days' in filters:
+            # Through the end of the last day, in server-local time
+            last_day = timezone.localdate(now) + timedelta(days=filters['available_within_days'])
+            queryset = queryset.filter(next_free_slot__lt=timezone.make_aware(
+                datetime.combine(last_day + timedelta(days=1), time.min)
+            ))
+        if 'available_before' in filters:
+            queryset = queryset.filter(next_free_slot__lt=timezone.make_aware(
+                datetime.combine(filters['available_before'] + timedelta(days=1), time.min)
+            ))
+        queryset = queryset.order_by(*self.SEARCH_ORDERING[filters['sort']])
+        
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(DoctorSearchResultSerializer(page, many=True).data)
+        return Response(DoctorSearchResultSerializer(queryset, many=True).data)
+    
     def perform_create(self, serializer):
         """Create doctor profile for current user"""
         serializer.save(user=self.request.user)
@@ -490,16 +641,20 @@ class BranchViewSet(viewsets.ReadOnlyModelViewSet):
     
     @action(detail=True, methods=['get'], permission_classes=[IsAuthenticated])
     def doctors(self, request, pk=None):
-        """Get all doctors in a specific branch"""
+        """Get all doctors in a specific branch (cached snapshot)"""
+        # Resolved first so an inactive or unknown branch is a 404 even when
+        # a snapshot for it is still cached
         branch = self.get_object()
-        doctors = User.objects.filter(
-            user_type='STAFF',
-            is_active=True,
-            doctor_profile__branch=branch,
-            doctor_profile__is_available=True
-        )
-        serializer = UserSerializer(doctors, many=True)
-        return Response(serializer.data)
+        
+        def build():
+            doctors = directory_users().filter(
+                user_type='STAFF',
+                is_active=True,
+                doctor_profile__branch=branch,
+                doctor_profile__is_available=True
+            )
+            return UserSerializer(doctors, many=True).data
+        return cached_directory_response(f'branch:{branch.pk}:doctors', build)
 
 
 class DoctorScheduleViewSet(viewsets.ModelViewSet):
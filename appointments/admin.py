@@ -2,19 +2,39 @@
 Admin configuration for appointments app
 """
 from django.contrib import admin
-from .models import Appointment
+from accounts.models import DoctorProfile
+from clinic_appointment.admin_utils import LargeTableAdmin
+from .models import Appointment, AppointmentReminder, VisitHistoryOutbox
+
+
+class DoctorListFilter(admin.SimpleListFilter):
+    """Filter by doctor, offering only users with a doctor profile (not every user)"""
+    title = 'doctor'
+    parameter_name = 'doctor__id__exact'
+    
+    def lookups(self, request, model_admin):
+        doctors = DoctorProfile.objects.select_related('user').order_by('user__first_name', 'user__last_name')
+        return [(doctor.user_id, doctor.user.get_full_name() or doctor.user.email) for doctor in doctors]
+    
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(doctor_id=self.value())
+        return queryset
 
 
 @admin.register(Appointment)
-class AppointmentAdmin(admin.ModelAdmin):
+class AppointmentAdmin(LargeTableAdmin):
     """Custom admin for Appointment model with enhanced filters and search"""
     list_display = ('id', 'patient_name', 'doctor_name', 'branch', 'appointment_date', 
                     'appointment_time', 'status', 'is_past_display', 'created_at')
-    list_filter = ('status', 'appointment_date', 'created_at', 'doctor', 'branch')
+    # Date filters need no query; the doctor filter lists doctors only. No
+    # date_hierarchy: its year/month links run SELECT DISTINCT over the table.
+    list_filter = ('status', 'appointment_date', 'created_at', DoctorListFilter, 'branch')
+    list_select_related = ('patient', 'doctor', 'branch')
     search_fields = ('patient__email', 'patient__first_name', 'patient__last_name',
                      'doctor__email', 'doctor__first_name', 'doctor__last_name',
                      'reason', 'notes', 'branch__name')
-    date_hierarchy = 'appointment_date'
+    autocomplete_fields = ('patient', 'doctor', 'branch')
     readonly_fields = ('created_at', 'updated_at', 'is_past_display')
     list_per_page = 50
     ordering = ('-appointment_date', '-appointment_time')
@@ -33,7 +53,7 @@ class AppointmentAdmin(admin.ModelAdmin):
     
     def is_past_display(self, obj):
         """Display if appointment is past"""
-        return "Yes" if obj.is_past() else "No"
+        return obj.is_past()
     is_past_display.short_description = 'Past'
     is_past_display.boolean = True
     
@@ -49,10 +69,29 @@ class AppointmentAdmin(admin.ModelAdmin):
             'classes': ('collapse',)
         }),
     )
-    
-    def get_queryset(self, request):
-        """Optimize queryset with select_related"""
-        qs = super().get_queryset(request)
-        return qs.select_related('patient', 'doctor')
 
 
+
+
+@admin.register(VisitHistoryOutbox)
+class VisitHistoryOutboxAdmin(LargeTableAdmin):
+    """Admin for monitoring visit history delivery to MongoDB"""
+    list_display = ('id', 'appointment', 'status', 'attempts', 'next_attempt_at', 'created_at', 'sent_at')
+    list_select_related = ('appointment__patient', 'appointment__doctor', 'appointment__branch')
+    list_filter = ('status',)
+    search_fields = ('appointment__id', 'last_error')
+    raw_id_fields = ('appointment',)
+    readonly_fields = ('created_at', 'sent_at', 'last_error')
+    list_per_page = 50
+
+
+@admin.register(AppointmentReminder)
+class AppointmentReminderAdmin(LargeTableAdmin):
+    """Admin for monitoring appointment reminders"""
+    list_display = ('id', 'appointment', 'window', 'scheduled_for', 'status', 'created_at', 'sent_at')
+    list_select_related = ('appointment__patient', 'appointment__doctor', 'appointment__branch')
+    list_filter = ('status', 'window')
+    search_fields = ('appointment__id',)
+    raw_id_fields = ('appointment',)
+    readonly_fields = ('created_at', 'sent_at')
+    list_per_page = 50
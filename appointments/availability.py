@@ -2,6 +2,7 @@
 Utility functions for calculating doctor availability and time slots
 """
 from datetime import date, datetime, time, timedelta
+from decouple import config
 from django.utils import timezone
 from accounts.models import DoctorSchedule, DoctorProfile
 from .models import Appointment
@@ -166,3 +167,127 @@ def get_doctor_availability(doctor_id, start_date=None, end_date=None, days_ahea
     
     return availability
 
+
+# ============================================================================
+# Precomputed next free slot (DoctorProfile.next_free_slot) for doctor search
+# ============================================================================
+
+NEXT_FREE_SLOT_HORIZON_DAYS = config('NEXT_FREE_SLOT_HORIZON_DAYS', default=30, cast=int)
+SLOT_DURATION_MINUTES = 30
+# Doctors whose stored slot has passed, recomputed per sweep at most
+STALE_SLOT_REFRESH_LIMIT = 200
+
+
+def _slot_times(start_time, end_time, slot_duration_minutes=SLOT_DURATION_MINUTES):
+    """Slot start times from start_time (inclusive) to end_time (exclusive)"""
+    current = datetime.combine(date.today(), start_time)
+    end = datetime.combine(date.today(), end_time)
+    while current < end:
+        yield current.time()
+        current += timedelta(minutes=slot_duration_minutes)
+
+
+def compute_next_free_slots(profiles, now=None, horizon_days=NEXT_FREE_SLOT_HORIZON_DAYS):
+    """
+    Find each doctor's earliest unbooked slot within the horizon.
+    
+    Uses the same slots as get_available_time_slots: every 30 minutes of
+    the doctor's schedule for that weekday, minus non-cancelled bookings.
+    Bookings for all profiles are loaded in one query.
+    
+    Args:
+        profiles: DoctorProfile objects with `schedules` prefetched
+        now (datetime): Aware current time (default: now)
+        horizon_days (int): Days ahead to search
+        
+    Returns:
+        dict: DoctorProfile pk -> aware datetime, or None if fully booked
+    """
+    local_now = timezone.localtime(now or timezone.now()).replace(tzinfo=None)
+    first_day = local_now.date()
+    last_day = first_day + timedelta(days=horizon_days)
+    
+    booked = {}
+    for doctor_id, day, start in Appointment.objects.filter(
+        doctor_id__in=[profile.user_id for profile in profiles],
+        appointment_date__range=(first_day, last_day)
+    ).exclude(status='CANCELLED').values_list('doctor_id', 'appointment_date', 'appointment_time'):
+        booked.setdefault(doctor_id, set()).add((day, start))
+    
+    slots = {}
+    for profile in profiles:
+        schedules = {s.day_of_week: s for s in profile.schedules.all() if s.is_available}
+        taken = booked.get(profile.user_id, set())
+        slots[profile.pk] = None
+        for offset in range(horizon_days + 1) if schedules else ():
+            day = first_day + timedelta(days=offset)
+            schedule = schedules.get(day.weekday())
+            if schedule is None:
+                continue
+            free = next((
+                slot for slot in _slot_times(schedule.start_time, schedule.end_time)
+                if (day, slot) not in taken and datetime.combine(day, slot) > local_now
+            ), None)
+            if free is not None:
+                slots[profile.pk] = timezone.make_aware(datetime.combine(day, free))
+                break
+    return slots
+
+
+def refresh_next_free_slots(profiles_queryset, now=None):
+    """
+    Recompute and store next_free_slot for the given doctor profiles.
+    
+    Written with bulk_update, so it sends no signals and doesn't invalidate
+    the doctor directory (which doesn't include the slot).
+    
+    Returns:
+        int: Profiles updated
+    """
+    profiles = list(profiles_queryset.prefetch_related('schedules'))
+    if not profiles:
+        return 0
+    slots = compute_next_free_slots(profiles, now)
+    changed = [profile for profile in profiles if profile.next_free_slot != slots[profile.pk]]
+    for profile in changed:
+        profile.next_free_slot = slots[profile.pk]
+    DoctorProfile.objects.bulk_update(changed, ['next_free_slot'], batch_size=500)
+    return len(changed)
+
+
+def refresh_stale_next_free_slots(now=None, limit=STALE_SLOT_REFRESH_LIMIT):
+    """
+    Recompute next_free_slot for doctors whose stored slot has passed.
+    
+    Run every pass of the schedule_reminders loop; the oldest slots go
+    first, so a backlog beyond `limit` drains over the next passes.
+    
+    Returns:
+        int: Profiles updated
+    """
+    now = now or timezone.now()
+    stale = DoctorProfile.objects.filter(next_free_slot__lt=now).order_by('next_free_slot')
+    return refresh_next_free_slots(stale[:limit], now)
+
+
+def refresh_all_next_free_slots(batch_size=200, now=None):
+    """
+    Recompute next_free_slot for every doctor, in pk-ordered batches.
+    
+    Moves the horizon forward for doctors with no free slot inside it, whom
+    neither bookings nor the stale sweep touch. Run daily.
+    
+    Returns:
+        int: Profiles updated
+    """
+    last_pk = 0
+    updated = 0
+    while True:
+        ids = list(
+            DoctorProfile.objects.filter(pk__gt=last_pk).order_by('pk')
+            .values_list('pk', flat=True)[:batch_size]
+        )
+        if not ids:
+            return updated
+        updated += refresh_next_free_slots(DoctorProfile.objects.filter(pk__in=ids), now)
+        last_pk = ids[-1]
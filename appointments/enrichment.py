@@ -0,0 +1,87 @@
+"""
+Batched enrichment of MongoDB visit history records with PostgreSQL data.
+
+Visit records only carry patient_id, doctor_id and appointment_id. Instead of
+clients looking each one up separately, the enricher collects the IDs for a
+page of records and runs one in_bulk() query per table.
+"""
+from django.contrib.auth import get_user_model
+from accounts.models import Branch
+from .models import Appointment
+
+User = get_user_model()
+
+
+class VisitRecordEnricher:
+    """
+    Attach patient, doctor, appointment and branch details to visit records.
+    
+    An instance is meant to live for one request: rows already fetched are
+    memoized, so enriching several batches never queries the same ID twice.
+    """
+    
+    def __init__(self):
+        self.users = {}
+        self.appointments = {}
+        self.branches = {}
+    
+    def _load(self, memo, queryset, ids):
+        """Fetch IDs missing from memo with a single IN query"""
+        missing = {pk for pk in ids if pk is not None and pk not in memo}
+        if missing:
+            memo.update(queryset.in_bulk(missing))
+            # Remember misses too so deleted rows aren't re-queried
+            for pk in missing:
+                memo.setdefault(pk, None)
+    
+    def enrich(self, records):
+        """
+        Add 'patient', 'doctor', 'appointment' and 'branch' keys to each record.
+        
+        Args:
+            records (list): Visit history dicts (modified in place)
+            
+        Returns:
+            list: The same records
+        """
+        self._load(
+            self.users,
+            User.objects.only('id', 'first_name', 'last_name', 'email'),
+            {r.get('patient_id') for r in records} | {r.get('doctor_id') for r in records}
+        )
+        self._load(
+            self.appointments,
+            Appointment.objects.only('id', 'appointment_time', 'status', 'reason', 'branch_id'),
+            {r.get('appointment_id') for r in records}
+        )
+        self._load(
+            self.branches,
+            Branch.objects.only('id', 'name'),
+            {apt.branch_id for apt in self.appointments.values() if apt is not None}
+        )
+        
+        for record in records:
+            appointment = self.appointments.get(record.get('appointment_id'))
+            branch = self.branches.get(appointment.branch_id) if appointment else None
+            record['patient'] = self._user_summary(record.get('patient_id'))
+            record['doctor'] = self._user_summary(record.get('doctor_id'))
+            record['appointment'] = {
+                'id': appointment.id,
+                'appointment_time': appointment.appointment_time,
+                'status': appointment.status,
+                'reason': appointment.reason,
+            } if appointment else None
+            record['branch'] = {'id': branch.id, 'name': branch.name} if branch else None
+        
+        return records
+    
+    def _user_summary(self, user_id):
+        """Name and email for a memoized user, or None"""
+        user = self.users.get(user_id)
+        if user is None:
+            return None
+        return {
+            'id': user.id,
+            'name': user.get_full_name() or user.email,
+            'email': user.email,
+        }
@@ -0,0 +1,47 @@
+"""
+Move old visit history records into the compressed archive collection.
+
+Usage:
+    python manage.py archive_visit_history
+    python manage.py archive_visit_history --dry-run
+
+The age is set by MONGODB_ARCHIVE_AFTER_DAYS, which the read functions also
+use to decide when to look in the archive, so the two always agree.
+"""
+from django.core.management.base import BaseCommand
+from appointments.mongo import (
+    archive_cutoff,
+    archive_visit_history_batch,
+    ensure_visit_history_archive,
+    get_visit_history_collection
+)
+
+
+class Command(BaseCommand):
+    help = 'Move visit history older than MONGODB_ARCHIVE_AFTER_DAYS into the archive collection, in chunks'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Documents moved per chunk (default: 1000)')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only count the records that would be archived')
+    
+    def handle(self, *args, **options):
+        cutoff = archive_cutoff()
+        
+        if options['dry_run']:
+            count = get_visit_history_collection().count_documents({'visit_date': {'$lt': cutoff}})
+            self.stdout.write(f'{count} record(s) older than {cutoff.date()} would be archived.')
+            return
+        
+        ensure_visit_history_archive()
+        
+        total = 0
+        while True:
+            moved = archive_visit_history_batch(cutoff, options['batch_size'])
+            if not moved:
+                break
+            total += moved
+            self.stdout.write(f'Archived {total} record(s)...')
+        
+        self.stdout.write(self.style.SUCCESS(f'Done. {total} record(s) older than {cutoff.date()} archived.'))
@@ -0,0 +1,30 @@
+"""
+Parse structured prescriptions for visit history records written before
+they existed.
+
+Usage:
+    python manage.py backfill_prescriptions [--batch-size 500]
+"""
+from django.core.management.base import BaseCommand
+from appointments.mongo import backfill_prescriptions_batch, ensure_visit_history_indexes
+
+
+class Command(BaseCommand):
+    help = 'Add structured prescription records to existing visit history documents'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Documents updated per chunk (default: 500)')
+    
+    def handle(self, *args, **options):
+        ensure_visit_history_indexes()
+        
+        total = 0
+        while True:
+            updated = backfill_prescriptions_batch(options['batch_size'])
+            if not updated:
+                break
+            total += updated
+            self.stdout.write(f'Backfilled {total} record(s)...')
+        
+        self.stdout.write(self.style.SUCCESS(f'Done. {total} record(s) backfilled.'))
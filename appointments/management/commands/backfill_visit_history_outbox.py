@@ -0,0 +1,79 @@
+"""
+Copy visit history written before the outbox existed into the outbox table.
+
+Usage:
+    python manage.py backfill_visit_history_outbox [--batch-size 500]
+
+Records from both MongoDB tiers whose appointment exists in PostgreSQL but has
+no outbox row are added as SENT rows, so the relay never sends them again. On
+SQLite the insert triggers of the FTS5 mirror index them, which makes local
+search cover history that only existed in MongoDB. Safe to re-run.
+"""
+from datetime import datetime
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from pymongo.errors import PyMongoError
+from appointments.models import Appointment, VisitHistoryOutbox
+from appointments.mongo import MongoUnavailable, get_visit_history_page
+
+
+class Command(BaseCommand):
+    help = 'Add outbox rows (and FTS5 search entries) for visit history that only exists in MongoDB'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Records read per tier per chunk (default: 500)')
+
+    def handle(self, *args, **options):
+        last_id = 0
+        total = 0
+
+        try:
+            while True:
+                docs = get_visit_history_page(last_id, options['batch_size'])
+                if not docs:
+                    break
+                last_id = docs[-1]['appointment_id']
+                total += self._backfill(docs)
+                self.stdout.write(f'Checked up to appointment {last_id}, {total} row(s) added...')
+        except (MongoUnavailable, PyMongoError) as e:
+            raise CommandError(f'MongoDB error during backfill: {e}. Re-run to continue.')
+
+        self.stdout.write(self.style.SUCCESS(f'Done. {total} outbox row(s) added.'))
+
+    def _backfill(self, docs):
+        """Create SENT outbox rows for records whose appointment has none"""
+        owners = {
+            appointment_id: (patient_id, doctor_id)
+            for appointment_id, patient_id, doctor_id in
+            Appointment.objects.filter(
+                id__in={doc['appointment_id'] for doc in docs},
+                visit_history_outbox__isnull=True
+            ).values_list('id', 'patient_id', 'doctor_id')
+        }
+
+        now = timezone.now()
+        entries = {}
+        for doc in docs:
+            appointment_id = doc['appointment_id']
+            # The first record wins if an appointment has one in each tier
+            if appointment_id not in owners or appointment_id in entries:
+                continue
+            visit_date = doc.get('visit_date')
+            if isinstance(visit_date, datetime):
+                visit_date = visit_date.date()
+            patient_id, doctor_id = owners[appointment_id]
+            entries[appointment_id] = VisitHistoryOutbox(
+                appointment_id=appointment_id,
+                patient_id=patient_id,
+                doctor_id=doctor_id,
+                visit_date=visit_date,
+                notes=doc.get('notes') or '',
+                prescription=doc.get('prescription') or '',
+                status='SENT',
+                sent_at=now
+            )
+
+        # ignore_conflicts: a request may add an outbox row while we run
+        VisitHistoryOutbox.objects.bulk_create(entries.values(), ignore_conflicts=True)
+        return len(entries)
@@ -0,0 +1,71 @@
+"""
+Compare the list and streaming read paths for visit history.
+
+Usage:
+    python manage.py benchmark_visit_history                 # all records (admin view)
+    python manage.py benchmark_visit_history --doctor-id 3
+    python manage.py benchmark_visit_history --patient-id 7 --repeat 10
+"""
+import time
+import tracemalloc
+from inspect import unwrap
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+from appointments.mongo import (
+    get_visit_history_by_patient,
+    get_visit_history_by_doctor,
+    get_all_visit_history,
+    stream_visit_history_json
+)
+from appointments.serializers import VisitHistorySerializer
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the serializer-based visit history path against the streaming path'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--patient-id', type=int, help='Benchmark one patient\'s history')
+        parser.add_argument('--doctor-id', type=int, help='Benchmark one doctor\'s history')
+        parser.add_argument('--repeat', type=int, default=5, help='Runs per path (default: 5)')
+    
+    def handle(self, *args, **options):
+        patient_id = options['patient_id']
+        doctor_id = options['doctor_id']
+        
+        # unwrap() skips the read cache and circuit breaker so every run
+        # really hits MongoDB and nothing large is left cached
+        if patient_id is not None:
+            fetch = lambda: unwrap(get_visit_history_by_patient)(patient_id)
+            query = {'patient_id': patient_id}
+        elif doctor_id is not None:
+            fetch = lambda: unwrap(get_visit_history_by_doctor)(doctor_id)
+            query = {'doctor_id': doctor_id}
+        else:
+            fetch = unwrap(get_all_visit_history)
+            query = {}
+        
+        def current_path():
+            records = fetch()
+            return len(JSONRenderer().render(VisitHistorySerializer(records, many=True).data))
+        
+        def streaming_path():
+            return sum(len(chunk) for chunk in stream_visit_history_json(query))
+        
+        for name, func in (('serializer', current_path), ('streaming', streaming_path)):
+            timings = []
+            peak = 0
+            size = 0
+            for _ in range(options['repeat']):
+                tracemalloc.start()
+                started = time.perf_counter()
+                size = func()
+                timings.append(time.perf_counter() - started)
+                peak = max(peak, tracemalloc.get_traced_memory()[1])
+                tracemalloc.stop()
+            
+            timings.sort()
+            self.stdout.write(
+                f"{name:<10} bytes={size:<10} "
+                f"best={timings[0] * 1000:.1f}ms median={timings[len(timings) // 2] * 1000:.1f}ms "
+                f"peak_mem={peak / 1024:.0f}KiB"
+            )
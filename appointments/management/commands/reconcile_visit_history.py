@@ -0,0 +1,107 @@
+"""
+Check MongoDB visit history against PostgreSQL appointments.
+
+Usage:
+    python manage.py reconcile_visit_history
+    python manage.py reconcile_visit_history --report issues.ndjson
+    python manage.py reconcile_visit_history --repair --checkpoint reconcile.json --resume
+
+Both stores are read in appointment_id order in chunks, so the run uses
+constant memory. With --checkpoint the last reconciled appointment_id is
+saved after every chunk, and --resume continues from it after an
+interruption (e.g. MongoDB going away mid-run).
+"""
+import json
+import os
+from django.core.management.base import BaseCommand, CommandError
+from pymongo.errors import PyMongoError
+from appointments.mongo import MongoUnavailable, count_visit_history_without_appointment
+from appointments.reconcile import VisitHistoryReconciler
+
+ISSUE_KINDS = ('orphan', 'mismatch', 'duplicate', 'undelivered', 'missing')
+
+
+class Command(BaseCommand):
+    help = 'Merge-join PostgreSQL appointments against MongoDB visit history and report (or repair) discrepancies'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=5000,
+                            help='Appointments compared per chunk (default: 5000)')
+        parser.add_argument('--repair', action='store_true',
+                            help='Fix patient/doctor mismatches and requeue undelivered outbox rows')
+        parser.add_argument('--delete-orphans', action='store_true',
+                            help='With --repair, also delete Mongo records whose appointment no longer exists')
+        parser.add_argument('--checkpoint', help='File to save progress to after every chunk')
+        parser.add_argument('--resume', action='store_true',
+                            help='Continue from the appointment_id saved in --checkpoint')
+        parser.add_argument('--report', help='Write every discrepancy to this file as JSON lines')
+        parser.add_argument('--max-examples', type=int, default=10,
+                            help='Discrepancies printed to the console (default: 10)')
+
+    def handle(self, *args, **options):
+        if options['delete_orphans'] and not options['repair']:
+            raise CommandError('--delete-orphans requires --repair.')
+        if options['resume'] and not options['checkpoint']:
+            raise CommandError('--resume requires --checkpoint.')
+
+        start_after = 0
+        if options['resume'] and os.path.exists(options['checkpoint']):
+            with open(options['checkpoint']) as f:
+                start_after = json.load(f)['last_appointment_id']
+            self.stdout.write(f'Resuming after appointment {start_after}.')
+
+        report = open(options['report'], 'a' if options['resume'] else 'w') if options['report'] else None
+        examples = []
+
+        def on_issue(issue):
+            if report:
+                report.write(json.dumps(issue, default=str) + '\n')
+            if len(examples) < options['max_examples']:
+                examples.append(issue)
+
+        def on_chunk(last_appointment_id, counts):
+            if report:
+                report.flush()
+            if options['checkpoint']:
+                tmp_path = options['checkpoint'] + '.tmp'
+                with open(tmp_path, 'w') as f:
+                    json.dump({'last_appointment_id': last_appointment_id, 'counts': dict(counts)}, f)
+                os.replace(tmp_path, options['checkpoint'])
+            self.stdout.write(
+                f"Checked up to appointment {last_appointment_id} "
+                f"({counts['appointments']} appointment(s), {counts['records']} record(s))"
+            )
+
+        reconciler = VisitHistoryReconciler(
+            chunk_size=options['chunk_size'],
+            repair=options['repair'],
+            delete_orphans=options['delete_orphans'],
+            on_issue=on_issue
+        )
+
+        try:
+            counts = reconciler.run(start_after, on_chunk=on_chunk)
+            unkeyed = count_visit_history_without_appointment()
+        except (MongoUnavailable, PyMongoError) as e:
+            hint = ' Re-run with --resume to continue.' if options['checkpoint'] else ''
+            raise CommandError(f'MongoDB error during reconciliation: {e}.{hint}')
+        finally:
+            if report:
+                report.close()
+
+        for issue in examples:
+            self.stdout.write(json.dumps(issue, default=str))
+
+        summary = ', '.join(f'{counts[kind]} {kind}' for kind in ISSUE_KINDS)
+        self.stdout.write(f'Discrepancies: {summary}.')
+        if unkeyed:
+            self.stdout.write(self.style.WARNING(f'{unkeyed} record(s) have no numeric appointment_id.'))
+        if options['repair']:
+            self.stdout.write(
+                f"Repaired: {counts['fixed']} fixed, {counts['requeued']} requeued, {counts['deleted']} deleted."
+            )
+
+        if any(counts[kind] for kind in ISSUE_KINDS):
+            self.stdout.write(self.style.WARNING('Reconciliation finished with discrepancies.'))
+        else:
+            self.stdout.write(self.style.SUCCESS('Stores are consistent.'))
@@ -0,0 +1,25 @@
+"""
+Recompute every doctor's next free slot.
+
+Bookings and schedule changes refresh it as they happen, and the
+schedule_reminders process runs the same refresh daily so the 30-day
+horizon moves forward for doctors with no slot inside it. Run this by hand
+or after deploys.
+
+Usage:
+    python manage.py refresh_doctor_slots
+"""
+from django.core.management.base import BaseCommand
+from appointments.availability import refresh_all_next_free_slots
+
+
+class Command(BaseCommand):
+    help = "Recompute DoctorProfile.next_free_slot for all doctors"
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=200,
+                            help='Doctors per batch (default: 200)')
+    
+    def handle(self, *args, **options):
+        updated = refresh_all_next_free_slots(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Updated next free slot for {updated} doctor(s).'))
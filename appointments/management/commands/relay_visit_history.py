@@ -0,0 +1,47 @@
+"""
+Drain the visit history outbox into MongoDB.
+
+Usage:
+    python manage.py relay_visit_history            # run continuously
+    python manage.py relay_visit_history --once     # drain what is due and exit
+"""
+import time
+from django.core.management.base import BaseCommand
+from appointments.mongo import MongoUnavailable, ensure_visit_history_indexes
+from appointments.outbox import relay_outbox_batch
+
+
+class Command(BaseCommand):
+    help = 'Relay pending visit history records from the PostgreSQL outbox to MongoDB'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100,
+                            help='Records per insert_many call (default: 100)')
+        parser.add_argument('--interval', type=float, default=2.0,
+                            help='Seconds to sleep when the outbox is empty (default: 2)')
+        parser.add_argument('--once', action='store_true',
+                            help='Drain all due records and exit')
+    
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        
+        try:
+            ensure_visit_history_indexes()
+        except MongoUnavailable as e:
+            self.stderr.write(self.style.WARNING(f'Could not ensure Mongo indexes: {e}'))
+        
+        while True:
+            stats = relay_outbox_batch(batch_size)
+            delivered = sum(stats.values())
+            if delivered:
+                self.stdout.write(
+                    f"sent={stats['sent']} duplicate={stats['duplicate']} "
+                    f"retried={stats['retried']} failed={stats['failed']} deferred={stats['deferred']}"
+                )
+            
+            # A full batch means more is probably waiting; otherwise back off
+            if stats['sent'] + stats['duplicate'] == batch_size:
+                continue
+            if options['once']:
+                break
+            time.sleep(options['interval'])
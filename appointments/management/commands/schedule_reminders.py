@@ -0,0 +1,59 @@
+"""
+Queue appointment reminders as appointments enter each reminder window.
+
+Usage:
+    python manage.py schedule_reminders                    # run continuously
+    python manage.py schedule_reminders --once             # one pass and exit
+    python manage.py schedule_reminders --windows 24h,2h
+
+Reminders are delivered by the job worker (python manage.py runworker).
+
+The same loop keeps doctor search current: every pass recomputes next free
+slots that have passed, and every SLOT_REFRESH_INTERVAL (and at startup)
+all of them are recomputed so the search horizon moves forward.
+"""
+import time
+from django.core.management.base import BaseCommand, CommandError
+from appointments.availability import refresh_all_next_free_slots, refresh_stale_next_free_slots
+from appointments.reminders import APPOINTMENT_REMINDER_WINDOWS, parse_windows, schedule_reminders
+
+# Seconds between full next-free-slot refreshes
+SLOT_REFRESH_INTERVAL = 86400
+
+
+class Command(BaseCommand):
+    help = 'Queue reminders for UPCOMING appointments entering their reminder windows'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--windows', default=APPOINTMENT_REMINDER_WINDOWS,
+                            help=f'Comma-separated windows (default: {APPOINTMENT_REMINDER_WINDOWS})')
+        parser.add_argument('--interval', type=float, default=60.0,
+                            help='Seconds between passes (default: 60)')
+        parser.add_argument('--once', action='store_true',
+                            help='Run one pass and exit')
+    
+    def handle(self, *args, **options):
+        try:
+            windows = parse_windows(options['windows'])
+        except ValueError as e:
+            raise CommandError(str(e))
+        if not windows:
+            raise CommandError('No reminder windows configured.')
+        
+        last_slot_refresh = None
+        while True:
+            queued = schedule_reminders(windows)
+            if any(queued.values()):
+                self.stdout.write(' '.join(f'{label}={count}' for label, count in queued.items()))
+            
+            now = time.monotonic()
+            if last_slot_refresh is None or now - last_slot_refresh >= SLOT_REFRESH_INTERVAL:
+                updated = refresh_all_next_free_slots()
+                self.stdout.write(f'Refreshed next free slot for {updated} doctor(s)')
+                last_slot_refresh = now
+            else:
+                refresh_stale_next_free_slots()
+            
+            if options['once']:
+                break
+            time.sleep(options['interval'])
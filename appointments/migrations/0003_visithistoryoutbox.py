@@ -0,0 +1,39 @@
+# Generated by Django 4.2.7 on 2026-10-19 19:15
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0002_appointment_branch_alter_appointment_status_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VisitHistoryOutbox',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('patient_id', models.BigIntegerField()),
+                ('doctor_id', models.BigIntegerField()),
+                ('visit_date', models.DateField()),
+                ('notes', models.TextField(blank=True, default='')),
+                ('prescription', models.JSONField(blank=True, default=str, help_text='String or list, as submitted')),
+                ('status', models.CharField(choices=[('PENDING', 'Pending'), ('SENT', 'Sent'), ('DUPLICATE', 'Duplicate'), ('FAILED', 'Failed')], default='PENDING', max_length=10)),
+                ('attempts', models.IntegerField(default=0)),
+                ('last_error', models.TextField(blank=True, null=True)),
+                ('next_attempt_at', models.DateTimeField(auto_now_add=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('sent_at', models.DateTimeField(blank=True, null=True)),
+                ('appointment', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='visit_history_outbox', to='appointments.appointment')),
+            ],
+            options={
+                'verbose_name': 'Visit History Outbox Entry',
+                'verbose_name_plural': 'Visit History Outbox',
+                'db_table': 'visit_history_outbox',
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['status', 'next_attempt_at'], name='visit_histo_status_cd4a97_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,72 @@
+"""
+SQLite FTS5 mirror of visit history notes and prescriptions.
+
+Only created on SQLite (local development), where visit history search runs
+against this index instead of MongoDB. Triggers keep it in sync with the
+visit_history_outbox table.
+"""
+from django.db import migrations
+
+
+CREATE_SQL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS visit_history_fts USING fts5(
+        notes, prescription,
+        content='visit_history_outbox', content_rowid='id'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS visit_history_fts_ai AFTER INSERT ON visit_history_outbox BEGIN
+        INSERT INTO visit_history_fts(rowid, notes, prescription)
+        VALUES (new.id, new.notes, new.prescription);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS visit_history_fts_ad AFTER DELETE ON visit_history_outbox BEGIN
+        INSERT INTO visit_history_fts(visit_history_fts, rowid, notes, prescription)
+        VALUES ('delete', old.id, old.notes, old.prescription);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS visit_history_fts_au AFTER UPDATE OF notes, prescription ON visit_history_outbox BEGIN
+        INSERT INTO visit_history_fts(visit_history_fts, rowid, notes, prescription)
+        VALUES ('delete', old.id, old.notes, old.prescription);
+        INSERT INTO visit_history_fts(rowid, notes, prescription)
+        VALUES (new.id, new.notes, new.prescription);
+    END
+    """,
+    # Index rows that existed before the mirror
+    "INSERT INTO visit_history_fts(visit_history_fts) VALUES ('rebuild')",
+]
+
+DROP_SQL = [
+    "DROP TRIGGER IF EXISTS visit_history_fts_au",
+    "DROP TRIGGER IF EXISTS visit_history_fts_ad",
+    "DROP TRIGGER IF EXISTS visit_history_fts_ai",
+    "DROP TABLE IF EXISTS visit_history_fts",
+]
+
+
+def create_fts(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for statement in CREATE_SQL:
+        schema_editor.execute(statement)
+
+
+def drop_fts(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for statement in DROP_SQL:
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0003_visithistoryoutbox'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fts, drop_fts),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 4.2.7 on 2026-10-19 19:47
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0004_visit_history_fts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AppointmentReminder',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('window', models.CharField(help_text='Reminder window label, e.g. 24h', max_length=10)),
+                ('scheduled_for', models.DateTimeField(help_text='Appointment start when the reminder was queued')),
+                ('status', models.CharField(choices=[('QUEUED', 'Queued'), ('SENT', 'Sent'), ('SKIPPED', 'Skipped')], default='QUEUED', max_length=10)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('sent_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Appointment Reminder',
+                'verbose_name_plural': 'Appointment Reminders',
+                'db_table': 'appointment_reminders',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ReminderWindowState',
+            fields=[
+                ('window', models.CharField(max_length=10, primary_key=True, serialize=False)),
+                ('scanned_until', models.DateTimeField()),
+            ],
+            options={
+                'db_table': 'reminder_window_state',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['appointment_date', 'appointment_time', 'status'], name='appointment_appoint_9a247a_idx'),
+        ),
+        migrations.AddField(
+            model_name='appointmentreminder',
+            name='appointment',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reminders', to='appointments.appointment'),
+        ),
+        migrations.AddConstraint(
+            model_name='appointmentreminder',
+            constraint=models.UniqueConstraint(fields=('appointment', 'window'), name='unique_reminder_per_window'),
+        ),
+    ]
@@ -42,6 +42,8 @@ class Appointment(models.Model):
             models.Index(fields=['patient', 'appointment_date']),
             models.Index(fields=['doctor', 'appointment_date']),
             models.Index(fields=['branch', 'appointment_date']),
+            # Reminder scheduler: range scan over start date/time of UPCOMING appointments
+            models.Index(fields=['appointment_date', 'appointment_time', 'status']),
         ]
     
     def __str__(self):
@@ -85,3 +87,107 @@ class Appointment(models.Model):
         self.full_clean()
         super().save(*args, **kwargs)
 
+
+
+class VisitHistoryOutbox(models.Model):
+    """
+    Transactional outbox for visit history records.
+    
+    add_visit_history writes here inside the request transaction; the
+    relay_visit_history command drains pending rows into MongoDB in batches.
+    One row per appointment keeps delivery idempotent.
+    """
+    STATUS_CHOICES = [
+        ('PENDING', 'Pending'),
+        ('SENT', 'Sent'),
+        ('DUPLICATE', 'Duplicate'),  # A Mongo record already existed for the appointment
+        ('FAILED', 'Failed'),  # Gave up after MAX_ATTEMPTS
+    ]
+    MAX_ATTEMPTS = 10
+    
+    appointment = models.OneToOneField(Appointment, on_delete=models.CASCADE, related_name='visit_history_outbox')
+    patient_id = models.BigIntegerField()
+    doctor_id = models.BigIntegerField()
+    visit_date = models.DateField()
+    notes = models.TextField(blank=True, default='')
+    prescription = models.JSONField(blank=True, default=str, help_text="String or list, as submitted")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='PENDING')
+    attempts = models.IntegerField(default=0)
+    last_error = models.TextField(blank=True, null=True)
+    next_attempt_at = models.DateTimeField(auto_now_add=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(blank=True, null=True)
+    
+    class Meta:
+        db_table = 'visit_history_outbox'
+        verbose_name = 'Visit History Outbox Entry'
+        verbose_name_plural = 'Visit History Outbox'
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at']),
+        ]
+    
+    def __str__(self):
+        return f"Visit history for appointment {self.appointment_id} ({self.status})"
+    
+    def as_visit_record(self):
+        """Return the document shape stored in MongoDB"""
+        return {
+            'appointment_id': self.appointment_id,
+            'patient_id': self.patient_id,
+            'doctor_id': self.doctor_id,
+            'visit_date': self.visit_date,
+            'notes': self.notes or '',
+            'prescription': self.prescription or '',
+        }
+
+
+class AppointmentReminder(models.Model):
+    """
+    Sent marker for one reminder window of one appointment.
+    
+    The reminder scheduler creates the row (QUEUED) together with the job that
+    delivers it. The unique (appointment, window) pair guarantees a reminder
+    is queued at most once, however often or concurrently the scheduler runs.
+    """
+    STATUS_CHOICES = [
+        ('QUEUED', 'Queued'),
+        ('SENT', 'Sent'),
+        ('SKIPPED', 'Skipped'),  # Appointment cancelled, moved or already started
+    ]
+    
+    appointment = models.ForeignKey(Appointment, on_delete=models.CASCADE, related_name='reminders')
+    window = models.CharField(max_length=10, help_text="Reminder window label, e.g. 24h")
+    scheduled_for = models.DateTimeField(help_text="Appointment start when the reminder was queued")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='QUEUED')
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(blank=True, null=True)
+    
+    class Meta:
+        db_table = 'appointment_reminders'
+        verbose_name = 'Appointment Reminder'
+        verbose_name_plural = 'Appointment Reminders'
+        ordering = ['-created_at']
+        constraints = [
+            models.UniqueConstraint(fields=['appointment', 'window'], name='unique_reminder_per_window'),
+        ]
+    
+    def __str__(self):
+        return f"{self.window} reminder for appointment {self.appointment_id} ({self.status})"
+
+
+class ReminderWindowState(models.Model):
+    """
+    How far ahead each reminder window has been scanned.
+    
+    Each scheduler run only scans appointments starting between scanned_until
+    and now + window, i.e. those that entered the window since the last run.
+    """
+    window = models.CharField(max_length=10, primary_key=True)
+    scanned_until = models.DateTimeField()
+    
+    class Meta:
+        db_table = 'reminder_window_state'
+    
+    def __str__(self):
+        return f"{self.window} reminders scanned until {self.scanned_until}"
@@ -5,11 +5,30 @@ This module handles MongoDB operations for storing visit history records.
 Visit history is stored in MongoDB (unstructured data) while appointments
 are stored in PostgreSQL (structured data) - demonstrating polyglot persistence.
 """
-from pymongo import MongoClient
-from pymongo.errors import ConnectionFailure, ServerSelectionTimeoutError
+from pymongo import MongoClient, UpdateOne
+from pymongo.errors import (
+    BulkWriteError, ConnectionFailure, OperationFailure, ServerSelectionTimeoutError
+)
 from decouple import config
-from datetime import datetime, date
+from django.core.cache import caches
+from datetime import datetime, date, timedelta
+from collections import OrderedDict
+from functools import wraps
 import logging
+import threading
+import time
+from .prescriptions import normalize_drug_name, parse_prescriptions
+
+try:
+    import orjson
+    
+    def _json_dumps(obj):
+        return orjson.dumps(obj)
+except ImportError:  # pragma: no cover - orjson is in requirements.txt
+    import json
+    
+    def _json_dumps(obj):
+        return json.dumps(obj, separators=(',', ':')).encode()
 
 logger = logging.getLogger(__name__)
 
@@ -22,12 +41,349 @@ MONGODB_URI = config(
 )
 MONGODB_DB_NAME = config('MONGODB_DB_NAME', default='clinic_appointment')
 MONGODB_COLLECTION_NAME = config('MONGODB_COLLECTION_NAME', default='visit_history')
+MONGODB_ARCHIVE_COLLECTION_NAME = config('MONGODB_ARCHIVE_COLLECTION_NAME', default='visit_history_archive')
+MONGODB_ARCHIVE_AFTER_DAYS = config('MONGODB_ARCHIVE_AFTER_DAYS', default=730, cast=int)
+MONGODB_SERVER_SELECTION_TIMEOUT_MS = config('MONGODB_SERVER_SELECTION_TIMEOUT_MS', default=5000, cast=int)
+
+# Circuit breaker settings: after N consecutive connection failures the circuit
+# opens and Mongo-backed calls fail fast instead of blocking request threads
+MONGODB_BREAKER_FAILURE_THRESHOLD = config('MONGODB_BREAKER_FAILURE_THRESHOLD', default=3, cast=int)
+MONGODB_BREAKER_RESET_TIMEOUT = config('MONGODB_BREAKER_RESET_TIMEOUT', default=30, cast=float)
+MONGODB_STALE_CACHE_SIZE = config('MONGODB_STALE_CACHE_SIZE', default=256, cast=int)
+
+# Read cache for per-patient / per-doctor listings, in a cache alias shared by
+# every process (see VisitHistoryReadCache). Writes invalidate it at once; the
+# TTL only bounds how long unused listings take up memory.
+VISIT_HISTORY_CACHE_ALIAS = 'visit_history'
+VISIT_HISTORY_CACHE_TTL = config('VISIT_HISTORY_CACHE_TTL', default=60, cast=int)
 
 # Global MongoDB client (singleton pattern)
 _mongo_client = None
 _mongo_db = None
 
 
+class MongoUnavailable(Exception):
+    """
+    Raised when the circuit breaker is open and no stale copy of the
+    requested data is available. Views should map this to HTTP 503.
+    """
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker around MongoDB operations.
+    
+    States:
+    - CLOSED: calls go through; consecutive failures are counted
+    - OPEN: calls fail fast with MongoUnavailable (or are served from the
+      stale-read cache); a background thread probes Mongo periodically
+    - HALF_OPEN: a probe is in flight; calls still fail fast until it succeeds
+    
+    Probing happens off the request path so no request thread ever waits on
+    server selection while Mongo is down.
+    """
+    CLOSED = 'CLOSED'
+    OPEN = 'OPEN'
+    HALF_OPEN = 'HALF_OPEN'
+    
+    def __init__(self, failure_threshold, reset_timeout, probe, stale_cache_size=256):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.probe = probe
+        self.state = self.CLOSED
+        self.failure_count = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+        self._probe_thread = None
+        self._stale_cache = OrderedDict()
+        self._stale_cache_size = stale_cache_size
+    
+    def allow_request(self):
+        """Return True if calls may go through to MongoDB"""
+        return self.state == self.CLOSED
+    
+    def record_success(self):
+        """Reset the failure count after a successful call"""
+        with self._lock:
+            self.failure_count = 0
+    
+    def record_failure(self):
+        """Count a failure and open the circuit once the threshold is reached"""
+        with self._lock:
+            self.failure_count += 1
+            if self.state == self.CLOSED and self.failure_count >= self.failure_threshold:
+                self._open()
+    
+    def _open(self):
+        """Open the circuit and start the background probe (lock must be held)"""
+        self.state = self.OPEN
+        self.opened_at = time.monotonic()
+        logger.warning(
+            f"MongoDB circuit opened after {self.failure_count} failures; "
+            f"probing every {self.reset_timeout}s"
+        )
+        if self._probe_thread is None or not self._probe_thread.is_alive():
+            self._probe_thread = threading.Thread(
+                target=self._probe_loop,
+                name='mongo-circuit-probe',
+                daemon=True
+            )
+            self._probe_thread.start()
+    
+    def _probe_loop(self):
+        """Send half-open probes until MongoDB answers, then close the circuit"""
+        while True:
+            time.sleep(self.reset_timeout)
+            with self._lock:
+                self.state = self.HALF_OPEN
+            try:
+                self.probe()
+            except Exception as e:
+                logger.warning(f"MongoDB half-open probe failed: {e}")
+                with self._lock:
+                    self.state = self.OPEN
+                    self.opened_at = time.monotonic()
+                continue
+            with self._lock:
+                self.state = self.CLOSED
+                self.failure_count = 0
+                self.opened_at = None
+            logger.info("MongoDB circuit closed after successful probe")
+            return
+    
+    def remember(self, key, value):
+        """Store the latest successful read result for stale serving"""
+        with self._lock:
+            self._stale_cache[key] = value
+            self._stale_cache.move_to_end(key)
+            while len(self._stale_cache) > self._stale_cache_size:
+                self._stale_cache.popitem(last=False)
+    
+    def stale(self, key):
+        """Return (True, value) if a stale copy exists for key"""
+        with self._lock:
+            if key in self._stale_cache:
+                return True, self._stale_cache[key]
+        return False, None
+    
+    def forget(self, key):
+        """Drop a stale entry (e.g. after a write makes it outdated)"""
+        with self._lock:
+            self._stale_cache.pop(key, None)
+
+
+def _ping_mongo():
+    """Probe used by the circuit breaker to check MongoDB is reachable"""
+    get_mongo_client().admin.command('ping')
+
+
+mongo_breaker = CircuitBreaker(
+    failure_threshold=MONGODB_BREAKER_FAILURE_THRESHOLD,
+    reset_timeout=MONGODB_BREAKER_RESET_TIMEOUT,
+    probe=_ping_mongo,
+    stale_cache_size=MONGODB_STALE_CACHE_SIZE,
+)
+
+
+def mongo_guarded(read=False):
+    """
+    Decorator that routes a MongoDB operation through the circuit breaker.
+    
+    Args:
+        read (bool): If True, successful results are remembered and served
+            stale while the circuit is open.
+    
+    Raises:
+        MongoUnavailable: If the circuit is open (and no stale copy exists
+            for reads), or if the call fails with a connection error.
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            key = (func.__name__, args, tuple(sorted(kwargs.items())))
+            
+            if not mongo_breaker.allow_request():
+                if read:
+                    found, value = mongo_breaker.stale(key)
+                    if found:
+                        logger.warning(f"MongoDB circuit open; serving stale {func.__name__}{args}")
+                        return value
+                raise MongoUnavailable("Visit history service is temporarily unavailable.")
+            
+            try:
+                result = func(*args, **kwargs)
+            except (ConnectionFailure, ServerSelectionTimeoutError) as e:
+                logger.error(f"MongoDB call {func.__name__} failed: {e}")
+                mongo_breaker.record_failure()
+                raise MongoUnavailable("Visit history service is temporarily unavailable.") from e
+            
+            mongo_breaker.record_success()
+            if read:
+                mongo_breaker.remember(key, result)
+            return result
+        return wrapper
+    return decorator
+
+
+class VisitHistoryReadCache:
+    """
+    Visit history listings in the shared 'visit_history' cache (Redis in
+    production), keyed by ('patient', id) or ('doctor', id).
+    
+    Every key has a version counter next to the cached listing, and a
+    listing is stored together with the version read before it was built.
+    Writers bump the version wherever they run (in practice the outbox
+    relay), so every web worker stops serving the old listing at once, and
+    a listing built while a write landed is already stale when stored. A
+    lookup is one get_many (a single MGET on Redis). Entries expire after
+    `ttl` seconds to bound memory.
+    
+    Hit, miss and invalidation counts are added to shared totals every
+    STATS_FLUSH_SECONDS per process, so stats() covers all workers.
+    """
+    STATS_FLUSH_SECONDS = 10
+    COUNTERS = ('hits', 'misses', 'invalidations')
+    
+    def __init__(self, alias, ttl):
+        self.alias = alias
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._pending = dict.fromkeys(self.COUNTERS, 0)
+        self._flushed_at = time.monotonic()
+    
+    @property
+    def cache(self):
+        return caches[self.alias]
+    
+    @staticmethod
+    def _keys(key):
+        kind, entity_id = key
+        return f'visit_history:version:{kind}:{entity_id}', f'visit_history:listing:{kind}:{entity_id}'
+    
+    def _init_version(self, version_key):
+        # Seeded from the clock, so a version lost to eviction never comes
+        # back with a value that older entries still carry
+        self.cache.add(version_key, time.time_ns(), timeout=None)
+        return self.cache.get(version_key)
+    
+    def get(self, key):
+        """
+        Look up a listing.
+        
+        Returns:
+            tuple: (True, records, version) on a hit, (False, None, version)
+                otherwise; pass version to set() with the rebuilt listing
+        """
+        version_key, entry_key = self._keys(key)
+        values = self.cache.get_many([version_key, entry_key])
+        version = values.get(version_key)
+        entry = values.get(entry_key)
+        if version is None:
+            version = self._init_version(version_key)
+        elif entry is not None and entry[0] == version:
+            self._count('hits')
+            return True, entry[1], version
+        self._count('misses')
+        return False, None, version
+    
+    def set(self, key, records, version):
+        """Store records built from `version` (as returned by get())"""
+        self.cache.set(self._keys(key)[1], (version, records), timeout=self.ttl)
+    
+    def invalidate(self, key):
+        """Make the cached listing for key stale in every process"""
+        version_key, _ = self._keys(key)
+        try:
+            self.cache.incr(version_key)
+        except ValueError:
+            self._init_version(version_key)
+        self._count('invalidations')
+    
+    def _count(self, name):
+        with self._lock:
+            self._pending[name] += 1
+            due = time.monotonic() - self._flushed_at >= self.STATS_FLUSH_SECONDS
+        if due:
+            self.flush_stats()
+    
+    def flush_stats(self):
+        """Add this process's counts to the shared totals"""
+        with self._lock:
+            pending, self._pending = self._pending, dict.fromkeys(self.COUNTERS, 0)
+            self._flushed_at = time.monotonic()
+        for name, count in pending.items():
+            if not count:
+                continue
+            stats_key = f'visit_history:stats:{name}'
+            self.cache.add(stats_key, 0, timeout=None)
+            try:
+                self.cache.incr(stats_key, count)
+            except ValueError:
+                self.cache.set(stats_key, count, timeout=None)
+    
+    def stats(self):
+        """Counters summed over every process (each up to STATS_FLUSH_SECONDS behind)"""
+        self.flush_stats()
+        values = self.cache.get_many([f'visit_history:stats:{name}' for name in self.COUNTERS])
+        counts = {name: values.get(f'visit_history:stats:{name}', 0) for name in self.COUNTERS}
+        lookups = counts['hits'] + counts['misses']
+        return {
+            'ttl_seconds': self.ttl,
+            **counts,
+            'hit_rate': round(counts['hits'] / lookups, 3) if lookups else None,
+        }
+
+
+visit_history_cache = VisitHistoryReadCache(
+    alias=VISIT_HISTORY_CACHE_ALIAS,
+    ttl=VISIT_HISTORY_CACHE_TTL,
+)
+
+
+def cached_listing(kind):
+    """
+    Decorator serving a per-patient or per-doctor listing from
+    visit_history_cache. The wrapped function takes the ID plus optional
+    start_date/end_date/include_archive; only plain hot-tier listings are
+    cached.
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(entity_id, start_date=None, end_date=None, include_archive=False):
+            if start_date is not None or end_date is not None or include_archive:
+                return func(entity_id, start_date=start_date, end_date=end_date,
+                            include_archive=include_archive)
+            key = (kind, entity_id)
+            found, records, version = visit_history_cache.get(key)
+            if found:
+                return records
+            records = func(entity_id)
+            visit_history_cache.set(key, records, version)
+            return records
+        return wrapper
+    return decorator
+
+
+def invalidate_visit_history(appointment_id=None, patient_id=None, doctor_id=None):
+    """
+    Invalidate cached listings affected by a visit history write.
+    
+    Every insert, update or delete path must call this with the IDs of the
+    record it touched so readers don't see outdated listings. Cached
+    listings are invalidated for every process; the stale-read copies kept
+    by the circuit breaker are per process and only dropped here.
+    """
+    if patient_id is not None:
+        visit_history_cache.invalidate(('patient', patient_id))
+        mongo_breaker.forget(('get_visit_history_by_patient', (patient_id,), ()))
+    if doctor_id is not None:
+        visit_history_cache.invalidate(('doctor', doctor_id))
+        mongo_breaker.forget(('get_visit_history_by_doctor', (doctor_id,), ()))
+    if appointment_id is not None:
+        mongo_breaker.forget(('get_visit_history_by_appointment', (appointment_id,), ()))
+    mongo_breaker.forget(('get_all_visit_history', (), ()))
+
+
 def get_mongo_client():
     """
     Get or create MongoDB client connection.
@@ -45,7 +401,7 @@ def get_mongo_client():
         try:
             _mongo_client = MongoClient(
                 MONGODB_URI,
-                serverSelectionTimeoutMS=5000,  # 5 second timeout
+                serverSelectionTimeoutMS=MONGODB_SERVER_SELECTION_TIMEOUT_MS,
                 connectTimeoutMS=10000,
                 socketTimeoutMS=10000
             )
@@ -86,6 +442,114 @@ def get_visit_history_collection():
     return db[MONGODB_COLLECTION_NAME]
 
 
+def _normalize_visit_date(visit_date):
+    """Convert a str/date visit_date to the datetime stored in MongoDB"""
+    if isinstance(visit_date, str):
+        try:
+            return datetime.fromisoformat(visit_date.replace('Z', '+00:00'))
+        except ValueError:
+            # If ISO format fails, try simple date parsing
+            try:
+                return datetime.strptime(visit_date, '%Y-%m-%d')
+            except ValueError:
+                return datetime.now()
+    if isinstance(visit_date, date) and not isinstance(visit_date, datetime):
+        # If it's a date object, convert to datetime
+        return datetime.combine(visit_date, datetime.min.time())
+    if not isinstance(visit_date, datetime):
+        return datetime.now()
+    return visit_date
+
+
+@mongo_guarded()
+def ensure_visit_history_indexes():
+    """
+    Create the indexes the visit history queries rely on.
+    
+    The unique index on appointment_id makes outbox delivery idempotent:
+    re-sending a record that already landed fails with a duplicate key
+    instead of creating a second document.
+    """
+    collection = get_visit_history_collection()
+    try:
+        collection.create_index('appointment_id', unique=True, name='appointment_id_unique')
+    except OperationFailure as e:
+        # Pre-existing duplicates block the unique index; keep going without it
+        logger.error(f"Could not create unique appointment_id index: {e}")
+    collection.create_index([('patient_id', 1), ('visit_date', -1)], name='patient_visit_date')
+    collection.create_index([('doctor_id', 1), ('visit_date', -1)], name='doctor_visit_date')
+    collection.create_index([('visit_date', -1)], name='visit_date')
+    # Multikey index for "who is on drug X" and per-patient active medication
+    collection.create_index(
+        [('prescriptions.drug', 1), ('prescriptions.end_date', 1)],
+        name='prescription_drug_end_date'
+    )
+    # MongoDB allows one text index per collection; prescriptions weigh more
+    # than free-form notes when ranking
+    collection.create_index(
+        [('notes', 'text'), ('prescription', 'text')],
+        weights={'notes': 1, 'prescription': 2},
+        name='notes_prescription_text'
+    )
+
+
+@mongo_guarded()
+def insert_visit_history_batch(records):
+    """
+    Insert many visit history records in one round trip.
+    
+    Args:
+        records (list): Dicts with appointment_id, patient_id, doctor_id,
+            visit_date, notes and prescription
+    
+    Returns:
+        tuple: (inserted, duplicates, errors) where inserted and duplicates
+            are sets of appointment IDs and errors maps appointment ID to
+            an error message
+    """
+    if not records:
+        return set(), set(), {}
+    
+    collection = get_visit_history_collection()
+    now = datetime.utcnow()
+    documents = []
+    for record in records:
+        visit_date = _normalize_visit_date(record['visit_date'])
+        documents.append({
+            'appointment_id': record['appointment_id'],
+            'patient_id': record['patient_id'],
+            'doctor_id': record['doctor_id'],
+            'visit_date': visit_date,
+            'notes': record.get('notes') or '',
+            'prescription': record.get('prescription') or '',
+            'prescriptions': parse_prescriptions(record.get('prescription'), visit_date),
+            'created_at': now,
+        })
+    appointment_ids = [doc['appointment_id'] for doc in documents]
+    
+    duplicates = set()
+    errors = {}
+    try:
+        # ordered=False so one bad document doesn't block the rest of the batch
+        collection.insert_many(documents, ordered=False)
+    except BulkWriteError as e:
+        for write_error in e.details.get('writeErrors', []):
+            appointment_id = appointment_ids[write_error['index']]
+            if write_error.get('code') == 11000:
+                duplicates.add(appointment_id)
+            else:
+                errors[appointment_id] = write_error.get('errmsg', 'Unknown write error')
+    
+    inserted = set(appointment_ids) - duplicates - set(errors)
+    for doc in documents:
+        if doc['appointment_id'] in inserted:
+            invalidate_visit_history(doc['appointment_id'], doc['patient_id'], doc['doctor_id'])
+    
+    logger.info(f"Visit history batch: {len(inserted)} inserted, {len(duplicates)} duplicates, {len(errors)} errors")
+    return inserted, duplicates, errors
+
+
+@mongo_guarded()
 def insert_visit_history(appointment_id, patient_id, doctor_id, visit_date, 
                          notes=None, prescription=None):
     """
@@ -97,29 +561,15 @@ def insert_visit_history(appointment_id, patient_id, doctor_id, visit_date,
         doctor_id (int): Doctor user ID
         visit_date (str or datetime): Date of the visit
         notes (str, optional): Doctor's notes
-        prescription (str or list, optional): Prescription information
+        prescription (str or list, optional): Prescription information;
+            also parsed into structured 'prescriptions' records
         
     Returns:
         dict: Inserted document with _id
     """
     collection = get_visit_history_collection()
     
-    # Convert visit_date to datetime if needed
-    if isinstance(visit_date, str):
-        try:
-            visit_date = datetime.fromisoformat(visit_date.replace('Z', '+00:00'))
-        except ValueError:
-            # If ISO format fails, try simple date parsing
-            try:
-                visit_date = datetime.strptime(visit_date, '%Y-%m-%d')
-            except ValueError:
-                visit_date = datetime.now()
-    elif isinstance(visit_date, date) and not isinstance(visit_date, datetime):
-        # If it's a date object, convert to datetime
-        visit_date = datetime.combine(visit_date, datetime.min.time())
-    elif not isinstance(visit_date, datetime):
-        visit_date = datetime.now()
-    
+    visit_date = _normalize_visit_date(visit_date)
     visit_record = {
         'appointment_id': appointment_id,
         'patient_id': patient_id,
@@ -127,125 +577,784 @@ def insert_visit_history(appointment_id, patient_id, doctor_id, visit_date,
         'visit_date': visit_date,
         'notes': notes or '',
         'prescription': prescription or '',
+        # Structured copy of the prescription for indexed medication queries
+        'prescriptions': parse_prescriptions(prescription, visit_date),
         'created_at': datetime.utcnow()
     }
     
     result = collection.insert_one(visit_record)
     visit_record['_id'] = result.inserted_id
     
+    # Cached and stale copies of the affected listings are now outdated
+    invalidate_visit_history(appointment_id, patient_id, doctor_id)
+    
     logger.info(f"Visit history inserted for appointment {appointment_id}")
     return visit_record
 
 
-def get_visit_history_by_patient(patient_id):
+def _serialize_document(doc):
+    """Convert ObjectId and datetimes in a document to strings (in place)"""
+    doc['_id'] = str(doc['_id'])
+    # Convert datetime to ISO format string
+    if isinstance(doc.get('visit_date'), datetime):
+        doc['visit_date'] = doc['visit_date'].isoformat()
+    if isinstance(doc.get('created_at'), datetime):
+        doc['created_at'] = doc['created_at'].isoformat()
+    return doc
+
+
+def _find_visit_history(query, start_date=None, end_date=None, include_archive=False):
     """
-    Get all visit history records for a specific patient.
+    Run a visit history query on the hot tier, and the archive if asked.
+    
+    The archive is only consulted when the requested range starts before
+    the archive cutoff or include_archive is set. Everything else is an
+    index scan of the hot collection, already in visit_date order.
     
     Args:
-        patient_id (int): Patient user ID
+        query (dict): Base filter, e.g. {'patient_id': 5}
+        start_date (date, optional): Earliest visit date (inclusive)
+        end_date (date, optional): Latest visit date (inclusive)
+        include_archive (bool): Also read archived records
         
     Returns:
-        list: List of visit history documents
+        list: Serialized documents sorted by visit_date descending
     """
+    match = _range_match(start_date, end_date)['$match']
+    match.update(query)
     collection = get_visit_history_collection()
     
-    # Query MongoDB for patient's visit history, sorted by visit_date descending
-    cursor = collection.find(
-        {'patient_id': patient_id}
-    ).sort('visit_date', -1)
+    if not (include_archive or _range_reaches_archive(start_date)):
+        cursor = collection.find(match).sort('visit_date', -1)
+    else:
+        cursor = collection.aggregate(
+            _match_across_tiers(match, start_date, include_archive=True) + [{'$sort': {'visit_date': -1}}],
+            allowDiskUse=True
+        )
     
-    # Convert ObjectId to string for JSON serialization
+    # A record caught mid-move exists in both tiers; keep one copy
     records = []
+    seen = set()
     for doc in cursor:
-        doc['_id'] = str(doc['_id'])
-        # Convert datetime to ISO format string
-        if isinstance(doc.get('visit_date'), datetime):
-            doc['visit_date'] = doc['visit_date'].isoformat()
-        if isinstance(doc.get('created_at'), datetime):
-            doc['created_at'] = doc['created_at'].isoformat()
-        records.append(doc)
+        if doc['_id'] in seen:
+            continue
+        seen.add(doc['_id'])
+        records.append(_serialize_document(doc))
     
     return records
 
 
-def get_visit_history_by_doctor(doctor_id):
+@cached_listing('patient')
+@mongo_guarded(read=True)
+def get_visit_history_by_patient(patient_id, start_date=None, end_date=None, include_archive=False):
+    """
+    Get all visit history records for a specific patient.
+    
+    Args:
+        patient_id (int): Patient user ID
+        start_date (date, optional): Earliest visit date (inclusive)
+        end_date (date, optional): Latest visit date (inclusive)
+        include_archive (bool): Also read archived records
+        
+    Returns:
+        list: List of visit history documents, newest first
+    """
+    return _find_visit_history({'patient_id': patient_id}, start_date, end_date, include_archive)
+
+
+@cached_listing('doctor')
+@mongo_guarded(read=True)
+def get_visit_history_by_doctor(doctor_id, start_date=None, end_date=None, include_archive=False):
     """
     Get all visit history records for appointments handled by a specific doctor.
     
     Args:
         doctor_id (int): Doctor user ID
+        start_date (date, optional): Earliest visit date (inclusive)
+        end_date (date, optional): Latest visit date (inclusive)
+        include_archive (bool): Also read archived records
         
     Returns:
-        list: List of visit history documents
+        list: List of visit history documents, newest first
     """
-    collection = get_visit_history_collection()
+    return _find_visit_history({'doctor_id': doctor_id}, start_date, end_date, include_archive)
+
+
+@mongo_guarded(read=True)
+def get_all_visit_history(start_date=None, end_date=None, include_archive=False):
+    """
+    Get all visit history records (for admins).
     
-    # Query MongoDB for doctor's visit history, sorted by visit_date descending
-    cursor = collection.find(
-        {'doctor_id': doctor_id}
-    ).sort('visit_date', -1)
+    Args:
+        start_date (date, optional): Earliest visit date (inclusive)
+        end_date (date, optional): Latest visit date (inclusive)
+        include_archive (bool): Also read archived records
+        
+    Returns:
+        list: List of all visit history documents, newest first
+    """
+    return _find_visit_history({}, start_date, end_date, include_archive)
+
+
+@mongo_guarded(read=True)
+def get_visit_history_by_appointment(appointment_id):
+    """
+    Get visit history for a specific appointment.
+    Falls back to the archive if the record has been moved there.
     
-    # Convert ObjectId to string for JSON serialization
-    records = []
-    for doc in cursor:
-        doc['_id'] = str(doc['_id'])
-        # Convert datetime to ISO format string
-        if isinstance(doc.get('visit_date'), datetime):
-            doc['visit_date'] = doc['visit_date'].isoformat()
-        if isinstance(doc.get('created_at'), datetime):
-            doc['created_at'] = doc['created_at'].isoformat()
-        records.append(doc)
+    Args:
+        appointment_id (int): PostgreSQL appointment ID
+        
+    Returns:
+        dict or None: Visit history document or None if not found
+    """
+    doc = get_visit_history_collection().find_one({'appointment_id': appointment_id})
+    if doc is None:
+        doc = get_visit_history_archive_collection().find_one({'appointment_id': appointment_id})
     
-    return records
+    if doc:
+        _serialize_document(doc)
+    
+    return doc
 
 
-def get_all_visit_history():
+@mongo_guarded()
+def text_search_visit_history(text, patient_id=None, doctor_id=None, skip=0, limit=20):
     """
-    Get all visit history records (for admins).
+    Full-text search over visit notes and prescriptions.
+    
+    Uses the notes_prescription_text index, scoped by patient and/or doctor
+    and ranked by MongoDB's text score. Only the hot collection is searched.
+    
+    Args:
+        text (str): Search terms (MongoDB $search syntax, e.g. "root canal")
+        patient_id (int, optional): Restrict to one patient
+        doctor_id (int, optional): Restrict to one doctor
+        skip (int): Results to skip (pagination)
+        limit (int): Maximum results to return
+        
+    Returns:
+        list: Serialized documents with a 'score' key, best match first
+    """
+    query = {'$text': {'$search': text}}
+    if patient_id is not None:
+        query['patient_id'] = patient_id
+    if doctor_id is not None:
+        query['doctor_id'] = doctor_id
+    
+    cursor = get_visit_history_collection().find(
+        query,
+        {'score': {'$meta': 'textScore'}}
+    ).sort([('score', {'$meta': 'textScore'})]).skip(skip).limit(limit)
+    
+    return [_serialize_document(doc) for doc in cursor]
+
+
+# ============================================================================
+# Reconciliation helpers
+# Used by the reconcile_visit_history command to merge-join MongoDB against
+# PostgreSQL in appointment_id order with bounded memory.
+# ============================================================================
+
+def _visit_history_tiers():
+    return (('hot', get_visit_history_collection()), ('archive', get_visit_history_archive_collection()))
+
+
+@mongo_guarded()
+def get_visit_history_keys(after_appointment_id, upto_appointment_id=None):
+    """
+    Key fields of every record in both tiers with appointment_id in
+    (after_appointment_id, upto_appointment_id], sorted by appointment_id.
+    
+    Each tier is read with one index range query that is drained at once, so
+    no cursor is left idle on the server between chunks.
+    
+    Returns:
+        list: Dicts with _id, appointment_id, patient_id, doctor_id and tier
+    """
+    id_range = {'$gt': after_appointment_id}
+    if upto_appointment_id is not None:
+        id_range['$lte'] = upto_appointment_id
+    
+    docs = []
+    for tier, collection in _visit_history_tiers():
+        cursor = collection.find(
+            {'appointment_id': id_range},
+            {'appointment_id': 1, 'patient_id': 1, 'doctor_id': 1}
+        ).sort('appointment_id', 1)
+        for doc in cursor:
+            doc['tier'] = tier
+            docs.append(doc)
+    docs.sort(key=lambda doc: doc['appointment_id'])
+    return docs
+
+
+@mongo_guarded()
+def get_visit_history_range_end(after_appointment_id, count):
+    """
+    Upper appointment_id of a range after after_appointment_id holding at
+    most `count` records per tier.
     
     Returns:
-        list: List of all visit history documents
+        int or None: None when neither tier has `count` records left, i.e.
+            the rest of both tiers fits in one range
+    """
+    ends = []
+    for _, collection in _visit_history_tiers():
+        docs = list(
+            collection.find({'appointment_id': {'$gt': after_appointment_id}}, {'appointment_id': 1})
+            .sort('appointment_id', 1).skip(count - 1).limit(1)
+        )
+        if docs:
+            ends.append(docs[0]['appointment_id'])
+    return min(ends) if ends else None
+
+
+@mongo_guarded()
+def count_visit_history_without_appointment():
+    """Count records whose appointment_id is missing or not a number"""
+    query = {'appointment_id': {'$not': {'$type': 'number'}}}
+    return (
+        get_visit_history_collection().count_documents(query)
+        + get_visit_history_archive_collection().count_documents(query)
+    )
+
+
+@mongo_guarded()
+def fix_visit_history_owners(fixes):
+    """
+    Overwrite patient_id/doctor_id on records that disagree with PostgreSQL.
+    
+    Args:
+        fixes (list): Dicts with _id, tier, appointment_id, patient_id,
+            doctor_id (the PostgreSQL values) and the old values under
+            old_patient_id / old_doctor_id
+    """
+    for tier, collection in (('hot', get_visit_history_collection()),
+                             ('archive', get_visit_history_archive_collection())):
+        operations = [
+            UpdateOne(
+                {'_id': fix['_id']},
+                {'$set': {'patient_id': fix['patient_id'], 'doctor_id': fix['doctor_id']}}
+            )
+            for fix in fixes if fix['tier'] == tier
+        ]
+        if operations:
+            collection.bulk_write(operations, ordered=False)
+    
+    for fix in fixes:
+        invalidate_visit_history(fix['appointment_id'], fix['patient_id'], fix['doctor_id'])
+        invalidate_visit_history(patient_id=fix['old_patient_id'], doctor_id=fix['old_doctor_id'])
+
+
+@mongo_guarded()
+def delete_visit_history_records(records):
+    """
+    Delete visit records by _id from their tier.
+    
+    Args:
+        records (list): Dicts with _id, tier, appointment_id, patient_id and doctor_id
+    """
+    for tier, collection in (('hot', get_visit_history_collection()),
+                             ('archive', get_visit_history_archive_collection())):
+        ids = [record['_id'] for record in records if record['tier'] == tier]
+        if ids:
+            collection.delete_many({'_id': {'$in': ids}})
+    
+    for record in records:
+        invalidate_visit_history(record['appointment_id'], record.get('patient_id'), record.get('doctor_id'))
+
+
+# ============================================================================
+# Medication queries
+# Served by the multikey prescription_drug_end_date index. A prescription is
+# active while its end_date (visit date + duration) has not passed.
+# ============================================================================
+
+def _today():
+    """Start of today as a naive datetime, matching stored dates"""
+    return datetime.combine(date.today(), datetime.min.time())
+
+
+@mongo_guarded(read=True)
+def get_active_prescriptions_for_patient(patient_id, doctor_id=None):
+    """
+    Get a patient's currently active prescriptions.
+    
+    Args:
+        patient_id (int): Patient user ID
+        doctor_id (int, optional): Only prescriptions written by this doctor
+        
+    Returns:
+        list: Dicts with drug, dose, frequency, duration_days, start_date,
+            end_date, appointment_id and doctor_id; latest ending first
+    """
+    today = _today()
+    match = {'patient_id': patient_id, 'prescriptions.end_date': {'$gte': today}}
+    if doctor_id is not None:
+        match['doctor_id'] = doctor_id
+    
+    pipeline = [
+        {'$match': match},
+        {'$unwind': '$prescriptions'},
+        {'$match': {'prescriptions.end_date': {'$gte': today}}},
+        {'$replaceWith': {'$mergeObjects': [
+            '$prescriptions',
+            {'appointment_id': '$appointment_id', 'doctor_id': '$doctor_id'},
+        ]}},
+        {'$sort': {'end_date': -1}},
+    ]
+    return list(get_visit_history_collection().aggregate(pipeline))
+
+
+@mongo_guarded(read=True)
+def get_patients_on_drug(drug, doctor_id=None):
+    """
+    Get patients with an active prescription for a drug.
+    
+    Args:
+        drug (str): Drug name (case-insensitive, exact match)
+        doctor_id (int, optional): Only prescriptions written by this doctor
+        
+    Returns:
+        list: Dicts with patient_id, dose, frequency and end_date (latest
+            active prescription per patient)
+    """
+    today = _today()
+    drug = normalize_drug_name(drug)
+    element = {'drug': drug, 'end_date': {'$gte': today}}
+    match = {'prescriptions': {'$elemMatch': element}}
+    if doctor_id is not None:
+        match['doctor_id'] = doctor_id
+    
+    pipeline = [
+        {'$match': match},
+        {'$unwind': '$prescriptions'},
+        {'$match': {'prescriptions.drug': drug, 'prescriptions.end_date': {'$gte': today}}},
+        {'$sort': {'prescriptions.end_date': -1}},
+        {'$group': {
+            '_id': '$patient_id',
+            'dose': {'$first': '$prescriptions.dose'},
+            'frequency': {'$first': '$prescriptions.frequency'},
+            'end_date': {'$first': '$prescriptions.end_date'},
+        }},
+        {'$project': {'_id': 0, 'patient_id': '$_id', 'dose': 1, 'frequency': 1, 'end_date': 1}},
+        {'$sort': {'patient_id': 1}},
+    ]
+    return list(get_visit_history_collection().aggregate(pipeline))
+
+
+@mongo_guarded()
+def backfill_prescriptions_batch(batch_size=500):
+    """
+    Parse prescriptions for one chunk of records written before structured
+    prescriptions existed.
+    
+    Returns:
+        int: Number of records updated (0 when none are left)
     """
     collection = get_visit_history_collection()
+    documents = list(
+        collection.find(
+            {'prescriptions': {'$exists': False}},
+            {'prescription': 1, 'visit_date': 1, 'patient_id': 1, 'doctor_id': 1, 'appointment_id': 1}
+        ).limit(batch_size)
+    )
+    if not documents:
+        return 0
     
-    # Query all records, sorted by visit_date descending
-    cursor = collection.find().sort('visit_date', -1)
+    collection.bulk_write([
+        UpdateOne(
+            {'_id': doc['_id']},
+            {'$set': {'prescriptions': parse_prescriptions(doc.get('prescription'), doc.get('visit_date'))}}
+        )
+        for doc in documents
+    ], ordered=False)
     
-    # Convert ObjectId to string for JSON serialization
-    records = []
-    for doc in cursor:
-        doc['_id'] = str(doc['_id'])
-        # Convert datetime to ISO format string
-        if isinstance(doc.get('visit_date'), datetime):
-            doc['visit_date'] = doc['visit_date'].isoformat()
-        if isinstance(doc.get('created_at'), datetime):
-            doc['created_at'] = doc['created_at'].isoformat()
-        records.append(doc)
+    for doc in documents:
+        invalidate_visit_history(doc.get('appointment_id'), doc.get('patient_id'), doc.get('doctor_id'))
+    return len(documents)
+
+
+@mongo_guarded()
+def get_visit_history_page(after_appointment_id=0, limit=500):
+    """
+    Read the next records of both tiers in appointment_id order.
+
+    Each tier is read with one short query that is drained immediately, so
+    no cursor stays open between pages. The page stops at the lowest
+    appointment_id where a tier filled its limit, which keeps it gap-free
+    across tiers.
+
+    Args:
+        after_appointment_id (int): Resume point (exclusive)
+        limit (int): Records read per tier
+
+    Returns:
+        list: Documents sorted by appointment_id (empty when none are left)
+    """
+    query = {'appointment_id': {'$gt': after_appointment_id}}
+    docs = []
+    upper = None
+    for collection in (get_visit_history_collection(), get_visit_history_archive_collection()):
+        tier_docs = list(collection.find(query).sort('appointment_id', 1).limit(limit))
+        if len(tier_docs) == limit:
+            last = tier_docs[-1]['appointment_id']
+            upper = last if upper is None else min(upper, last)
+        docs.extend(tier_docs)
+
+    if upper is not None:
+        docs = [doc for doc in docs if doc['appointment_id'] <= upper]
+    docs.sort(key=lambda doc: doc['appointment_id'])
+    return docs
+
+
+# ============================================================================
+# Archive tier
+# Visits older than MONGODB_ARCHIVE_AFTER_DAYS are moved to a separate
+# collection stored with zstd block compression, keeping the hot collection
+# and its indexes small enough to stay in memory.
+# ============================================================================
+
+def get_visit_history_archive_collection():
+    """
+    Get the archive collection for old visit history records.
     
-    return records
+    Returns:
+        Collection: MongoDB collection for archived visit history
+    """
+    db = get_mongo_db()
+    return db[MONGODB_ARCHIVE_COLLECTION_NAME]
 
 
-def get_visit_history_by_appointment(appointment_id):
+def archive_cutoff():
+    """Visits before this datetime belong in the archive"""
+    today = datetime.combine(date.today(), datetime.min.time())
+    return today - timedelta(days=MONGODB_ARCHIVE_AFTER_DAYS)
+
+
+def _range_reaches_archive(start_date):
     """
-    Get visit history for a specific appointment.
+    True if a range starting at start_date reaches back past the archive
+    cutoff. Open ranges don't: callers ask for the archive explicitly.
+    """
+    return start_date is not None and _normalize_visit_date(start_date) < archive_cutoff()
+
+
+def _match_across_tiers(match, start_date=None, include_archive=False):
+    """
+    Leading pipeline stages selecting match from the hot collection, plus the
+    archive when include_archive is set or start_date reaches back past the
+    archive cutoff.
+    """
+    stages = [{'$match': match}]
+    if include_archive or _range_reaches_archive(start_date):
+        stages.append({'$unionWith': {
+            'coll': MONGODB_ARCHIVE_COLLECTION_NAME,
+            'pipeline': [{'$match': match}],
+        }})
+    return stages
+
+
+@mongo_guarded()
+def ensure_visit_history_archive():
+    """
+    Create the archive collection with zstd compression and its indexes.
+    
+    Falls back to the server's default compressor if custom storage engine
+    options are not allowed (e.g. on shared Atlas tiers).
+    """
+    db = get_mongo_db()
+    if MONGODB_ARCHIVE_COLLECTION_NAME not in db.list_collection_names():
+        try:
+            db.create_collection(
+                MONGODB_ARCHIVE_COLLECTION_NAME,
+                storageEngine={'wiredTiger': {'configString': 'block_compressor=zstd'}}
+            )
+        except OperationFailure as e:
+            logger.warning(f"zstd archive collection not allowed, using default compression: {e}")
+            db.create_collection(MONGODB_ARCHIVE_COLLECTION_NAME)
+    
+    archive = get_visit_history_archive_collection()
+    archive.create_index('appointment_id', unique=True, name='appointment_id_unique')
+    archive.create_index([('patient_id', 1), ('visit_date', -1)], name='patient_visit_date')
+    archive.create_index([('doctor_id', 1), ('visit_date', -1)], name='doctor_visit_date')
+    archive.create_index([('visit_date', -1)], name='visit_date')
+
+
+@mongo_guarded()
+def archive_visit_history_batch(cutoff, batch_size=1000):
+    """
+    Move one chunk of records older than cutoff into the archive.
+    
+    Copy first, delete second: if the job dies in between, the next run
+    re-copies (duplicates are ignored thanks to the unique appointment_id
+    index) and then deletes, so nothing is lost or doubled.
     
     Args:
-        appointment_id (int): PostgreSQL appointment ID
+        cutoff (datetime): Move visits with visit_date before this
+        batch_size (int): Maximum documents to move
         
     Returns:
-        dict or None: Visit history document or None if not found
+        int: Number of documents moved (0 when nothing is left)
     """
     collection = get_visit_history_collection()
+    archive = get_visit_history_archive_collection()
     
-    doc = collection.find_one({'appointment_id': appointment_id})
+    # Oldest first along the visit_date index, so each chunk is a range scan
+    documents = list(
+        collection.find({'visit_date': {'$lt': cutoff}}).sort('visit_date', 1).limit(batch_size)
+    )
+    if not documents:
+        return 0
     
-    if doc:
-        doc['_id'] = str(doc['_id'])
-        # Convert datetime to ISO format string
-        if isinstance(doc.get('visit_date'), datetime):
-            doc['visit_date'] = doc['visit_date'].isoformat()
-        if isinstance(doc.get('created_at'), datetime):
-            doc['created_at'] = doc['created_at'].isoformat()
+    try:
+        archive.insert_many(documents, ordered=False)
+    except BulkWriteError as e:
+        # Only tolerate duplicates from an earlier interrupted run
+        other_errors = [err for err in e.details.get('writeErrors', []) if err.get('code') != 11000]
+        if other_errors:
+            raise
     
-    return doc
+    collection.delete_many({'_id': {'$in': [doc['_id'] for doc in documents]}})
+    
+    # Hot-only listings just lost these records
+    for patient_id in {doc.get('patient_id') for doc in documents}:
+        invalidate_visit_history(patient_id=patient_id)
+    for doctor_id in {doc.get('doctor_id') for doc in documents}:
+        invalidate_visit_history(doctor_id=doctor_id)
+    return len(documents)
+
+
+# ============================================================================
+# Streaming reads
+# _id and dates are converted to strings by MongoDB itself, so each document
+# pymongo decodes goes straight to orjson with no per-field Python code, and
+# only one cursor batch is in memory at a time.
+# ============================================================================
+
+STREAM_BATCH_SIZE = 500
 
+# ISO-8601 in UTC at MongoDB's millisecond precision. The list endpoint emits
+# datetime.isoformat() instead (no 'Z', microseconds only when non-zero);
+# both denote the same instant.
+_STREAM_DATE_FORMAT = '%Y-%m-%dT%H:%M:%S.%LZ'
+
+
+@mongo_guarded()
+def stream_visit_history_json(query=None, include_archive=False, batch_size=STREAM_BATCH_SIZE):
+    """
+    Stream visit history records as a JSON array.
+    
+    The aggregation is started eagerly so connection problems surface (and
+    trip the circuit breaker) before any bytes are sent; the returned
+    generator then pulls one batch at a time. On the hot tier the sort
+    follows the (patient_id|doctor_id, visit_date) or visit_date index, so
+    the first batch goes out without reading the whole result. With
+    include_archive the two tiers are merged by a blocking sort.
+    
+    Args:
+        query (dict, optional): MongoDB filter, e.g. {'patient_id': 5}
+        include_archive (bool): Also stream archived records
+        batch_size (int): Documents per cursor batch and per yielded chunk
+        
+    Returns:
+        generator: bytes chunks forming a JSON array, newest visit first
+    """
+    pipeline = _match_across_tiers(query or {}, include_archive=include_archive) + [
+        {'$sort': {'visit_date': -1}},
+        {'$set': {
+            '_id': {'$toString': '$_id'},
+            'visit_date': {'$dateToString': {'format': _STREAM_DATE_FORMAT, 'date': '$visit_date'}},
+            'created_at': {'$dateToString': {'format': _STREAM_DATE_FORMAT, 'date': '$created_at'}},
+        }},
+    ]
+    cursor = get_visit_history_collection().aggregate(
+        pipeline, batchSize=batch_size, allowDiskUse=include_archive
+    )
+    return _iter_json_array(cursor, batch_size)
+
+
+def _iter_json_array(cursor, batch_size):
+    """
+    Yield a JSON array from a cursor, one chunk per batch.
+    
+    A connection error mid-stream is re-raised once it has been counted
+    against the breaker. The server then aborts the response without the
+    closing ']' (and without the final chunk of a chunked response), so
+    clients can tell a truncated stream from a complete one.
+    """
+    yield b'['
+    first = True
+    chunk = []
+    try:
+        for doc in cursor:
+            chunk.append(_json_dumps(doc))
+            if len(chunk) >= batch_size:
+                yield (b'' if first else b',') + b','.join(chunk)
+                first = False
+                chunk = []
+        if chunk:
+            yield (b'' if first else b',') + b','.join(chunk)
+    except (ConnectionFailure, ServerSelectionTimeoutError) as e:
+        logger.error(f"MongoDB stream interrupted, aborting response: {e}")
+        mongo_breaker.record_failure()
+        raise
+    finally:
+        cursor.close()
+    yield b']'
+
+
+# ============================================================================
+# Visit history analytics (aggregation pipelines)
+# Every pipeline starts with a $match on indexed fields (doctor_id,
+# patient_id, visit_date) so Mongo only scans the requested slice (in the
+# archive too, when the range reaches back that far or include_archive is
+# set), and returns aggregated rows rather than raw documents.
+# ============================================================================
+
+def _range_match(start_date=None, end_date=None, doctor_id=None, patient_id=None):
+    """
+    Build a $match stage on the indexed visit history fields.
+    
+    Args:
+        start_date (date, optional): Include visits on or after this date
+        end_date (date, optional): Include visits on or before this date
+        doctor_id (int, optional): Restrict to one doctor
+        patient_id (int, optional): Restrict to one patient
+    """
+    match = {}
+    if doctor_id is not None:
+        match['doctor_id'] = doctor_id
+    if patient_id is not None:
+        match['patient_id'] = patient_id
+    if start_date or end_date:
+        match['visit_date'] = {}
+        if start_date:
+            match['visit_date']['$gte'] = _normalize_visit_date(start_date)
+        if end_date:
+            # Inclusive end date: everything before the following midnight
+            end = _normalize_visit_date(end_date)
+            match['visit_date']['$lt'] = end + timedelta(days=1)
+    return {'$match': match}
+
+
+@mongo_guarded(read=True)
+def visits_per_doctor_per_month(start_date=None, end_date=None, doctor_id=None, include_archive=False):
+    """
+    Count visits per doctor per calendar month.
+    
+    Returns:
+        list: Rows of {doctor_id, year, month, visits}, newest month first
+    """
+    collection = get_visit_history_collection()
+    pipeline = _match_across_tiers(
+        _range_match(start_date, end_date, doctor_id=doctor_id)['$match'], start_date, include_archive
+    ) + [
+        {'$group': {
+            '_id': {
+                'doctor_id': '$doctor_id',
+                'year': {'$year': '$visit_date'},
+                'month': {'$month': '$visit_date'},
+            },
+            'visits': {'$sum': 1},
+        }},
+        {'$project': {
+            '_id': 0,
+            'doctor_id': '$_id.doctor_id',
+            'year': '$_id.year',
+            'month': '$_id.month',
+            'visits': 1,
+        }},
+        {'$sort': {'year': -1, 'month': -1, 'doctor_id': 1}},
+    ]
+    return list(collection.aggregate(pipeline))
+
+
+@mongo_guarded(read=True)
+def prescription_frequency(start_date=None, end_date=None, doctor_id=None, include_archive=False, limit=20):
+    """
+    Count how often each prescription appears.
+    
+    Prescriptions may be stored as a string or a list of strings; both are
+    flattened and compared case-insensitively.
+    
+    Returns:
+        list: Rows of {prescription, count}, most frequent first
+    """
+    collection = get_visit_history_collection()
+    match = _range_match(start_date, end_date, doctor_id=doctor_id)
+    match['$match']['prescription'] = {'$nin': ['', None]}
+    pipeline = _match_across_tiers(match['$match'], start_date, include_archive) + [
+        {'$project': {
+            'items': {
+                '$cond': [{'$isArray': '$prescription'}, '$prescription', ['$prescription']]
+            },
+        }},
+        {'$unwind': '$items'},
+        {'$project': {'item': {'$toLower': {'$trim': {'input': {'$toString': '$items'}}}}}},
+        {'$match': {'item': {'$ne': ''}}},
+        {'$group': {'_id': '$item', 'count': {'$sum': 1}}},
+        {'$sort': {'count': -1, '_id': 1}},
+        {'$limit': limit},
+        {'$project': {'_id': 0, 'prescription': '$_id', 'count': 1}},
+    ]
+    return list(collection.aggregate(pipeline))
+
+
+@mongo_guarded(read=True)
+def repeat_visit_intervals(start_date=None, end_date=None, doctor_id=None, patient_id=None,
+                           include_archive=False, limit=100):
+    """
+    Measure the gap between consecutive visits per patient.
+    
+    Uses $setWindowFields (MongoDB 5.0+) to pair each visit with the
+    patient's previous one, then aggregates the gaps in days.
+    
+    Returns:
+        list: Rows of {patient_id, visits, avg_interval_days,
+            min_interval_days, max_interval_days} for patients with
+            two or more visits, most frequent visitors first
+    """
+    collection = get_visit_history_collection()
+    pipeline = _match_across_tiers(
+        _range_match(start_date, end_date, doctor_id=doctor_id, patient_id=patient_id)['$match'],
+        start_date, include_archive
+    ) + [
+        {'$setWindowFields': {
+            'partitionBy': '$patient_id',
+            'sortBy': {'visit_date': 1},
+            'output': {
+                'previous_visit': {'$shift': {'output': '$visit_date', 'by': -1}},
+            },
+        }},
+        {'$project': {
+            'patient_id': 1,
+            'interval_days': {
+                '$cond': [
+                    {'$eq': ['$previous_visit', None]},
+                    None,
+                    {'$divide': [{'$subtract': ['$visit_date', '$previous_visit']}, 86400000]},
+                ]
+            },
+        }},
+        {'$group': {
+            '_id': '$patient_id',
+            'visits': {'$sum': 1},
+            'avg_interval_days': {'$avg': '$interval_days'},
+            'min_interval_days': {'$min': '$interval_days'},
+            'max_interval_days': {'$max': '$interval_days'},
+        }},
+        {'$match': {'visits': {'$gte': 2}}},
+        {'$sort': {'visits': -1, '_id': 1}},
+        {'$limit': limit},
+        {'$project': {
+            '_id': 0,
+            'patient_id': '$_id',
+            'visits': 1,
+            'avg_interval_days': {'$round': ['$avg_interval_days', 1]},
+            'min_interval_days': {'$round': ['$min_interval_days', 1]},
+            'max_interval_days': {'$round': ['$max_interval_days', 1]},
+        }},
+    ]
+    return list(collection.aggregate(pipeline))
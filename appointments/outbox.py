@@ -0,0 +1,134 @@
+"""
+Relay for the visit history transactional outbox.
+
+Visit history writes land in the VisitHistoryOutbox table (PostgreSQL) inside
+the request transaction. This module drains pending rows into MongoDB in
+batches, retrying failures with exponential backoff. A MongoDB outage only
+delays delivery; it never counts against an entry's attempts.
+"""
+from datetime import timedelta
+from django.db import transaction
+from django.utils import timezone
+from .models import VisitHistoryOutbox
+from .mongo import MONGODB_BREAKER_RESET_TIMEOUT, MongoUnavailable, insert_visit_history_batch, mongo_breaker
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Backoff between retries: 5s, 10s, 20s, ... capped at 1 hour
+RETRY_BASE_SECONDS = 5
+RETRY_MAX_SECONDS = 3600
+
+# How long a claimed batch stays invisible to other relays while Mongo is
+# called; well above the server selection timeout
+CLAIM_LEASE_SECONDS = 300
+
+
+def _retry_delay(attempts):
+    """Exponential backoff delay for the given attempt count"""
+    return timedelta(seconds=min(RETRY_BASE_SECONDS * (2 ** (attempts - 1)), RETRY_MAX_SECONDS))
+
+
+def _record_failure(entry, error, now):
+    """Schedule a retry for an entry, or give up after MAX_ATTEMPTS"""
+    entry.attempts += 1
+    entry.last_error = error
+    if entry.attempts >= VisitHistoryOutbox.MAX_ATTEMPTS:
+        entry.status = 'FAILED'
+        logger.error(f"Giving up on visit history for appointment {entry.appointment_id}: {error}")
+    else:
+        entry.next_attempt_at = now + _retry_delay(entry.attempts)
+
+
+def _claim_entries(batch_size, now):
+    """
+    Claim due entries by pushing next_attempt_at past a lease, then commit.
+    
+    The row locks are only held for this short transaction; the Mongo call
+    happens after it. An entry whose relay dies mid-batch becomes due again
+    once the lease runs out.
+    """
+    with transaction.atomic():
+        entries = list(
+            VisitHistoryOutbox.objects.select_for_update(skip_locked=True).filter(
+                status='PENDING',
+                next_attempt_at__lte=now
+            ).order_by('id')[:batch_size]
+        )
+        if entries:
+            VisitHistoryOutbox.objects.filter(pk__in=[entry.pk for entry in entries]).update(
+                next_attempt_at=now + timedelta(seconds=CLAIM_LEASE_SECONDS)
+            )
+    return entries
+
+
+def relay_outbox_batch(batch_size=100):
+    """
+    Deliver one batch of pending outbox entries to MongoDB.
+    
+    Rows are claimed with SELECT ... FOR UPDATE SKIP LOCKED and a lease so
+    several relay processes can run side by side without double-sending (the
+    unique appointment_id index in Mongo catches anything that slips through).
+    Mongo is called outside any transaction, and the results are written
+    back in a second short one.
+    
+    While MongoDB is unavailable nothing is claimed, and a batch that hits an
+    outage is pushed back without using up attempts: MAX_ATTEMPTS only
+    counts errors for individual documents.
+    
+    Args:
+        batch_size (int): Maximum number of entries to deliver
+        
+    Returns:
+        dict: Counts of sent, duplicate, retried, failed and deferred entries
+    """
+    stats = {'sent': 0, 'duplicate': 0, 'retried': 0, 'failed': 0, 'deferred': 0}
+    if not mongo_breaker.allow_request():
+        return stats
+    
+    now = timezone.now()
+    entries = _claim_entries(batch_size, now)
+    if not entries:
+        return stats
+    
+    try:
+        inserted, duplicates, errors = insert_visit_history_batch(
+            [entry.as_visit_record() for entry in entries]
+        )
+    except MongoUnavailable as e:
+        VisitHistoryOutbox.objects.filter(pk__in=[entry.pk for entry in entries], status='PENDING').update(
+            next_attempt_at=timezone.now() + timedelta(seconds=MONGODB_BREAKER_RESET_TIMEOUT),
+            last_error=str(e)
+        )
+        stats['deferred'] = len(entries)
+        logger.warning(f"MongoDB unavailable; deferred {len(entries)} visit history outbox entries")
+        return stats
+    
+    now = timezone.now()
+    for entry in entries:
+        if entry.appointment_id in inserted:
+            entry.status = 'SENT'
+            entry.sent_at = now
+            entry.last_error = None
+            stats['sent'] += 1
+        elif entry.appointment_id in duplicates:
+            # The note stays in the row; the earlier Mongo record wins
+            entry.status = 'DUPLICATE'
+            entry.sent_at = now
+            entry.last_error = 'A visit history record already exists for this appointment.'
+            stats['duplicate'] += 1
+            logger.warning(
+                f"Visit history for appointment {entry.appointment_id} not delivered: "
+                f"a record already exists in MongoDB (outbox entry {entry.pk})"
+            )
+        else:
+            _record_failure(entry, errors.get(entry.appointment_id, 'Unknown error'), now)
+            stats['failed' if entry.status == 'FAILED' else 'retried'] += 1
+    
+    with transaction.atomic():
+        VisitHistoryOutbox.objects.bulk_update(
+            entries,
+            ['status', 'attempts', 'last_error', 'next_attempt_at', 'sent_at']
+        )
+    
+    return stats
@@ -0,0 +1,149 @@
+"""
+Parsing of free-form prescription text into structured records.
+
+Doctors type prescriptions like "Amoxicillin 500mg three times daily for 7
+days; Ibuprofen 400mg as needed". These are split into items and each item is
+parsed into drug, dose, frequency and duration so MongoDB can index the drug
+name and answer "who is currently on drug X" without string scans.
+"""
+import re
+from datetime import datetime, timedelta
+
+# Used for the end date when no duration is given
+DEFAULT_DURATION_DAYS = 30
+
+_ITEM_SEPARATOR = re.compile(r'[;\n]+')
+_DOSE = re.compile(
+    r'(\d+(?:\.\d+)?\s*(?:mg|mcg|µg|g|ml|iu|units?|%|tabs?|tablets?|caps?|capsules?|drops?|puffs?)\b)',
+    re.IGNORECASE
+)
+_DURATION = re.compile(r'\bfor\s+(\d+)\s*(day|week|month)s?\b', re.IGNORECASE)
+_FREQUENCIES = [
+    (re.compile(r'\b(once|one time)\s+(a\s+)?(daily|day)\b|\bod\b|\bqd\b', re.IGNORECASE), 'once daily'),
+    (re.compile(r'\b(twice|two times)\s+(a\s+)?(daily|day)\b|\bbid\b|\bb\.i\.d\.?', re.IGNORECASE), 'twice daily'),
+    (re.compile(r'\b(three times|thrice)\s+(a\s+)?(daily|day)\b|\btid\b|\bt\.i\.d\.?', re.IGNORECASE), 'three times daily'),
+    (re.compile(r'\bfour times\s+(a\s+)?(daily|day)\b|\bqid\b|\bq\.i\.d\.?', re.IGNORECASE), 'four times daily'),
+    (re.compile(r'\bevery\s+(\d+)\s*(hours?|hrs?|h)\b', re.IGNORECASE), None),  # normalized below
+    (re.compile(r'\bas needed\b|\bprn\b|\bwhen required\b', re.IGNORECASE), 'as needed'),
+    (re.compile(r'\b(at night|at bedtime)\b|\bqhs\b', re.IGNORECASE), 'at bedtime'),
+]
+_DAYS_PER_UNIT = {'day': 1, 'week': 7, 'month': 30}
+_LEADING_VERB = re.compile(r'^(take|apply|use|give|rinse with)\s+', re.IGNORECASE)
+_DRUG_AFTER_DOSE = re.compile(r'^\s*of\b', re.IGNORECASE)
+
+
+def normalize_drug_name(name):
+    """Lowercase and collapse whitespace so index lookups are exact"""
+    return ' '.join(str(name).lower().split())
+
+
+def _parse_frequency(text):
+    """Return a normalized frequency string or None"""
+    for pattern, label in _FREQUENCIES:
+        match = pattern.search(text)
+        if match:
+            if label is None:
+                return f'every {match.group(1)} hours'
+            return label
+    return None
+
+
+def _name_before_instructions(text):
+    """Normalized text before the first dose, duration or frequency"""
+    cut_points = [len(text)]
+    for pattern in (_DOSE, _DURATION, *(pattern for pattern, _ in _FREQUENCIES)):
+        match = pattern.search(text)
+        if match:
+            cut_points.append(match.start())
+    return normalize_drug_name(text[:min(cut_points)].strip(' ,-'))
+
+
+def parse_prescription_item(text):
+    """
+    Parse one prescription line.
+    
+    Args:
+        text (str): e.g. "Amoxicillin 500mg three times daily for 7 days" or
+            "Take 2 tablets of panadol every 6 hours"
+        
+    Returns:
+        dict or None: {drug, dose, frequency, duration_days}, or None if the
+            line has no recognizable drug name
+    """
+    text = _LEADING_VERB.sub('', text.strip(' ,.-\t'))
+    if not text:
+        return None
+    
+    dose_match = _DOSE.search(text)
+    duration_match = _DURATION.search(text)
+    
+    # The drug name is whatever precedes the dose (or the first instruction),
+    # or follows it in the "2 tablets of panadol every 6 hours" form
+    drug = _name_before_instructions(text)
+    if not drug and dose_match:
+        drug = _name_before_instructions(_DRUG_AFTER_DOSE.sub('', text[dose_match.end():]))
+    if not drug:
+        return None
+    
+    duration_days = None
+    if duration_match:
+        duration_days = int(duration_match.group(1)) * _DAYS_PER_UNIT[duration_match.group(2).lower()]
+    
+    return {
+        'drug': drug,
+        'dose': dose_match.group(1).replace(' ', '').lower() if dose_match else None,
+        'frequency': _parse_frequency(text),
+        'duration_days': duration_days,
+    }
+
+
+def _from_dict(item):
+    """Accept an already-structured item, normalizing its fields"""
+    drug = normalize_drug_name(item.get('drug') or '')
+    if not drug:
+        return None
+    duration_days = item.get('duration_days')
+    return {
+        'drug': drug,
+        'dose': item.get('dose') or None,
+        'frequency': item.get('frequency') or None,
+        'duration_days': int(duration_days) if duration_days not in (None, '') else None,
+    }
+
+
+def parse_prescriptions(prescription, visit_date):
+    """
+    Turn a prescription (string, list of strings or list of dicts) into
+    structured records with start and end dates.
+    
+    Args:
+        prescription (str or list): Prescription as submitted
+        visit_date (datetime): Start date for every item
+        
+    Returns:
+        list: Dicts with drug, dose, frequency, duration_days, start_date
+            and end_date (visit_date + duration, or DEFAULT_DURATION_DAYS)
+    """
+    if not prescription:
+        return []
+    
+    if isinstance(prescription, str):
+        raw_items = _ITEM_SEPARATOR.split(prescription)
+    else:
+        raw_items = list(prescription)
+    
+    items = []
+    for raw in raw_items:
+        if isinstance(raw, dict):
+            item = _from_dict(raw)
+        else:
+            item = parse_prescription_item(str(raw))
+        if item is None:
+            continue
+        
+        start_date = visit_date if isinstance(visit_date, datetime) else datetime.now()
+        item['start_date'] = start_date
+        item['end_date'] = start_date + timedelta(days=item['duration_days'] or DEFAULT_DURATION_DAYS)
+        items.append(item)
+    
+    return items
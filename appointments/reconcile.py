@@ -0,0 +1,166 @@
+"""
+Consistency check between PostgreSQL appointments and MongoDB visit history.
+
+Both stores are walked in appointment_id order: PostgreSQL with keyset
+pagination on the primary key, MongoDB with one appointment_id range query per
+tier for the same id range. Each chunk is merge-joined in memory, so memory use
+is bounded by the chunk size rather than the size of either store, and no Mongo
+cursor stays open while PostgreSQL is read or repairs are written.
+
+Discrepancy kinds:
+    orphan       Mongo record whose appointment no longer exists in PostgreSQL
+    mismatch     Mongo record whose patient_id/doctor_id differ from the appointment
+    duplicate    More than one Mongo record for the same appointment
+    undelivered  Outbox row marked SENT/DUPLICATE/FAILED but no Mongo record exists
+    missing      COMPLETED appointment with neither an outbox row nor a Mongo record
+"""
+from collections import Counter, defaultdict
+from django.utils import timezone
+from .models import Appointment, VisitHistoryOutbox
+from .mongo import (
+    delete_visit_history_records,
+    fix_visit_history_owners,
+    get_visit_history_keys,
+    get_visit_history_range_end
+)
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Outbox rows in these states claim the record is (or will never be) in MongoDB
+DELIVERED_OUTBOX_STATUSES = ('SENT', 'DUPLICATE', 'FAILED')
+
+
+class VisitHistoryReconciler:
+    """
+    Merge-join PostgreSQL appointments against MongoDB visit history.
+
+    Args:
+        chunk_size (int): Appointments read from PostgreSQL per chunk
+        repair (bool): Fix mismatches and requeue undelivered outbox rows
+        delete_orphans (bool): With repair, also delete orphan Mongo records
+        on_issue (callable): Called with each discrepancy dict as it is found
+    """
+
+    def __init__(self, chunk_size=5000, repair=False, delete_orphans=False, on_issue=None):
+        self.chunk_size = chunk_size
+        self.repair = repair
+        self.delete_orphans = delete_orphans
+        self.on_issue = on_issue
+        self.counts = Counter()
+
+    def run(self, after_appointment_id=0, on_chunk=None):
+        """
+        Reconcile every appointment_id greater than after_appointment_id.
+
+        Args:
+            after_appointment_id (int): Resume point (exclusive)
+            on_chunk (callable): Called with (last_appointment_id, counts) after
+                each chunk has been checked and repaired; use it to checkpoint
+
+        Returns:
+            Counter: Totals per discrepancy kind, plus 'appointments' and 'records'
+        """
+        last_id = after_appointment_id
+
+        while True:
+            rows = list(
+                Appointment.objects.filter(id__gt=last_id)
+                .order_by('id')
+                .values_list('id', 'patient_id', 'doctor_id', 'status', 'visit_history_outbox__status')
+                [:self.chunk_size]
+            )
+
+            if rows:
+                upper = rows[-1][0]
+                docs = get_visit_history_keys(last_id, upper)
+            else:
+                # PostgreSQL is exhausted: whatever is left in Mongo is orphaned
+                docs = get_visit_history_keys(last_id, get_visit_history_range_end(last_id, self.chunk_size))
+                if not docs:
+                    break
+                upper = docs[-1]['appointment_id']
+
+            self._reconcile_chunk(rows, docs)
+            last_id = upper
+            if on_chunk:
+                on_chunk(last_id, self.counts)
+
+        return self.counts
+
+    def _report(self, kind, **details):
+        self.counts[kind] += 1
+        if self.on_issue:
+            self.on_issue({'kind': kind, **details})
+
+    def _reconcile_chunk(self, rows, docs):
+        """Compare one chunk of appointments with the Mongo records in its id range"""
+        self.counts['appointments'] += len(rows)
+        self.counts['records'] += len(docs)
+
+        records_by_appointment = defaultdict(list)
+        for doc in docs:
+            records_by_appointment[doc['appointment_id']].append(doc)
+
+        fixes = []
+        requeue = []
+        orphans = []
+
+        for appointment_id, patient_id, doctor_id, appointment_status, outbox_status in rows:
+            records = records_by_appointment.pop(appointment_id, [])
+
+            if not records:
+                if outbox_status in DELIVERED_OUTBOX_STATUSES:
+                    self._report('undelivered', appointment_id=appointment_id, outbox_status=outbox_status)
+                    requeue.append(appointment_id)
+                elif appointment_status == 'COMPLETED' and outbox_status is None:
+                    self._report('missing', appointment_id=appointment_id)
+                continue
+
+            if len(records) > 1:
+                self._report('duplicate', appointment_id=appointment_id,
+                             records=[f"{r['tier']}:{r['_id']}" for r in records])
+
+            for record in records:
+                if record.get('patient_id') != patient_id or record.get('doctor_id') != doctor_id:
+                    self._report(
+                        'mismatch',
+                        appointment_id=appointment_id,
+                        record=f"{record['tier']}:{record['_id']}",
+                        mongo={'patient_id': record.get('patient_id'), 'doctor_id': record.get('doctor_id')},
+                        postgres={'patient_id': patient_id, 'doctor_id': doctor_id}
+                    )
+                    fixes.append({
+                        '_id': record['_id'],
+                        'tier': record['tier'],
+                        'appointment_id': appointment_id,
+                        'patient_id': patient_id,
+                        'doctor_id': doctor_id,
+                        'old_patient_id': record.get('patient_id'),
+                        'old_doctor_id': record.get('doctor_id'),
+                    })
+
+        for appointment_id, records in records_by_appointment.items():
+            for record in records:
+                self._report('orphan', appointment_id=appointment_id,
+                             record=f"{record['tier']}:{record['_id']}")
+                orphans.append(record)
+
+        if self.repair:
+            self._repair(fixes, requeue, orphans)
+
+    def _repair(self, fixes, requeue, orphans):
+        """Apply repairs for one chunk; PostgreSQL is treated as the source of truth"""
+        if fixes:
+            fix_visit_history_owners(fixes)
+            self.counts['fixed'] += len(fixes)
+
+        if requeue:
+            # The relay re-delivers these; an existing record is reported as DUPLICATE
+            self.counts['requeued'] += VisitHistoryOutbox.objects.filter(
+                appointment_id__in=requeue
+            ).update(status='PENDING', attempts=0, last_error=None, next_attempt_at=timezone.now())
+
+        if orphans and self.delete_orphans:
+            delete_visit_history_records(orphans)
+            self.counts['deleted'] += len(orphans)
@@ -0,0 +1,247 @@
+"""
+Appointment reminders.
+
+The scheduler (manage.py schedule_reminders) runs every minute or so. For
+each window in APPOINTMENT_REMINDER_WINDOWS, largest first (default
+24h,2h), it queues reminders for UPCOMING appointments whose start has
+entered that window since the previous run:
+
+    scanned_until < start <= now + window
+
+That is a range scan on the (appointment_date, appointment_time, status)
+index, so a run costs O(newly due) however many future bookings exist.
+Where the scan starts is stored per window in ReminderWindowState. A window
+never reaches below the next smaller window. An appointment booked or
+rescheduled after its 24h window opened therefore gets the 2h reminder
+only, and a scheduler outage skips reminders that are no longer
+meaningful.
+
+Queuing writes an AppointmentReminder marker (unique per appointment and
+window) and an 'appointments.send_reminder' job in the same transaction.
+The job worker delivers through APPOINTMENT_REMINDER_SENDER:
+'console' (default), 'file', 'email', or a dotted path to a
+ReminderSender subclass.
+
+Appointment dates and times are naive server-local times, as elsewhere in
+this app.
+"""
+from datetime import datetime, timedelta
+from decouple import config
+from django.conf import settings
+from django.core.mail import send_mail
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from jobs.queue import enqueue_many
+from .models import Appointment, AppointmentReminder, ReminderWindowState
+import abc
+import json
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+APPOINTMENT_REMINDER_WINDOWS = config('APPOINTMENT_REMINDER_WINDOWS', default='24h,2h')
+APPOINTMENT_REMINDER_SENDER = config('APPOINTMENT_REMINDER_SENDER', default='console')
+APPOINTMENT_REMINDER_FILE = config('APPOINTMENT_REMINDER_FILE', default='appointment_reminders.log')
+
+WINDOW_UNITS = {'m': 'minutes', 'h': 'hours', 'd': 'days'}
+
+
+def parse_windows(spec):
+    """
+    Parse a window list like '24h,2h,30m'.
+
+    Returns:
+        list[tuple[str, timedelta]]: (label, length) pairs, largest first
+
+    Raises:
+        ValueError: On an unrecognised window
+    """
+    windows = []
+    for label in (part.strip() for part in spec.split(',')):
+        if not label:
+            continue
+        match = re.fullmatch(r'(\d+)([mhd])', label)
+        if not match or int(match.group(1)) == 0:
+            raise ValueError(f"Invalid reminder window '{label}' (use e.g. 30m, 2h, 1d)")
+        windows.append((label, timedelta(**{WINDOW_UNITS[match.group(2)]: int(match.group(1))})))
+    return sorted(windows, key=lambda window: window[1], reverse=True)
+
+
+def _starting_between(lower, upper):
+    """Q for appointments starting in (lower, upper], as a range over (date, time)"""
+    after_lower = Q(appointment_date__gt=lower.date()) | Q(
+        appointment_date=lower.date(), appointment_time__gt=lower.time()
+    )
+    until_upper = Q(appointment_date__lt=upper.date()) | Q(
+        appointment_date=upper.date(), appointment_time__lte=upper.time()
+    )
+    return Q(appointment_date__range=(lower.date(), upper.date())) & after_lower & until_upper
+
+
+def schedule_reminders(windows=None, now=None):
+    """
+    Queue reminders for every window; see the module docstring.
+
+    Args:
+        windows (list): (label, timedelta) pairs, largest first (default: configured)
+        now (datetime): Aware current time (for tests and backfills)
+
+    Returns:
+        dict: Reminders queued per window label
+    """
+    windows = windows or parse_windows(APPOINTMENT_REMINDER_WINDOWS)
+    now = timezone.localtime(now or timezone.now())
+    local_now = now.replace(tzinfo=None)
+    queued = {}
+
+    for index, (label, length) in enumerate(windows):
+        floor = local_now + (windows[index + 1][1] if index + 1 < len(windows) else timedelta(0))
+        upper = local_now + length
+        try:
+            queued[label] = _schedule_window(label, floor, upper, now.tzinfo)
+        except IntegrityError:
+            # Another scheduler queued some of these first; the next run picks up the rest
+            logger.warning(f"Concurrent reminder scheduling for window {label}; retrying next run")
+            queued[label] = 0
+    return queued
+
+
+def _schedule_window(label, floor, upper, tz):
+    with transaction.atomic():
+        state = ReminderWindowState.objects.select_for_update().filter(window=label).first()
+        lower = floor
+        if state is not None:
+            lower = max(floor, timezone.localtime(state.scanned_until, tz).replace(tzinfo=None))
+        if lower >= upper:
+            return 0
+
+        due = list(
+            Appointment.objects.filter(_starting_between(lower, upper), status='UPCOMING')
+            .exclude(reminders__window=label)
+            .values_list('id', 'appointment_date', 'appointment_time')
+        )
+        reminders = AppointmentReminder.objects.bulk_create([
+            AppointmentReminder(
+                appointment_id=appointment_id,
+                window=label,
+                scheduled_for=timezone.make_aware(datetime.combine(day, start), tz),
+            )
+            for appointment_id, day, start in due
+        ])
+        enqueue_many('appointments.send_reminder', [{'reminder_id': reminder.pk} for reminder in reminders])
+
+        ReminderWindowState.objects.update_or_create(
+            window=label, defaults={'scanned_until': timezone.make_aware(upper, tz)}
+        )
+    if due:
+        logger.info(f"Queued {len(due)} {label} appointment reminder(s)")
+    return len(due)
+
+
+class ReminderSender(abc.ABC):
+    """Delivers one reminder; raise to have the job retried"""
+
+    @abc.abstractmethod
+    def send(self, reminder, appointment):
+        """Deliver the reminder for appointment"""
+
+    def message(self, reminder, appointment):
+        """Subject and body shared by the built-in senders"""
+        patient = appointment.patient
+        doctor = appointment.doctor
+        branch = appointment.branch.name if appointment.branch else 'Apex Dental Care'
+        subject = f"Reminder: your appointment on {appointment.appointment_date:%d %b %Y} at {appointment.appointment_time:%H:%M}"
+        body = f'''
+Dear {patient.get_full_name() or patient.email},
+
+This is a reminder of your appointment with Dr. {doctor.get_full_name() or doctor.email}
+on {appointment.appointment_date:%A, %d %B %Y} at {appointment.appointment_time:%H:%M} ({branch}).
+
+If you cannot attend, please cancel it in your account so the slot can be offered to another patient.
+
+Best regards,
+Apex Dental Care
+        '''
+        return subject, body
+
+
+class ConsoleReminderSender(ReminderSender):
+    """Log the reminder (local development)"""
+
+    def send(self, reminder, appointment):
+        subject, _ = self.message(reminder, appointment)
+        logger.info(f"[{reminder.window} reminder] to {appointment.patient.email}: {subject}")
+
+
+class FileReminderSender(ReminderSender):
+    """Append one JSON line per reminder to APPOINTMENT_REMINDER_FILE"""
+
+    def send(self, reminder, appointment):
+        subject, body = self.message(reminder, appointment)
+        with open(APPOINTMENT_REMINDER_FILE, 'a', encoding='utf-8') as log_file:
+            log_file.write(json.dumps({
+                'appointment_id': appointment.pk,
+                'window': reminder.window,
+                'to': appointment.patient.email,
+                'subject': subject,
+                'body': body,
+                'sent_at': timezone.now().isoformat(),
+            }) + '\n')
+
+
+class EmailReminderSender(ReminderSender):
+    """Email the patient"""
+
+    def send(self, reminder, appointment):
+        subject, body = self.message(reminder, appointment)
+        send_mail(
+            subject=subject,
+            message=body,
+            from_email=getattr(settings, 'DEFAULT_FROM_EMAIL', 'noreply@apexdental.com'),
+            recipient_list=[appointment.patient.email],
+        )
+
+
+SENDERS = {
+    'console': ConsoleReminderSender,
+    'file': FileReminderSender,
+    'email': EmailReminderSender,
+}
+
+
+def get_reminder_sender(name=None):
+    """Sender instance for a built-in name or a dotted path"""
+    name = name or APPOINTMENT_REMINDER_SENDER
+    sender_class = SENDERS.get(name) or import_string(name)
+    return sender_class()
+
+
+def deliver_reminder(reminder_id, sender=None):
+    """
+    Send one queued reminder, unless the appointment no longer matches it.
+
+    Returns:
+        str: The reminder's resulting status
+    """
+    reminder = AppointmentReminder.objects.select_related(
+        'appointment__patient', 'appointment__doctor', 'appointment__branch'
+    ).filter(pk=reminder_id).first()
+    if reminder is None or reminder.status != 'QUEUED':
+        return reminder.status if reminder else 'SKIPPED'
+
+    appointment = reminder.appointment
+    start = timezone.make_aware(
+        datetime.combine(appointment.appointment_date, appointment.appointment_time),
+        timezone.get_current_timezone()
+    )
+    if appointment.status != 'UPCOMING' or start != reminder.scheduled_for or start <= timezone.now():
+        reminder.status = 'SKIPPED'
+    else:
+        (sender or get_reminder_sender()).send(reminder, appointment)
+        reminder.status = 'SENT'
+        reminder.sent_at = timezone.now()
+    reminder.save(update_fields=['status', 'sent_at'])
+    return reminder.status
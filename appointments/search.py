@@ -0,0 +1,97 @@
+"""
+Full-text search over visit history notes and prescriptions.
+
+Production searches MongoDB's text index. On SQLite (local development) the
+FTS5 mirror of the visit history outbox created by migration 0004 is used
+instead, so search works without a MongoDB round trip. The mirror is fed by
+the outbox; run backfill_visit_history_outbox once to include history that
+only exists in MongoDB.
+"""
+from datetime import datetime
+from django.db import connection
+from decouple import config
+from .models import VisitHistoryOutbox
+from .mongo import text_search_visit_history
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Deep OFFSET pages cost as much as reading every row before them
+VISIT_HISTORY_SEARCH_MAX_PAGE = config('VISIT_HISTORY_SEARCH_MAX_PAGE', default=50, cast=int)
+
+
+def get_search_backend():
+    """
+    'mongo' or 'fts5', from VISIT_HISTORY_SEARCH_BACKEND or the DB engine.
+    
+    The FTS5 mirror only exists on SQLite, so 'fts5' is ignored elsewhere.
+    """
+    default = 'fts5' if connection.vendor == 'sqlite' else 'mongo'
+    backend = config('VISIT_HISTORY_SEARCH_BACKEND', default=default)
+    if backend == 'fts5' and connection.vendor != 'sqlite':
+        logger.warning(f"VISIT_HISTORY_SEARCH_BACKEND=fts5 needs SQLite, not {connection.vendor}; using mongo")
+        return 'mongo'
+    return backend
+
+
+def _fts5_query(text):
+    """Quote each term so user input can't break FTS5 query syntax"""
+    terms = [term.replace('"', '""') for term in text.split()]
+    return ' '.join(f'"{term}"' for term in terms if term)
+
+
+def _fts5_search(text, patient_id=None, doctor_id=None, skip=0, limit=20):
+    """Search the SQLite FTS5 mirror, ranked by bm25 (best first)"""
+    sql = [
+        'SELECT o.id, bm25(visit_history_fts, 1.0, 2.0) AS rank',
+        'FROM visit_history_fts JOIN visit_history_outbox o ON o.id = visit_history_fts.rowid',
+        'WHERE visit_history_fts MATCH %s',
+    ]
+    params = [_fts5_query(text)]
+    if patient_id is not None:
+        sql.append('AND o.patient_id = %s')
+        params.append(patient_id)
+    if doctor_id is not None:
+        sql.append('AND o.doctor_id = %s')
+        params.append(doctor_id)
+    sql.append('ORDER BY rank LIMIT %s OFFSET %s')
+    params.extend([limit, skip])
+    
+    with connection.cursor() as cursor:
+        cursor.execute(' '.join(sql), params)
+        ranked = cursor.fetchall()
+    
+    entries = VisitHistoryOutbox.objects.in_bulk([row[0] for row in ranked])
+    records = []
+    for entry_id, rank in ranked:
+        entry = entries[entry_id]
+        record = entry.as_visit_record()
+        record['visit_date'] = datetime.combine(entry.visit_date, datetime.min.time())
+        record['created_at'] = entry.created_at
+        # bm25 is lower-is-better; flip it so higher scores rank first like Mongo's
+        record['score'] = -rank
+        records.append(record)
+    return records
+
+
+def search_visit_history(text, patient_id=None, doctor_id=None, page=1, page_size=20):
+    """
+    Search visit history, scoped to a patient and/or doctor.
+    
+    Args:
+        text (str): Search terms
+        patient_id (int, optional): Restrict to one patient
+        doctor_id (int, optional): Restrict to one doctor
+        page (int): 1-based page number
+        page_size (int): Results per page
+        
+    Returns:
+        tuple: (records, has_more)
+    """
+    skip = (page - 1) * page_size
+    # Fetch one extra row to know whether another page exists
+    if get_search_backend() == 'fts5':
+        records = _fts5_search(text, patient_id, doctor_id, skip, page_size + 1)
+    else:
+        records = text_search_visit_history(text, patient_id, doctor_id, skip, page_size + 1)
+    return records[:page_size], len(records) > page_size
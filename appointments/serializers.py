@@ -143,6 +143,7 @@ class VisitHistorySerializer(serializers.Serializer):
     visit_date = serializers.DateTimeField()
     notes = serializers.CharField(required=False, allow_blank=True)
     prescription = serializers.CharField(required=False, allow_blank=True)
+    prescriptions = serializers.ListField(child=serializers.DictField(), read_only=True)
     created_at = serializers.DateTimeField(read_only=True)
     
     def validate_prescription(self, value):
@@ -152,6 +153,42 @@ class VisitHistorySerializer(serializers.Serializer):
         return value or ''
 
 
+class EnrichedVisitHistorySerializer(VisitHistorySerializer):
+    """
+    Visit history document plus the related PostgreSQL data attached by
+    VisitRecordEnricher.
+    """
+    patient = serializers.DictField(read_only=True, allow_null=True)
+    doctor = serializers.DictField(read_only=True, allow_null=True)
+    appointment = serializers.DictField(read_only=True, allow_null=True)
+    branch = serializers.DictField(read_only=True, allow_null=True)
+
+
+class VisitHistorySearchResultSerializer(VisitHistorySerializer):
+    """Visit history document with its full-text relevance score"""
+    score = serializers.FloatField(read_only=True)
+
+
+class PrescriptionSerializer(serializers.Serializer):
+    """Structured prescription record parsed from visit history"""
+    drug = serializers.CharField()
+    dose = serializers.CharField(allow_null=True)
+    frequency = serializers.CharField(allow_null=True)
+    duration_days = serializers.IntegerField(allow_null=True)
+    start_date = serializers.DateTimeField()
+    end_date = serializers.DateTimeField()
+    appointment_id = serializers.IntegerField(required=False)
+    doctor_id = serializers.IntegerField(required=False)
+
+
+class PatientOnDrugSerializer(serializers.Serializer):
+    """A patient with an active prescription for a drug"""
+    patient_id = serializers.IntegerField()
+    dose = serializers.CharField(allow_null=True)
+    frequency = serializers.CharField(allow_null=True)
+    end_date = serializers.DateTimeField()
+
+
 class VisitHistoryCreateSerializer(serializers.Serializer):
     """
     Serializer for creating visit history records.
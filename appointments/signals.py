@@ -0,0 +1,32 @@
+"""
+Signal handlers for appointments app
+"""
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from accounts.models import DoctorProfile, DoctorSchedule
+from .availability import refresh_next_free_slots
+from .models import Appointment
+
+
+def _refresh_on_commit(profiles_queryset):
+    transaction.on_commit(lambda: refresh_next_free_slots(profiles_queryset))
+
+
+@receiver(post_save, sender=Appointment)
+@receiver(post_delete, sender=Appointment)
+def refresh_slot_for_booking(sender, instance, **kwargs):
+    """Bookings, cancellations and status changes move the doctor's next free slot"""
+    _refresh_on_commit(DoctorProfile.objects.filter(user_id=instance.doctor_id))
+
+
+@receiver(post_save, sender=DoctorSchedule)
+@receiver(post_delete, sender=DoctorSchedule)
+def refresh_slot_for_schedule(sender, instance, **kwargs):
+    _refresh_on_commit(DoctorProfile.objects.filter(pk=instance.doctor_id))
+
+
+@receiver(post_save, sender=DoctorProfile)
+def refresh_slot_for_new_profile(sender, instance, created, **kwargs):
+    if created:
+        _refresh_on_commit(DoctorProfile.objects.filter(pk=instance.pk))
@@ -0,0 +1,11 @@
+"""
+Background jobs for the appointments app (run by manage.py runworker)
+"""
+from jobs.queue import job
+from .reminders import deliver_reminder
+
+
+@job('appointments.send_reminder', max_attempts=3)
+def send_reminder(reminder_id):
+    """Deliver a queued appointment reminder through the configured sender"""
+    deliver_reminder(reminder_id)
@@ -0,0 +1,798 @@
+"""
+Tests for the appointments app.
+
+MongoDB is never contacted: the Mongo helpers are patched where a test goes
+through them.
+"""
+from datetime import date, datetime, time, timedelta
+from unittest import mock
+import json
+from django.contrib import admin
+from django.core.cache import cache, caches
+from django.core.management import call_command
+from django.db import connection, connections
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from pymongo.errors import ConnectionFailure
+from rest_framework.test import APIClient
+from accounts.models import Branch, DoctorProfile, DoctorSchedule, User
+from clinic_appointment.admin_utils import EstimatedCountPaginator, LargeTableAdmin
+from jobs.models import Job
+from jobs.queue import claim_jobs, run_job
+from . import mongo
+from .availability import refresh_stale_next_free_slots
+from .enrichment import VisitRecordEnricher
+from .models import Appointment, AppointmentReminder, VisitHistoryOutbox
+from .mongo import (
+    CircuitBreaker, MongoUnavailable, VisitHistoryReadCache, _iter_json_array, cached_listing, mongo_guarded
+)
+from .outbox import relay_outbox_batch
+from .prescriptions import parse_prescription_item
+from .reconcile import VisitHistoryReconciler
+from .reminders import (
+    ConsoleReminderSender, ReminderSender, deliver_reminder, get_reminder_sender, schedule_reminders
+)
+from .search import get_search_backend, search_visit_history
+
+
+def make_user(username, user_type):
+    return User.objects.create_user(
+        username=username, email=f'{username}@apexdental.com', password='Passw0rd!', user_type=user_type
+    )
+
+
+def make_appointment(patient, doctor, days_ahead=1, start=time(9), **fields):
+    if 'branch' not in fields:
+        fields['branch'] = Branch.objects.first() or Branch.objects.create(name='Salmiya', address='Salem Al Mubarak St')
+    return Appointment.objects.create(
+        patient=patient, doctor=doctor,
+        appointment_date=date.today() + timedelta(days=days_ahead),
+        appointment_time=start, **fields
+    )
+
+
+def _failing_probe():
+    raise ConnectionFailure('still down')
+
+
+class CircuitBreakerTests(TestCase):
+    """Breaker state machine and the mongo_guarded decorator"""
+
+    def setUp(self):
+        # Long reset timeout: the probe thread never fires during a test
+        self.breaker = CircuitBreaker(failure_threshold=2, reset_timeout=3600, probe=_failing_probe)
+        patcher = mock.patch.object(mongo, 'mongo_breaker', self.breaker)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_opens_after_consecutive_failures(self):
+        self.breaker.record_failure()
+        self.assertTrue(self.breaker.allow_request())
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+        self.assertFalse(self.breaker.allow_request())
+
+    def test_success_resets_failure_count(self):
+        self.breaker.record_failure()
+        self.breaker.record_success()
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_probe_closes_circuit(self):
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.01, probe=lambda: None)
+        breaker.record_failure()
+        breaker._probe_thread.join(timeout=5)
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+        self.assertTrue(breaker.allow_request())
+
+    def test_guarded_read_serves_stale_copy_while_open(self):
+        calls = []
+
+        @mongo_guarded(read=True)
+        def read(key):
+            calls.append(key)
+            if len(calls) > 1:
+                raise ConnectionFailure('down')
+            return ['record']
+
+        self.assertEqual(read(1), ['record'])
+        for _ in range(2):
+            with self.assertRaises(MongoUnavailable):
+                read(1)
+        self.assertFalse(self.breaker.allow_request())
+
+        calls.clear()
+        self.assertEqual(read(1), ['record'])
+        self.assertEqual(calls, [])  # Served without calling Mongo
+        with self.assertRaises(MongoUnavailable):
+            read(2)  # Never read before: nothing stale to serve
+
+    def test_guarded_write_fails_fast_while_open(self):
+        write = mock.Mock(__name__='write')
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+        with self.assertRaises(MongoUnavailable):
+            mongo_guarded()(write)()
+        write.assert_not_called()
+
+
+class VisitHistoryUnavailableTests(TestCase):
+    """Visit history endpoints answer 503 with Retry-After while Mongo is down"""
+
+    def setUp(self):
+        self.patient = User.objects.create_user(
+            username='patient', email='patient@example.com', password='Passw0rd!', user_type='PATIENT'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.patient)
+
+    def test_list_returns_503(self):
+        with mock.patch('appointments.visit_history_views.get_visit_history_by_patient',
+                        side_effect=MongoUnavailable('Visit history service is temporarily unavailable.')):
+            response = self.client.get('/api/visit-history/')
+        self.assertEqual(response.status_code, 503)
+        self.assertIn('Retry-After', response)
+        self.assertEqual(response.json()['error'], 'Visit history service is temporarily unavailable.')
+
+    def test_stream_returns_503(self):
+        with mock.patch('appointments.visit_history_views.stream_visit_history_json',
+                        side_effect=MongoUnavailable('down')):
+            response = self.client.get('/api/visit-history/stream/')
+        self.assertEqual(response.status_code, 503)
+
+
+class OutboxRelayTests(TestCase):
+    """Delivery of outbox rows to Mongo (insert_visit_history_batch is patched)"""
+
+    def setUp(self):
+        patient = make_user('patient', 'PATIENT')
+        doctor = make_user('doctor', 'STAFF')
+        self.entries = []
+        for hour in (9, 10):
+            appointment = make_appointment(patient, doctor, start=time(hour), status='COMPLETED')
+            self.entries.append(VisitHistoryOutbox.objects.create(
+                appointment=appointment, patient_id=patient.pk, doctor_id=doctor.pk,
+                visit_date=appointment.appointment_date, notes='Checkup'
+            ))
+
+    def relay(self, **result):
+        outcome = (result.get('inserted', set()), result.get('duplicates', set()), result.get('errors', {}))
+        with mock.patch('appointments.outbox.insert_visit_history_batch', return_value=outcome) as insert:
+            stats = relay_outbox_batch()
+        return stats, insert
+
+    def test_sent_and_duplicate(self):
+        first, second = (entry.appointment_id for entry in self.entries)
+        stats, insert = self.relay(inserted={first}, duplicates={second})
+        self.assertEqual(stats, {'sent': 1, 'duplicate': 1, 'retried': 0, 'failed': 0, 'deferred': 0})
+        self.assertEqual(len(insert.call_args.args[0]), 2)
+        statuses = dict(VisitHistoryOutbox.objects.values_list('appointment_id', 'status'))
+        self.assertEqual(statuses, {first: 'SENT', second: 'DUPLICATE'})
+        # Nothing left to deliver
+        stats, insert = self.relay()
+        insert.assert_not_called()
+
+    def test_errors_are_retried_with_backoff_then_failed(self):
+        errors = {entry.appointment_id: 'boom' for entry in self.entries}
+        stats, _ = self.relay(errors=errors)
+        self.assertEqual(stats['retried'], 2)
+        entry = VisitHistoryOutbox.objects.get(pk=self.entries[0].pk)
+        self.assertEqual((entry.status, entry.attempts, entry.last_error), ('PENDING', 1, 'boom'))
+        self.assertGreater(entry.next_attempt_at, timezone.now())
+
+        # Not due yet
+        stats, insert = self.relay(errors=errors)
+        insert.assert_not_called()
+
+        VisitHistoryOutbox.objects.update(
+            attempts=VisitHistoryOutbox.MAX_ATTEMPTS - 1, next_attempt_at=timezone.now()
+        )
+        stats, _ = self.relay(errors=errors)
+        self.assertEqual(stats['failed'], 2)
+        self.assertEqual(set(VisitHistoryOutbox.objects.values_list('status', flat=True)), {'FAILED'})
+
+    def test_mongo_unavailable_defers_without_using_attempts(self):
+        with mock.patch('appointments.outbox.insert_visit_history_batch', side_effect=MongoUnavailable('down')):
+            stats = relay_outbox_batch()
+        self.assertEqual((stats['deferred'], stats['retried']), (2, 0))
+        entry = VisitHistoryOutbox.objects.get(pk=self.entries[0].pk)
+        self.assertEqual((entry.status, entry.attempts), ('PENDING', 0))
+        self.assertGreater(entry.next_attempt_at, timezone.now())
+
+    def test_long_outage_keeps_entries_pending(self):
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=3600, probe=_failing_probe)
+        with mock.patch.object(mongo, 'mongo_breaker', breaker), \
+                mock.patch('appointments.outbox.mongo_breaker', breaker), \
+                mock.patch.object(mongo, 'get_visit_history_collection', side_effect=ConnectionFailure('down')):
+            for _ in range(VisitHistoryOutbox.MAX_ATTEMPTS + 2):
+                VisitHistoryOutbox.objects.update(next_attempt_at=timezone.now())
+                relay_outbox_batch()
+            self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        self.assertEqual(
+            set(VisitHistoryOutbox.objects.values_list('status', 'attempts')), {('PENDING', 0)}
+        )
+
+    def test_mongo_is_called_after_the_claim_commits(self):
+        # TestCase wraps the test in atomic blocks; any extra one is the relay's
+        depth = len(connection.savepoint_ids)
+
+        def insert(records):
+            self.assertEqual(len(connection.savepoint_ids), depth)
+            # Leased: another relay would not pick these rows up
+            self.assertFalse(VisitHistoryOutbox.objects.filter(next_attempt_at__lte=timezone.now()).exists())
+            return {record['appointment_id'] for record in records}, set(), {}
+
+        with mock.patch('appointments.outbox.insert_visit_history_batch', side_effect=insert):
+            stats = relay_outbox_batch()
+        self.assertEqual(stats['sent'], 2)
+
+
+class AddVisitHistoryTests(TestCase):
+    """add_visit_history writes to the outbox and refuses duplicates"""
+
+    def setUp(self):
+        self.doctor = make_user('doctor', 'STAFF')
+        self.appointment = make_appointment(make_user('patient', 'PATIENT'), self.doctor, status='COMPLETED')
+        self.url = f'/api/appointments/{self.appointment.pk}/add_visit_history/'
+        self.client = APIClient()
+        self.client.force_authenticate(self.doctor)
+
+    def post(self, existing=None, **lookup):
+        with mock.patch('appointments.views.get_visit_history_by_appointment',
+                        return_value=existing, **lookup):
+            return self.client.post(self.url, {'notes': 'Filling', 'prescription': 'Ibuprofen 400mg'}, format='json')
+
+    def test_creates_outbox_row(self):
+        response = self.post()
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(VisitHistoryOutbox.objects.get().notes, 'Filling')
+        # Second submission hits the outbox unique constraint
+        self.assertEqual(self.post().status_code, 400)
+        self.assertEqual(VisitHistoryOutbox.objects.count(), 1)
+
+    def test_existing_mongo_record_is_refused(self):
+        response = self.post(existing={'appointment_id': self.appointment.pk})
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(VisitHistoryOutbox.objects.exists())
+
+    def test_accepted_while_mongo_is_down(self):
+        response = self.post(side_effect=MongoUnavailable('down'))
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(VisitHistoryOutbox.objects.exists())
+
+
+class VisitAnalyticsTests(TestCase):
+    """Aggregation pipelines and the cached analytics endpoint"""
+
+    def setUp(self):
+        cache.clear()
+        self.collection = mock.Mock()
+        self.collection.aggregate.return_value = iter([{'doctor_id': 7, 'year': 2026, 'month': 1, 'visits': 3}])
+        breaker = CircuitBreaker(failure_threshold=3, reset_timeout=3600, probe=_failing_probe)
+        for patcher in (mock.patch.object(mongo, 'get_visit_history_collection', return_value=self.collection),
+                        mock.patch.object(mongo, 'mongo_breaker', breaker)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def pipeline(self):
+        return self.collection.aggregate.call_args.args[0]
+
+    def test_pipelines_start_with_an_indexed_match(self):
+        start, end = date.today() - timedelta(days=30), date.today()
+        rows = mongo.visits_per_doctor_per_month(start, end, doctor_id=7)
+        self.assertEqual(rows, [{'doctor_id': 7, 'year': 2026, 'month': 1, 'visits': 3}])
+        # Inclusive end date: up to the following midnight; recent ranges skip the archive
+        self.assertEqual(self.pipeline()[0], {'$match': {'doctor_id': 7, 'visit_date': {
+            '$gte': datetime.combine(start, time()), '$lt': datetime.combine(end + timedelta(days=1), time())
+        }}})
+        self.assertNotIn('$unionWith', self.pipeline()[1])
+
+        mongo.prescription_frequency(doctor_id=7, include_archive=True)
+        self.assertEqual(self.pipeline()[0], {'$match': {'doctor_id': 7, 'prescription': {'$nin': ['', None]}}})
+        self.assertEqual(self.pipeline()[1]['$unionWith']['pipeline'], [self.pipeline()[0]])
+
+        mongo.repeat_visit_intervals(patient_id=5)
+        self.assertEqual(self.pipeline()[0], {'$match': {'patient_id': 5}})
+        self.assertIn('$setWindowFields', self.pipeline()[1])
+
+    def test_endpoint_scopes_validates_and_caches(self):
+        report = mock.Mock(return_value=[{'visits': 1}])
+        client = APIClient()
+        url = '/api/visit-history/analytics/'
+        with mock.patch.dict('appointments.visit_history_views.ANALYTICS_REPORTS', {'visits_per_doctor': report},
+                             clear=True):
+            client.force_authenticate(make_user('patient', 'PATIENT'))
+            self.assertEqual(client.get(url).status_code, 403)
+
+            doctor = make_user('doctor', 'STAFF')
+            client.force_authenticate(doctor)
+            self.assertEqual(client.get(url, {'start': '2026-13-01'}).status_code, 400)
+            self.assertEqual(client.get(url, {'report': 'revenue'}).status_code, 400)
+
+            for _ in range(2):
+                response = client.get(url, {'doctor_id': 999, 'start': '2026-01-01'})
+                self.assertEqual(response.json(), {'visits_per_doctor': [{'visits': 1}]})
+        # Doctors only see their own visits, and the second request was cached
+        report.assert_called_once_with(
+            start_date=date(2026, 1, 1), end_date=None, doctor_id=doctor.pk, include_archive=False
+        )
+
+
+class VisitRecordEnricherTests(TestCase):
+    """Batched PG lookups behind ?enrich=true"""
+
+    def setUp(self):
+        self.patient = make_user('patient', 'PATIENT')
+        self.doctor = make_user('doctor', 'STAFF')
+        self.appointments = [
+            make_appointment(self.patient, self.doctor, start=time(hour), status='COMPLETED') for hour in (9, 10, 11)
+        ]
+
+    def records(self, *appointments):
+        return [{'appointment_id': appointment.pk, 'patient_id': self.patient.pk, 'doctor_id': self.doctor.pk,
+                 'visit_date': datetime(2026, 1, 5)}
+                for appointment in appointments]
+
+    def test_one_query_per_table_and_no_repeats(self):
+        enricher = VisitRecordEnricher()
+        # Users, appointments, branches
+        with self.assertNumQueries(3):
+            records = enricher.enrich(self.records(*self.appointments))
+        self.assertEqual(records[0]['doctor']['email'], 'doctor@apexdental.com')
+        self.assertEqual(records[1]['appointment']['appointment_time'], time(10))
+        self.assertEqual(records[2]['branch']['name'], 'Salmiya')
+
+        with self.assertNumQueries(0):
+            enricher.enrich(self.records(*self.appointments))
+
+    def test_missing_rows_become_none(self):
+        records = self.records(self.appointments[0]) + [{'appointment_id': 9999, 'patient_id': 9998, 'doctor_id': None}]
+        enricher = VisitRecordEnricher()
+        enricher.enrich(records)
+        self.assertEqual((records[1]['patient'], records[1]['doctor']), (None, None))
+        self.assertEqual((records[1]['appointment'], records[1]['branch']), (None, None))
+        # Misses are remembered too
+        with self.assertNumQueries(0):
+            enricher.enrich(records[1:])
+
+    def test_endpoint_enriches_on_request(self):
+        client = APIClient()
+        client.force_authenticate(self.doctor)
+        with mock.patch('appointments.visit_history_views.get_visit_history_by_doctor',
+                        return_value=self.records(self.appointments[0])):
+            plain = client.get('/api/visit-history/').json()
+            enriched = client.get('/api/visit-history/', {'enrich': 'true'}).json()
+        self.assertNotIn('patient', plain[0])
+        self.assertEqual(enriched[0]['patient']['id'], self.patient.pk)
+
+
+class FakeCursor:
+    """Iterable standing in for a pymongo cursor; raises `error` after `docs`"""
+
+    def __init__(self, docs, error=None):
+        self.docs = docs
+        self.error = error
+        self.closed = False
+
+    def __iter__(self):
+        yield from self.docs
+        if self.error:
+            raise self.error
+
+    def close(self):
+        self.closed = True
+
+
+class StreamJsonTests(TestCase):
+    """JSON array streaming used by /api/visit-history/stream/"""
+
+    def setUp(self):
+        self.breaker = CircuitBreaker(failure_threshold=5, reset_timeout=3600, probe=_failing_probe)
+        patcher = mock.patch.object(mongo, 'mongo_breaker', self.breaker)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_complete_stream_is_valid_json(self):
+        docs = [{'_id': str(i), 'appointment_id': i} for i in range(5)]
+        cursor = FakeCursor(docs)
+        body = b''.join(_iter_json_array(cursor, batch_size=2))
+        self.assertEqual(json.loads(body), docs)
+        self.assertTrue(cursor.closed)
+
+    def test_empty_stream(self):
+        self.assertEqual(json.loads(b''.join(_iter_json_array(FakeCursor([]), 2))), [])
+
+    def test_interrupted_stream_is_not_closed(self):
+        cursor = FakeCursor([{'appointment_id': i} for i in range(3)], ConnectionFailure('reset'))
+        chunks = []
+        with self.assertRaises(ConnectionFailure):
+            for part in _iter_json_array(cursor, batch_size=2):
+                chunks.append(part)
+        body = b''.join(chunks)
+        self.assertTrue(body.startswith(b'['))
+        self.assertFalse(body.endswith(b']'))
+        self.assertTrue(cursor.closed)
+        self.assertEqual(self.breaker.failure_count, 1)
+
+
+class VisitHistoryReadCacheTests(TestCase):
+    """
+    The listing cache is shared through the 'visit_history' alias. Two
+    VisitHistoryReadCache instances on it stand in for two processes.
+    """
+
+    def setUp(self):
+        caches['visit_history'].clear()
+        self.web = VisitHistoryReadCache('visit_history', ttl=60)
+        self.relay = VisitHistoryReadCache('visit_history', ttl=60)
+        self.key = ('patient', 7)
+
+    def test_invalidation_from_another_process(self):
+        found, _, version = self.web.get(self.key)
+        self.assertFalse(found)
+        self.web.set(self.key, ['visit'], version)
+        self.assertEqual(self.web.get(self.key)[:2], (True, ['visit']))
+
+        self.relay.invalidate(self.key)
+        self.assertFalse(self.web.get(self.key)[0])
+
+    def test_listing_built_during_a_write_is_not_served(self):
+        _, _, version = self.web.get(self.key)
+        self.relay.invalidate(self.key)  # Lands while the listing is being built
+        self.web.set(self.key, ['outdated'], version)
+        self.assertFalse(self.web.get(self.key)[0])
+
+    def test_stats_are_summed_across_processes(self):
+        self.web.get(self.key)
+        self.relay.get(self.key)
+        self.relay.invalidate(self.key)
+        self.relay.flush_stats()
+        stats = self.web.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['invalidations']), (0, 2, 1))
+
+    def test_cached_listing(self):
+        calls = []
+
+        @cached_listing('doctor')
+        def listing(doctor_id, start_date=None, end_date=None, include_archive=False):
+            calls.append((doctor_id, start_date or include_archive))
+            return [doctor_id]
+
+        with mock.patch.object(mongo, 'visit_history_cache', self.web):
+            self.assertEqual(listing(3), [3])
+            self.assertEqual(listing(3), [3])
+            listing(3, start_date=date(2024, 1, 1))  # Ranged calls bypass the cache
+            listing(3, include_archive=True)
+            mongo.invalidate_visit_history(doctor_id=3)
+            listing(3)
+        self.assertEqual(calls, [(3, False), (3, date(2024, 1, 1)), (3, True), (3, False)])
+
+
+class ArchiveTierTests(TestCase):
+    """Archived visit history is only read when asked for"""
+
+    def setUp(self):
+        self.hot = mock.MagicMock()
+        self.archive = mock.MagicMock()
+        for name, collection in (('get_visit_history_collection', self.hot),
+                                 ('get_visit_history_archive_collection', self.archive)):
+            patcher = mock.patch.object(mongo, name, return_value=collection)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_open_ranges_stay_on_the_hot_tier(self):
+        self.assertFalse(mongo._range_reaches_archive(None))
+        self.assertEqual(mongo._match_across_tiers({'patient_id': 1}), [{'$match': {'patient_id': 1}}])
+
+        mongo._find_visit_history({'patient_id': 1})
+        self.hot.find.assert_called_once()
+        self.hot.aggregate.assert_not_called()
+
+    def test_old_ranges_and_include_archive_read_both_tiers(self):
+        old_start = mongo.archive_cutoff().date() - timedelta(days=1)
+        self.assertTrue(mongo._range_reaches_archive(old_start))
+        stages = mongo._match_across_tiers({}, include_archive=True)
+        self.assertEqual(stages[1]['$unionWith']['coll'], mongo.MONGODB_ARCHIVE_COLLECTION_NAME)
+
+        mongo._find_visit_history({'patient_id': 1}, include_archive=True)
+        self.hot.aggregate.assert_called_once()
+        self.hot.find.assert_not_called()
+
+    def test_stream_sorts_on_the_index_without_disk_use(self):
+        mongo.stream_visit_history_json({'doctor_id': 2})
+        pipeline = self.hot.aggregate.call_args.args[0]
+        self.assertFalse(any('$unionWith' in stage for stage in pipeline))
+        self.assertFalse(self.hot.aggregate.call_args.kwargs['allowDiskUse'])
+
+    def test_archive_batch_walks_visit_date_and_invalidates_listings(self):
+        docs = [
+            {'_id': 1, 'appointment_id': 1, 'patient_id': 10, 'doctor_id': 20},
+            {'_id': 2, 'appointment_id': 2, 'patient_id': 11, 'doctor_id': 20},
+        ]
+        self.hot.find.return_value.sort.return_value.limit.return_value = docs
+        with mock.patch.object(mongo, 'invalidate_visit_history') as invalidate:
+            moved = mongo.archive_visit_history_batch(mongo.archive_cutoff(), batch_size=2)
+        self.assertEqual(moved, 2)
+        self.hot.find.return_value.sort.assert_called_once_with('visit_date', 1)
+        self.archive.insert_many.assert_called_once_with(docs, ordered=False)
+        self.hot.delete_many.assert_called_once_with({'_id': {'$in': [1, 2]}})
+        invalidated = {tuple(sorted(call.kwargs.items())) for call in invalidate.call_args_list}
+        self.assertEqual(invalidated, {
+            (('patient_id', 10),), (('patient_id', 11),), (('doctor_id', 20),)
+        })
+
+
+class VisitHistorySearchTests(TestCase):
+    """FTS5 search on SQLite and the outbox backfill that feeds it"""
+
+    def setUp(self):
+        self.patient = make_user('patient1', 'PATIENT')
+        self.doctor = make_user('doctor1', 'STAFF')
+        self.appointment = make_appointment(self.patient, self.doctor)
+
+    def _mongo_record(self, appointment_id, notes):
+        return {
+            '_id': appointment_id, 'appointment_id': appointment_id,
+            'patient_id': self.patient.id, 'doctor_id': self.doctor.id,
+            'visit_date': timezone.now().replace(tzinfo=None), 'notes': notes, 'prescription': '',
+        }
+
+    def test_fts5_only_on_sqlite(self):
+        self.assertEqual(get_search_backend(), 'fts5')
+        with mock.patch('appointments.search.connection') as connection, \
+                mock.patch('appointments.search.config', return_value='fts5'):
+            connection.vendor = 'postgresql'
+            self.assertEqual(get_search_backend(), 'mongo')
+
+    def test_backfill_indexes_mongo_only_history(self):
+        pages = [[self._mongo_record(self.appointment.id, 'root canal on lower molar'),
+                  self._mongo_record(self.appointment.id + 100, 'appointment was deleted')], []]
+        with mock.patch('appointments.management.commands.backfill_visit_history_outbox.get_visit_history_page',
+                        side_effect=pages):
+            call_command('backfill_visit_history_outbox', stdout=mock.Mock())
+
+        entry = VisitHistoryOutbox.objects.get()
+        self.assertEqual((entry.appointment_id, entry.status), (self.appointment.id, 'SENT'))
+        records, has_more = search_visit_history('molar', patient_id=self.patient.id)
+        self.assertEqual([record['appointment_id'] for record in records], [self.appointment.id])
+        self.assertFalse(has_more)
+
+    def test_page_is_capped(self):
+        client = APIClient()
+        client.force_authenticate(self.patient)
+        response = client.get('/api/visit-history/search/', {'q': 'molar', 'page': 10_000})
+        self.assertEqual(response.status_code, 400)
+
+    def test_page_stops_where_a_tier_filled_its_limit(self):
+        hot, archive = mock.MagicMock(), mock.MagicMock()
+        hot.find.return_value.sort.return_value.limit.return_value = [{'appointment_id': 1}, {'appointment_id': 5}]
+        archive.find.return_value.sort.return_value.limit.return_value = [{'appointment_id': 2}, {'appointment_id': 3}]
+        with mock.patch.object(mongo, 'get_visit_history_collection', return_value=hot), \
+                mock.patch.object(mongo, 'get_visit_history_archive_collection', return_value=archive):
+            docs = mongo.get_visit_history_page(0, limit=2)
+        # 4 and 5 may sit in the archive's next page, so the page ends at 3
+        self.assertEqual([doc['appointment_id'] for doc in docs], [1, 2, 3])
+
+
+class PrescriptionParsingTests(TestCase):
+    """Free-text prescription lines to structured items"""
+
+    def test_drug_before_dose(self):
+        self.assertEqual(parse_prescription_item('Amoxicillin 500mg three times daily for 7 days'), {
+            'drug': 'amoxicillin', 'dose': '500mg', 'frequency': 'three times daily', 'duration_days': 7,
+        })
+
+    def test_drug_after_dose(self):
+        self.assertEqual(parse_prescription_item('take 2 tablets of panadol every 6 hours'), {
+            'drug': 'panadol', 'dose': '2tablets', 'frequency': 'every 6 hours', 'duration_days': None,
+        })
+
+    def test_no_drug_name(self):
+        self.assertIsNone(parse_prescription_item('500mg twice daily'))
+        self.assertIsNone(parse_prescription_item('apply 1 drop of'))
+
+
+class ReconcilerTests(TestCase):
+    """Chunked merge-join of appointments against Mongo key ranges"""
+
+    def setUp(self):
+        patient = make_user('patient1', 'PATIENT')
+        self.doctor = make_user('doctor1', 'STAFF')
+        self.appointments = [make_appointment(patient, self.doctor, start=time(9 + i)) for i in range(3)]
+        self.records = [
+            {'_id': f'r{a.id}', 'appointment_id': a.id, 'patient_id': a.patient_id,
+             'doctor_id': a.doctor_id, 'tier': 'hot'}
+            for a in self.appointments
+        ]
+        self.records[1]['doctor_id'] = self.doctor.id + 1000
+        last_id = self.appointments[-1].id
+        self.records += [
+            {'_id': f'o{i}', 'appointment_id': last_id + i, 'patient_id': 1, 'doctor_id': 1, 'tier': 'archive'}
+            for i in (1, 2, 3)
+        ]
+        self.ranges = []
+
+    def _keys(self, after, upto=None):
+        self.ranges.append((after, upto))
+        return [dict(doc) for doc in self.records
+                if doc['appointment_id'] > after and (upto is None or doc['appointment_id'] <= upto)]
+
+    def _range_end(self, after, count):
+        later = [doc['appointment_id'] for doc in self.records if doc['appointment_id'] > after]
+        return sorted(later)[count - 1] if len(later) >= count else None
+
+    def test_each_chunk_reads_its_own_id_range(self):
+        with mock.patch('appointments.reconcile.get_visit_history_keys', side_effect=self._keys), \
+                mock.patch('appointments.reconcile.get_visit_history_range_end', side_effect=self._range_end):
+            counts = VisitHistoryReconciler(chunk_size=2).run()
+
+        first, second, third = (a.id for a in self.appointments)
+        self.assertEqual(self.ranges[:2], [(0, second), (second, third)])
+        self.assertEqual((counts['appointments'], counts['records']), (3, 6))
+        self.assertEqual((counts['mismatch'], counts['orphan']), (1, 3))
+
+
+class ReminderSenderTests(TestCase):
+    """Reminder sender plug-in point"""
+
+    def test_senders_must_implement_send(self):
+        class Incomplete(ReminderSender):
+            pass
+
+        with self.assertRaises(TypeError):
+            ReminderSender()
+        with self.assertRaises(TypeError):
+            Incomplete()
+        self.assertIsInstance(get_reminder_sender('console'), ConsoleReminderSender)
+
+
+class ReminderSchedulingTests(TestCase):
+    """Due-window scan, the reminder jobs and delivery"""
+
+    def setUp(self):
+        self.patient = make_user('patient', 'PATIENT')
+        self.doctor = make_user('doctor', 'STAFF')
+        self.now = timezone.localtime().replace(second=0, microsecond=0)
+        self.soon = self.booking(hours=1)      # Inside the 2h window
+        self.tomorrow = self.booking(hours=23)  # Inside the 24h window only
+        self.booking(hours=72)                  # Not due yet
+        self.sender = mock.Mock(spec=ReminderSender)
+        patcher = mock.patch('appointments.reminders.get_reminder_sender', return_value=self.sender)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def booking(self, hours):
+        start = self.now + timedelta(hours=hours)
+        return make_appointment(self.patient, self.doctor, days_ahead=(start.date() - date.today()).days,
+                                start=start.time(), status='UPCOMING')
+
+    def reminder_jobs(self):
+        return Job.objects.filter(name='appointments.send_reminder')
+
+    def test_second_pass_queues_nothing(self):
+        self.assertEqual(schedule_reminders(now=self.now), {'24h': 1, '2h': 1})
+        self.assertEqual(schedule_reminders(now=self.now), {'24h': 0, '2h': 0})
+        self.assertEqual(self.reminder_jobs().count(), 2)
+        self.assertEqual(
+            set(AppointmentReminder.objects.values_list('appointment_id', 'window')),
+            {(self.soon.pk, '2h'), (self.tomorrow.pk, '24h')}
+        )
+
+        # The scan resumes where it stopped: tomorrow's booking enters the 2h window later
+        self.assertEqual(schedule_reminders(now=self.now + timedelta(hours=22)), {'24h': 0, '2h': 1})
+        self.assertEqual(self.reminder_jobs().count(), 3)
+
+    def test_failed_send_is_retried_without_double_sending(self):
+        schedule_reminders(now=self.now)
+        self.sender.send.side_effect = [RuntimeError('SMTP down'), None, None]
+
+        claimed = claim_jobs('worker', 10)
+        outcomes = sorted(run_job(claimed_job) for claimed_job in claimed)
+        self.assertEqual(outcomes, ['retried', 'succeeded'])
+        self.assertEqual(set(AppointmentReminder.objects.values_list('status', flat=True)), {'QUEUED', 'SENT'})
+
+        Job.objects.filter(status='PENDING').update(run_at=timezone.now())
+        self.assertEqual([run_job(claimed_job) for claimed_job in claim_jobs('worker', 10)], ['succeeded'])
+        self.assertEqual(set(AppointmentReminder.objects.values_list('status', flat=True)), {'SENT'})
+        self.assertEqual(self.sender.send.call_count, 3)
+
+        # A duplicate delivery of an already sent reminder sends nothing
+        reminder = AppointmentReminder.objects.first()
+        self.assertEqual(deliver_reminder(reminder.pk), 'SENT')
+        self.assertEqual(self.sender.send.call_count, 3)
+
+    def test_deliver_marks_sent_or_skipped(self):
+        schedule_reminders(now=self.now)
+        sent = AppointmentReminder.objects.get(appointment=self.soon)
+        self.assertEqual(deliver_reminder(sent.pk), 'SENT')
+        sent.refresh_from_db()
+        self.assertEqual(sent.status, 'SENT')
+        self.assertIsNotNone(sent.sent_at)
+
+        # Cancelled after the reminder was queued
+        Appointment.objects.filter(pk=self.tomorrow.pk).update(status='CANCELLED')
+        skipped = AppointmentReminder.objects.get(appointment=self.tomorrow)
+        self.assertEqual(deliver_reminder(skipped.pk), 'SKIPPED')
+        self.sender.send.assert_called_once()
+
+
+class LargeTableAdminTests(TestCase):
+    """Changelists of the large-table admins and EstimatedCountPaginator"""
+
+    def setUp(self):
+        self.patient = make_user('patient', 'PATIENT')
+        self.doctor = make_user('doctor', 'STAFF')
+        for hour in (9, 10, 11):
+            make_appointment(self.patient, self.doctor, start=time(hour))
+
+    # The manifest storage needs collectstatic, which tests don't run
+    @override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage')
+    def test_changelists_render(self):
+        superuser = make_user('admin', 'STAFF')
+        User.objects.filter(pk=superuser.pk).update(is_superuser=True)
+        self.client.force_login(superuser)
+        large_tables = [model for model, model_admin in admin.site._registry.items()
+                        if isinstance(model_admin, LargeTableAdmin)]
+        self.assertIn(Appointment, large_tables)
+        for model in large_tables:
+            url = reverse(f'admin:{model._meta.app_label}_{model._meta.model_name}_changelist')
+            self.assertEqual(self.client.get(url).status_code, 200, url)
+            self.assertEqual(self.client.get(url, {'q': 'patient'}).status_code, 200, url)
+
+    def test_other_databases_count_exactly(self):
+        paginator = EstimatedCountPaginator(Appointment.objects.order_by('pk'), 2)
+        with mock.patch.object(EstimatedCountPaginator, '_estimate') as estimate:
+            self.assertEqual(paginator.count, 3)
+        estimate.assert_not_called()
+        self.assertEqual(paginator.num_pages, 2)
+
+    def test_postgresql_uses_large_estimates_only(self):
+        for estimate, expected in ((50_000, 50_000), (5, 3), (None, 3)):
+            paginator = EstimatedCountPaginator(Appointment.objects.order_by('pk'), 2)
+            with mock.patch.object(connections['default'], 'vendor', 'postgresql'), \
+                    mock.patch.object(EstimatedCountPaginator, '_estimate', return_value=estimate):
+                self.assertEqual(paginator.count, expected, estimate)
+
+
+class DoctorSearchTests(TestCase):
+    """Doctor search on the stored next_free_slot, and the sweep that keeps it current"""
+
+    def setUp(self):
+        branch = Branch.objects.create(name='Salmiya', address='Salem Al Mubarak St')
+        self.stale = DoctorProfile.objects.create(
+            user=make_user('doctor1', 'STAFF'), branch=branch, specialization='Orthodontics'
+        )
+        self.current = DoctorProfile.objects.create(
+            user=make_user('doctor2', 'STAFF'), branch=branch, specialization='Orthodontics'
+        )
+        for day in range(7):
+            DoctorSchedule.objects.create(doctor=self.stale, day_of_week=day, start_time=time(0), end_time=time(23, 30))
+        now = timezone.now()
+        DoctorProfile.objects.filter(pk=self.stale.pk).update(next_free_slot=now - timedelta(hours=1))
+        DoctorProfile.objects.filter(pk=self.current.pk).update(next_free_slot=now + timedelta(hours=2))
+        self.client = APIClient()
+        self.client.force_authenticate(make_user('patient1', 'PATIENT'))
+
+    def _search(self, **params):
+        response = self.client.get('/api/doctors/search/', params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return [result['id'] for result in response.json()['results']]
+
+    def test_search_skips_passed_slots_without_writing(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self._search(available_within_days=1), [self.current.pk])
+        self.assertFalse([q for q in queries.captured_queries if q['sql'].startswith('UPDATE')])
+
+    def test_stale_sweep_recomputes_passed_slots(self):
+        self.assertEqual(refresh_stale_next_free_slots(), 1)
+        self.stale.refresh_from_db()
+        self.assertGreater(self.stale.next_free_slot, timezone.now())
+        self.assertEqual(set(self._search(available_within_days=1)), {self.stale.pk, self.current.pk})
+
+    def test_reminder_loop_refreshes_slots(self):
+        out = mock.Mock()
+        call_command('schedule_reminders', '--once', stdout=out)
+        self.stale.refresh_from_db()
+        self.assertGreater(self.stale.next_free_slot, timezone.now())
@@ -5,24 +5,19 @@ from rest_framework import viewsets, status, filters
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
+from django.db import IntegrityError, transaction
 from django.db.models import Count, Q
 from django.utils import timezone
 from datetime import date, datetime
 from drf_spectacular.utils import extend_schema, extend_schema_view
-from .models import Appointment
+from .models import Appointment, VisitHistoryOutbox
+from .mongo import MongoUnavailable, get_visit_history_by_appointment
 from .serializers import (
     AppointmentSerializer, 
     AppointmentStatusUpdateSerializer,
     VisitHistorySerializer,
     VisitHistoryCreateSerializer
 )
-from .mongo import (
-    insert_visit_history,
-    get_visit_history_by_patient,
-    get_visit_history_by_doctor,
-    get_all_visit_history,
-    get_visit_history_by_appointment
-)
 from .availability import (
     get_available_time_slots,
     is_time_slot_available,
@@ -321,8 +316,17 @@ class AppointmentViewSet(viewsets.ModelViewSet):
     @action(detail=True, methods=['post'], permission_classes=[IsAuthenticated])
     def add_visit_history(self, request, pk=None):
         """
-        Add visit history for a completed appointment (MongoDB).
+        Add visit history for a completed appointment.
         Only doctors can add visit history, and only for completed appointments.
+        
+        The record is written to the PostgreSQL outbox in the same transaction
+        as the appointment status check; the relay_visit_history command
+        delivers it to MongoDB, so a Mongo outage never loses the note.
+        
+        Records written before the outbox existed have no outbox row, so
+        MongoDB is asked first whenever it is reachable. While it is down the
+        note is accepted; if a record turns out to exist, the relay marks the
+        row DUPLICATE and keeps the note in it (see the outbox admin).
         """
         appointment = self.get_object()
         user = request.user
@@ -341,44 +345,50 @@ class AppointmentViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_403_FORBIDDEN
             )
         
-        # Only allow visit history for completed appointments
-        if appointment.status != 'COMPLETED':
-            return Response(
-                {"error": "Visit history can only be added for completed appointments."},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        
-        # Check if visit history already exists
-        existing_history = get_visit_history_by_appointment(appointment.id)
-        if existing_history:
-            return Response(
-                {"error": "Visit history already exists for this appointment."},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        
         # Validate input
         serializer = VisitHistoryCreateSerializer(data=request.data)
         if not serializer.is_valid():
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
         
-        # Insert visit history into MongoDB
         try:
-            visit_record = insert_visit_history(
-                appointment_id=appointment.id,
-                patient_id=appointment.patient.id,
-                doctor_id=appointment.doctor.id,
-                visit_date=appointment.appointment_date,
-                notes=serializer.validated_data.get('notes', ''),
-                prescription=serializer.validated_data.get('prescription', '')
+            existing = get_visit_history_by_appointment(appointment.pk)
+        except MongoUnavailable:
+            existing = None
+        if existing is not None:
+            return Response(
+                {"error": "Visit history already exists for this appointment."},
+                status=status.HTTP_400_BAD_REQUEST
             )
-            
-            # Serialize and return the created record
-            response_serializer = VisitHistorySerializer(visit_record)
-            return Response(response_serializer.data, status=status.HTTP_201_CREATED)
         
-        except Exception as e:
+        try:
+            with transaction.atomic():
+                # Lock the appointment so its status can't change under us
+                appointment = Appointment.objects.select_for_update().get(pk=appointment.pk)
+                
+                # Only allow visit history for completed appointments
+                if appointment.status != 'COMPLETED':
+                    return Response(
+                        {"error": "Visit history can only be added for completed appointments."},
+                        status=status.HTTP_400_BAD_REQUEST
+                    )
+                
+                # One outbox row per appointment (unique constraint)
+                outbox_entry = VisitHistoryOutbox.objects.create(
+                    appointment=appointment,
+                    patient_id=appointment.patient_id,
+                    doctor_id=appointment.doctor_id,
+                    visit_date=appointment.appointment_date,
+                    notes=serializer.validated_data.get('notes', ''),
+                    prescription=serializer.validated_data.get('prescription', '')
+                )
+        except IntegrityError:
             return Response(
-                {"error": f"Failed to save visit history: {str(e)}"},
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+                {"error": "Visit history already exists for this appointment."},
+                status=status.HTTP_400_BAD_REQUEST
             )
-
+        
+        visit_record = outbox_entry.as_visit_record()
+        visit_record['visit_date'] = datetime.combine(outbox_entry.visit_date, datetime.min.time())
+        visit_record['created_at'] = outbox_entry.created_at
+        response_serializer = VisitHistorySerializer(visit_record)
+        return Response(response_serializer.data, status=status.HTTP_201_CREATED)
@@ -5,15 +5,82 @@ from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
-from .serializers import VisitHistorySerializer
+from django.core.cache import cache
+from django.http import StreamingHttpResponse
+from django.utils.dateparse import parse_date
+from decouple import config
+from .serializers import (
+    VisitHistorySerializer,
+    EnrichedVisitHistorySerializer,
+    VisitHistorySearchResultSerializer,
+    PrescriptionSerializer,
+    PatientOnDrugSerializer
+)
+from .enrichment import VisitRecordEnricher
+from .search import VISIT_HISTORY_SEARCH_MAX_PAGE, search_visit_history
 from .mongo import (
+    MongoUnavailable,
+    MONGODB_BREAKER_RESET_TIMEOUT,
     get_visit_history_by_patient,
     get_visit_history_by_doctor,
-    get_all_visit_history
+    get_all_visit_history,
+    get_active_prescriptions_for_patient,
+    get_patients_on_drug,
+    stream_visit_history_json,
+    visit_history_cache,
+    mongo_breaker,
+    visits_per_doctor_per_month,
+    prescription_frequency,
+    repeat_visit_intervals
 )
 
+# How long aggregated analytics are cached (seconds)
+VISIT_ANALYTICS_CACHE_TTL = config('VISIT_ANALYTICS_CACHE_TTL', default=300, cast=int)
+
+ANALYTICS_REPORTS = {
+    'visits_per_doctor': visits_per_doctor_per_month,
+    'prescriptions': prescription_frequency,
+    'repeat_visits': repeat_visit_intervals,
+}
+
+
+def _flag_param(request, name):
+    """True for ?name=true/1/yes"""
+    return request.query_params.get(name, '').lower() in ('true', '1', 'yes')
+
+
+def _parse_date_param(value):
+    """Parse a YYYY-MM-DD query param; None if missing or invalid"""
+    if not value:
+        return None
+    try:
+        return parse_date(value)
+    except ValueError:
+        return None
+
 
-class VisitHistoryViewSet(viewsets.ViewSet):
+def mongo_unavailable_response(error):
+    """503 with Retry-After for a MongoUnavailable raised while the circuit is open"""
+    return Response(
+        {"error": str(error)},
+        status=status.HTTP_503_SERVICE_UNAVAILABLE,
+        headers={'Retry-After': str(int(MONGODB_BREAKER_RESET_TIMEOUT))}
+    )
+
+
+class MongoUnavailableMixin:
+    """
+    Answer MongoUnavailable from any action with a 503, so actions call the
+    Mongo helpers directly and fail fast while the circuit is open.
+    """
+    
+    def handle_exception(self, exc):
+        if isinstance(exc, MongoUnavailable):
+            return mongo_unavailable_response(exc)
+        return super().handle_exception(exc)
+
+
+class VisitHistoryViewSet(MongoUnavailableMixin, viewsets.ViewSet):
     """
     ViewSet for viewing visit history from MongoDB.
     
@@ -28,21 +95,41 @@ class VisitHistoryViewSet(viewsets.ViewSet):
         - Patients: see only their own history
         - Doctors: see history for their patients
         - Admins: see all records
+        
+        Optional ?start= and ?end= (YYYY-MM-DD) limit the date range.
+        Archived records are only read when ?start= is older than the archive
+        cutoff or ?include_archive=true is passed.
+        
+        Pass ?enrich=true to include patient, doctor, appointment and
+        branch details (one query per table for the whole page).
         """
         user = request.user
         
+        start = request.query_params.get('start')
+        end = request.query_params.get('end')
+        start_date = _parse_date_param(start)
+        end_date = _parse_date_param(end)
+        if (start and not start_date) or (end and not end_date):
+            return Response(
+                {"error": "start and end must be dates in YYYY-MM-DD format."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        include_archive = _flag_param(request, 'include_archive')
+        ranges = {'start_date': start_date, 'end_date': end_date, 'include_archive': include_archive}
+        
         try:
             if user.is_patient():
                 # Patients see only their own visit history
-                records = get_visit_history_by_patient(user.id)
+                records = get_visit_history_by_patient(user.id, **ranges)
             
             elif user.is_staff():
                 # Staff see visit history for their patients
-                records = get_visit_history_by_doctor(user.id)
+                records = get_visit_history_by_doctor(user.id, **ranges)
             
             elif user.is_superuser:
                 # Superusers see all visit history
-                records = get_all_visit_history()
+                records = get_all_visit_history(**ranges)
             
             else:
                 return Response(
@@ -50,13 +137,254 @@ class VisitHistoryViewSet(viewsets.ViewSet):
                     status=status.HTTP_403_FORBIDDEN
                 )
             
-            # Serialize the MongoDB documents
-            serializer = VisitHistorySerializer(records, many=True)
+            if _flag_param(request, 'enrich'):
+                # Copy so enrichment doesn't leak into the stale-read cache
+                records = VisitRecordEnricher().enrich([dict(record) for record in records])
+                serializer = EnrichedVisitHistorySerializer(records, many=True)
+            else:
+                # Serialize the MongoDB documents
+                serializer = VisitHistorySerializer(records, many=True)
             return Response(serializer.data)
         
+        except MongoUnavailable:
+            # Answered with 503 by handle_exception
+            raise
+        
         except Exception as e:
             return Response(
                 {"error": f"Failed to retrieve visit history: {str(e)}"},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
+    
+    @action(detail=False, methods=['get'], permission_classes=[IsAuthenticated])
+    def stream(self, request):
+        """
+        Stream visit history as a JSON array (same role rules as list).
+        
+        Records go from MongoDB to the client batch by batch without
+        building the whole list or running the serializer, so large doctor
+        and admin histories use constant memory. Pass ?include_archive=true
+        to include archived records.
+        """
+        user = request.user
+        
+        if user.is_patient():
+            query = {'patient_id': user.id}
+        elif user.is_staff():
+            query = {'doctor_id': user.id}
+        elif user.is_superuser:
+            query = {}
+        else:
+            return Response(
+                {"error": "Invalid user role."},
+                status=status.HTTP_403_FORBIDDEN
+            )
+        
+        chunks = stream_visit_history_json(query, include_archive=_flag_param(request, 'include_archive'))
+        return StreamingHttpResponse(chunks, content_type='application/json')
+    
+    @action(detail=False, methods=['get'], permission_classes=[IsAuthenticated])
+    def search(self, request):
+        """
+        Full-text search over visit notes and prescriptions.
+        
+        Query params:
+        - q: search terms (2-100 characters)
+        - page: page number (default 1, max VISIT_HISTORY_SEARCH_MAX_PAGE)
+        - page_size: results per page (default 20, max 100)
+        
+        Results are ranked by relevance and scoped like list: patients search
+        their own history, doctors their own patients', admins everything.
+        """
+        user = request.user
+        
+        text = request.query_params.get('q', '').strip()
+        if not 2 <= len(text) <= 100:
+            return Response(
+                {"error": "Search text must be between 2 and 100 characters."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        try:
+            page = max(int(request.query_params.get('page', 1)), 1)
+            page_size = min(max(int(request.query_params.get('page_size', 20)), 1), 100)
+        except ValueError:
+            return Response(
+                {"error": "page and page_size must be integers."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if page > VISIT_HISTORY_SEARCH_MAX_PAGE:
+            return Response(
+                {"error": f"page must be at most {VISIT_HISTORY_SEARCH_MAX_PAGE}; narrow the search instead."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        if user.is_patient():
+            scope = {'patient_id': user.id}
+        elif user.is_staff():
+            scope = {'doctor_id': user.id}
+        elif user.is_superuser:
+            scope = {}
+        else:
+            return Response(
+                {"error": "Invalid user role."},
+                status=status.HTTP_403_FORBIDDEN
+            )
+        
+        records, has_more = search_visit_history(text, page=page, page_size=page_size, **scope)
+        return Response({
+            'page': page,
+            'page_size': page_size,
+            'has_more': has_more,
+            'results': VisitHistorySearchResultSerializer(records, many=True).data,
+        })
+    
+    @action(detail=False, methods=['get'], permission_classes=[IsAuthenticated])
+    def active_prescriptions(self, request):
+        """
+        Currently active prescriptions for a patient.
+        
+        Patients get their own; staff pass ?patient_id= and see the
+        prescriptions they wrote; admins see all of the patient's.
+        """
+        user = request.user
+        doctor_id = None
+        
+        if user.is_patient():
+            patient_id = user.id
+        elif user.is_staff() or user.is_superuser:
+            try:
+                patient_id = int(request.query_params.get('patient_id', ''))
+            except ValueError:
+                return Response(
+                    {"error": "patient_id is required and must be an integer."},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            if user.is_staff():
+                doctor_id = user.id
+        else:
+            return Response(
+                {"error": "Invalid user role."},
+                status=status.HTTP_403_FORBIDDEN
+            )
+        
+        prescriptions = get_active_prescriptions_for_patient(patient_id, doctor_id=doctor_id)
+        return Response(PrescriptionSerializer(prescriptions, many=True).data)
+    
+    @action(detail=False, methods=['get'], permission_classes=[IsAuthenticated])
+    def patients_on_drug(self, request):
+        """
+        Patients with an active prescription for ?drug= (staff and admins).
+        Staff only see prescriptions they wrote.
+        """
+        user = request.user
+        
+        if user.is_staff():
+            doctor_id = user.id
+        elif user.is_superuser:
+            doctor_id = None
+        else:
+            return Response(
+                {"error": "Only staff can search patients by medication."},
+                status=status.HTTP_403_FORBIDDEN
+            )
+        
+        drug = request.query_params.get('drug', '').strip()
+        if not drug:
+            return Response(
+                {"error": "drug is required."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        patients = get_patients_on_drug(drug, doctor_id=doctor_id)
+        return Response(PatientOnDrugSerializer(patients, many=True).data)
+    
+    @action(detail=False, methods=['get'], permission_classes=[IsAuthenticated])
+    def cache_stats(self, request):
+        """
+        Read cache counters (all workers) and the circuit breaker state of
+        the worker serving this request (admins only)
+        """
+        if not request.user.is_superuser:
+            return Response(
+                {"error": "Only admins can view cache statistics."},
+                status=status.HTTP_403_FORBIDDEN
+            )
+        
+        return Response({
+            'read_cache': visit_history_cache.stats(),
+            'circuit_breaker': {
+                'state': mongo_breaker.state,
+                'failure_count': mongo_breaker.failure_count,
+            },
+        })
+    
+    @action(detail=False, methods=['get'], permission_classes=[IsAuthenticated])
+    def analytics(self, request):
+        """
+        Aggregated visit history analytics (read-only, cached).
+        
+        Query params:
+        - report: visits_per_doctor, prescriptions or repeat_visits
+          (default: all three)
+        - start, end: visit date range (YYYY-MM-DD, inclusive)
+        - doctor_id: restrict to one doctor (admins only; doctors are
+          always scoped to themselves)
+        - include_archive: true to count archived visits when start is
+          missing or newer than the archive cutoff
+        
+        Patients cannot access analytics.
+        """
+        user = request.user
+        
+        if user.is_superuser:
+            doctor_id = request.query_params.get('doctor_id')
+            try:
+                doctor_id = int(doctor_id) if doctor_id else None
+            except ValueError:
+                return Response(
+                    {"error": "doctor_id must be an integer."},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+        elif user.is_staff():
+            doctor_id = user.id
+        else:
+            return Response(
+                {"error": "Only staff can access visit analytics."},
+                status=status.HTTP_403_FORBIDDEN
+            )
+        
+        start = request.query_params.get('start')
+        end = request.query_params.get('end')
+        start_date = _parse_date_param(start)
+        end_date = _parse_date_param(end)
+        if (start and not start_date) or (end and not end_date):
+            return Response(
+                {"error": "start and end must be dates in YYYY-MM-DD format."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        report = request.query_params.get('report')
+        if report and report not in ANALYTICS_REPORTS:
+            return Response(
+                {"error": f"Unknown report. Choose from: {', '.join(ANALYTICS_REPORTS)}."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        reports = [report] if report else list(ANALYTICS_REPORTS)
+        include_archive = _flag_param(request, 'include_archive')
+        
+        results = {}
+        for name in reports:
+            cache_key = f'visit_analytics:{name}:{doctor_id}:{start_date}:{end_date}:{include_archive}'
+            rows = cache.get(cache_key)
+            if rows is None:
+                rows = ANALYTICS_REPORTS[name](
+                    start_date=start_date,
+                    end_date=end_date,
+                    doctor_id=doctor_id,
+                    include_archive=include_archive
+                )
+                cache.set(cache_key, rows, VISIT_ANALYTICS_CACHE_TTL)
+            results[name] = rows
+        return Response(results)
@@ -3,6 +3,7 @@ Django settings for clinic_appointment project.
 """
 
 from pathlib import Path
+from django.core.exceptions import ImproperlyConfigured
 from decouple import config  # Keep for backward compatibility
 import os
 from dotenv import load_dotenv  # Load .env file
@@ -66,6 +67,7 @@ INSTALLED_APPS = [
     # Local apps
     'accounts',
     'appointments',
+    'jobs',
 ]
 
 MIDDLEWARE = [
@@ -134,6 +136,46 @@ else:
     }
 
 
+# Caches
+# 'default' stays per-process. The other aliases must be shared between workers
+# in production: set REDIS_URL (Railway Redis plugin). Without it each process
+# gets its own in-memory cache (fine for local development).
+# - 'ratelimit': rate-limit counters and revoked refresh tokens
+# - 'visit_history': visit history listings and their version counters
+# - 'directory': doctor directory snapshots (large JSON bodies, evictable)
+REDIS_URL = os.environ.get("REDIS_URL")
+
+
+def _shared_cache(name, key_prefix='', max_entries=300):
+    """Redis when REDIS_URL is set, else a per-process LocMemCache"""
+    if REDIS_URL:
+        return {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": REDIS_URL,
+            "KEY_PREFIX": key_prefix,
+        }
+    return {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": name,
+        "OPTIONS": {"MAX_ENTRIES": max_entries},
+    }
+
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    "ratelimit": _shared_cache("ratelimit"),
+    "visit_history": _shared_cache(
+        "visit_history", key_prefix="vh", max_entries=config('VISIT_HISTORY_CACHE_SIZE', default=1024, cast=int)
+    ),
+    "directory": _shared_cache("directory", key_prefix="dir"),
+    # Per-user principal generations (accounts.principal)
+    "principal": _shared_cache(
+        "principal", key_prefix="pr", max_entries=config('PRINCIPAL_CACHE_SIZE', default=2048, cast=int)
+    ),
+}
+
 # Custom User Model
 AUTH_USER_MODEL = 'accounts.User'
 
@@ -155,6 +197,30 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# Password hashing
+# PASSWORD_HASHER picks the hasher for new passwords ('pbkdf2' or 'argon2');
+# costs are set in accounts/hashers.py. Hashes made with another hasher or
+# cost are upgraded on the user's next successful login.
+_PASSWORD_HASHERS = {
+    'pbkdf2': 'accounts.hashers.TunablePBKDF2PasswordHasher',
+    'argon2': 'accounts.hashers.TunableArgon2PasswordHasher',
+}
+_hasher_name = os.environ.get('PASSWORD_HASHER', 'pbkdf2').lower()
+if _hasher_name not in _PASSWORD_HASHERS:
+    raise ImproperlyConfigured(
+        f"PASSWORD_HASHER must be one of: {', '.join(_PASSWORD_HASHERS)} (got {_hasher_name!r})"
+    )
+_preferred_hasher = _PASSWORD_HASHERS[_hasher_name]
+
+PASSWORD_HASHERS = [_preferred_hasher] + [
+    hasher for hasher in (
+        *_PASSWORD_HASHERS.values(),
+        'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+        'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+        'django.contrib.auth.hashers.ScryptPasswordHasher',
+    ) if hasher != _preferred_hasher
+]
+
 
 # Internationalization
 # https://docs.djangoproject.com/en/4.2/topics/i18n/
@@ -187,7 +253,8 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # REFACTOR: Disabled browsable API - using JSONRenderer only to prevent patients from seeing API errors
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        # simplejwt's JWTAuthentication with a per-process user/profile cache
+        'accounts.authentication.CachedJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
@@ -208,6 +275,9 @@ SIMPLE_JWT = {
     'REFRESH_TOKEN_LIFETIME': timedelta(days=1),
     'ROTATE_REFRESH_TOKENS': True,
     'BLACKLIST_AFTER_ROTATION': True,
+    # Rotated refresh tokens are revoked in accounts.revocation (not the token_blacklist app)
+    'TOKEN_REFRESH_SERIALIZER': 'accounts.serializers.RevokingTokenRefreshSerializer',
+    'TOKEN_VERIFY_SERIALIZER': 'accounts.serializers.RevokingTokenVerifySerializer',
     'AUTH_HEADER_TYPES': ('Bearer',),
 }
 
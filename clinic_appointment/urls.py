@@ -10,7 +10,9 @@ from drf_spectacular.views import (
     SpectacularRedocView,
     SpectacularSwaggerView,
 )
+from rest_framework_simplejwt.views import TokenObtainPairView
 from accounts.api_views import api_register_patient, api_register_staff
+from accounts.ratelimit import LOGIN_FAILURE_LIMIT, rate_limit
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -22,6 +24,12 @@ urlpatterns = [
     
     # Authentication (Djoser + JWT)
     path('api/auth/', include('djoser.urls')),
+    # Rate-limited JWT login (failed attempts per IP); shadows djoser's jwt/create/
+    path('api/auth/jwt/create/',
+         rate_limit('login', LOGIN_FAILURE_LIMIT, 300, counts=lambda response: response.status_code == 401)(
+             TokenObtainPairView.as_view()
+         ),
+         name='jwt-create'),
     path('api/auth/', include('djoser.urls.jwt')),
     
     # Registration API endpoints (REST API)
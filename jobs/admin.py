@@ -0,0 +1,27 @@
+"""
+Admin configuration for jobs app
+"""
+from django.contrib import admin
+from django.utils import timezone
+from clinic_appointment.admin_utils import LargeTableAdmin
+from .models import Job
+
+
+@admin.register(Job)
+class JobAdmin(LargeTableAdmin):
+    """Admin for background jobs: inspect failures and requeue them"""
+    list_display = ('id', 'name', 'status', 'attempts', 'max_attempts', 'run_at', 'locked_by', 'finished_at')
+    list_filter = ('status', 'name')
+    search_fields = ('name', 'last_error')
+    readonly_fields = ('created_at', 'locked_by', 'locked_at', 'finished_at')
+    ordering = ('-id',)
+    list_per_page = 100
+    actions = ['requeue']
+    
+    @admin.action(description='Requeue selected jobs')
+    def requeue(self, request, queryset):
+        """Run failed or finished jobs again with a fresh attempt budget"""
+        count = queryset.exclude(status='RUNNING').update(
+            status='PENDING', attempts=0, run_at=timezone.now(), finished_at=None
+        )
+        self.message_user(request, f'{count} job(s) requeued.')
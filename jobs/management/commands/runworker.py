@@ -0,0 +1,112 @@
+"""
+Run background jobs from the jobs table.
+
+Usage:
+    python manage.py runworker                   # run continuously, 4 threads
+    python manage.py runworker --concurrency 8
+    python manage.py runworker --once            # run everything due and exit
+    python manage.py runworker --stats           # print queue metrics and exit
+
+Run several workers (processes or hosts) for more throughput; claiming is
+safe across them. SIGTERM/SIGINT stop claiming and let running jobs finish.
+"""
+import json
+import os
+import signal
+import socket
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from jobs.queue import (
+    JOB_RETENTION_DAYS, WorkerStats, claim_jobs, job_metrics,
+    prune_finished_jobs, release_stale_jobs, run_job
+)
+
+# Housekeeping intervals (seconds)
+STALE_CHECK_INTERVAL = 60
+PRUNE_INTERVAL = 3600
+
+
+class Command(BaseCommand):
+    help = 'Process queued background jobs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=4,
+                            help='Jobs run in parallel threads (default: 4)')
+        parser.add_argument('--interval', type=float, default=1.0,
+                            help='Seconds to sleep when no job is due (default: 1)')
+        parser.add_argument('--stats-interval', type=float, default=300,
+                            help='Seconds between metrics log lines (default: 300)')
+        parser.add_argument('--once', action='store_true',
+                            help='Run all due jobs and exit')
+        parser.add_argument('--stats', action='store_true',
+                            help='Print queue metrics as JSON and exit')
+
+    def handle(self, *args, **options):
+        if options['stats']:
+            self.stdout.write(json.dumps(job_metrics(), indent=2))
+            return
+
+        concurrency = max(1, options['concurrency'])
+        worker_id = f'{socket.gethostname()}:{os.getpid()}'
+        stats = WorkerStats()
+        stopping = threading.Event()
+
+        def stop(signum, frame):
+            self.stdout.write('Stopping after running jobs finish...')
+            stopping.set()
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+
+        def execute(claimed):
+            close_old_connections()
+            started = time.monotonic()
+            try:
+                outcome = run_job(claimed)
+            finally:
+                close_old_connections()
+            stats.record(claimed.name, outcome, time.monotonic() - started)
+
+        self.stdout.write(f'Worker {worker_id} started with {concurrency} thread(s)')
+        running = set()
+        last_stale_check = last_prune = last_stats = 0
+
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='job') as pool:
+            while not stopping.is_set():
+                now = time.monotonic()
+                if now - last_stale_check >= STALE_CHECK_INTERVAL:
+                    release_stale_jobs()
+                    last_stale_check = now
+                if now - last_prune >= PRUNE_INTERVAL:
+                    pruned = prune_finished_jobs(JOB_RETENTION_DAYS)
+                    if pruned:
+                        self.stdout.write(f'Pruned {pruned} finished job(s)')
+                    last_prune = now
+                if now - last_stats >= options['stats_interval']:
+                    for line in stats.summary():
+                        self.stdout.write(line)
+                    last_stats = now
+
+                # Only claim what a free thread can start now, so other
+                # workers can pick up the rest
+                claimed = claim_jobs(worker_id, concurrency - len(running))
+                running |= {pool.submit(execute, job) for job in claimed}
+
+                if not claimed and not running and options['once']:
+                    break
+                if len(running) >= concurrency:
+                    done, running = wait(running, return_when=FIRST_COMPLETED)
+                    running = set(running)
+                elif not claimed:
+                    if running:
+                        done, running = wait(running, timeout=options['interval'], return_when=FIRST_COMPLETED)
+                        running = set(running)
+                    else:
+                        stopping.wait(options['interval'])
+
+            wait(running)
+
+        for line in stats.summary():
+            self.stdout.write(line)
@@ -0,0 +1,49 @@
+"""
+Job model for the database-backed background queue
+"""
+from django.db import models
+from django.utils import timezone
+
+
+class Job(models.Model):
+    """
+    One unit of background work: a registered handler name plus JSON kwargs.
+
+    Workers claim PENDING rows whose run_at has passed (see jobs.queue), mark
+    them RUNNING and record the outcome. Failed runs go back to PENDING with
+    a later run_at until max_attempts is reached.
+    """
+    STATUS_CHOICES = [
+        ('PENDING', 'Pending'),
+        ('RUNNING', 'Running'),
+        ('SUCCEEDED', 'Succeeded'),
+        ('FAILED', 'Failed'),  # Gave up after max_attempts
+    ]
+
+    name = models.CharField(max_length=100, db_index=True)
+    payload = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='PENDING')
+    attempts = models.IntegerField(default=0)
+    max_attempts = models.IntegerField(default=5)
+    run_at = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=100, blank=True, default='')
+    locked_at = models.DateTimeField(blank=True, null=True)
+    last_error = models.TextField(blank=True, null=True)
+    created_at = models.DateTimeField(default=timezone.now, editable=False)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        db_table = 'jobs'
+        verbose_name = 'Background Job'
+        verbose_name_plural = 'Background Jobs'
+        ordering = ['id']
+        indexes = [
+            # Claim scan: due pending jobs in run_at order
+            models.Index(fields=['status', 'run_at']),
+            # Stale-lock recovery and retention pruning
+            models.Index(fields=['status', 'locked_at']),
+            models.Index(fields=['status', 'finished_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.name} #{self.pk} ({self.status})"
@@ -0,0 +1,268 @@
+"""
+Database-backed job queue.
+
+Handlers are registered by name with the @job decorator in an app's
+tasks.py (autodiscovered by JobsConfig). Code that wants work done later
+calls enqueue(), ideally inside the transaction whose changes the job
+depends on: the row only becomes visible to workers when that transaction
+commits, and disappears with it on rollback.
+
+Workers (manage.py runworker) claim due jobs in batches. On PostgreSQL the
+claim query uses SELECT ... FOR UPDATE SKIP LOCKED, so concurrent workers
+pass over each other's rows instead of queueing on them. Backends without
+SKIP LOCKED (SQLite) fall back to a conditional UPDATE ... WHERE
+status = 'PENDING': SQLite serializes writers, so only one worker's UPDATE
+can move a given row to RUNNING.
+
+A failed run is retried with exponential backoff and jitter until
+max_attempts, then marked FAILED. A worker that dies mid-job leaves the row
+RUNNING; release_stale_jobs() returns such rows to the queue after
+JOB_LOCK_TIMEOUT_SECONDS, so handlers must be safe to run twice.
+"""
+from datetime import timedelta
+from decouple import config
+from django.db import connection, transaction
+from django.db.models import Count, F, Min
+from django.utils import timezone
+from .models import Job
+import logging
+import random
+import threading
+
+logger = logging.getLogger(__name__)
+
+JOB_MAX_ATTEMPTS = config('JOB_MAX_ATTEMPTS', default=5, cast=int)
+JOB_LOCK_TIMEOUT_SECONDS = config('JOB_LOCK_TIMEOUT_SECONDS', default=600, cast=int)
+JOB_RETENTION_DAYS = config('JOB_RETENTION_DAYS', default=7, cast=int)
+
+# Backoff between retries: 10s, 20s, 40s, ... capped at 1 hour, plus up to 10% jitter
+RETRY_BASE_SECONDS = 10
+RETRY_MAX_SECONDS = 3600
+
+# name -> (handler, max_attempts)
+JOB_HANDLERS = {}
+
+
+def job(name, max_attempts=JOB_MAX_ATTEMPTS):
+    """
+    Register a function as a job handler.
+
+    The handler is called with the job payload as keyword arguments, so the
+    payload must be JSON-serializable.
+
+    Args:
+        name (str): Unique job name, e.g. 'accounts.send_email'
+        max_attempts (int): Runs before the job is marked FAILED
+    """
+    def decorator(func):
+        if name in JOB_HANDLERS and JOB_HANDLERS[name][0] is not func:
+            raise ValueError(f"Job '{name}' is already registered")
+        JOB_HANDLERS[name] = (func, max_attempts)
+        return func
+    return decorator
+
+
+def _new_job(name, payload, run_at):
+    if name not in JOB_HANDLERS:
+        raise ValueError(f"Unknown job '{name}'")
+    return Job(
+        name=name,
+        payload=payload or {},
+        max_attempts=JOB_HANDLERS[name][1],
+        run_at=run_at or timezone.now(),
+    )
+
+
+def enqueue(name, payload=None, delay=0, run_at=None):
+    """
+    Queue one job.
+
+    Args:
+        name (str): Registered job name
+        payload (dict): Keyword arguments for the handler
+        delay (float): Seconds to wait before the job is due
+        run_at (datetime): Explicit due time (overrides delay)
+
+    Returns:
+        Job: The saved job
+    """
+    if run_at is None and delay:
+        run_at = timezone.now() + timedelta(seconds=delay)
+    new_job = _new_job(name, payload, run_at)
+    new_job.save()
+    return new_job
+
+
+def enqueue_many(name, payloads, batch_size=500):
+    """
+    Queue one job per payload with bulk_create.
+
+    Returns:
+        int: Number of jobs queued
+    """
+    now = timezone.now()
+    jobs = [_new_job(name, payload, now) for payload in payloads]
+    Job.objects.bulk_create(jobs, batch_size=batch_size)
+    return len(jobs)
+
+
+def claim_jobs(worker_id, limit):
+    """
+    Claim up to `limit` due jobs for a worker and mark them RUNNING.
+
+    Args:
+        worker_id (str): Identifies the claiming worker (host:pid)
+        limit (int): Maximum jobs to claim
+
+    Returns:
+        list[Job]: Claimed jobs, attempts already incremented
+    """
+    now = timezone.now()
+    due = Job.objects.filter(status='PENDING', run_at__lte=now).order_by('run_at', 'id')
+    claim = {'status': 'RUNNING', 'locked_by': worker_id, 'locked_at': now, 'attempts': F('attempts') + 1}
+
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            ids = list(due.select_for_update(skip_locked=True).values_list('pk', flat=True)[:limit])
+            Job.objects.filter(pk__in=ids).update(**claim)
+    else:
+        # No row locks: read candidates, then claim only those still PENDING.
+        # Kept outside a transaction because SQLite cannot upgrade a read
+        # transaction to a write while another connection is writing.
+        ids = list(due.values_list('pk', flat=True)[:limit])
+        Job.objects.filter(pk__in=ids, status='PENDING').update(**claim)
+
+    if not ids:
+        return []
+    return list(Job.objects.filter(pk__in=ids, status='RUNNING', locked_by=worker_id, locked_at=now))
+
+
+def retry_delay(attempts):
+    """Backoff before the next run, after `attempts` failed runs"""
+    delay = min(RETRY_BASE_SECONDS * (2 ** (attempts - 1)), RETRY_MAX_SECONDS)
+    return timedelta(seconds=delay * (1 + random.random() * 0.1))
+
+
+def run_job(claimed):
+    """
+    Run a claimed job's handler and record the outcome.
+
+    Args:
+        claimed (Job): A job returned by claim_jobs()
+
+    Returns:
+        str: 'succeeded', 'retried' or 'failed'
+    """
+    handler = JOB_HANDLERS.get(claimed.name)
+    error = None
+    if handler is None:
+        error = f"No handler registered for job '{claimed.name}'"
+    else:
+        try:
+            handler[0](**claimed.payload)
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+
+    now = timezone.now()
+    # Only touch the row if this claim still owns it (not released as stale)
+    mine = Job.objects.filter(pk=claimed.pk, status='RUNNING', locked_by=claimed.locked_by, locked_at=claimed.locked_at)
+    if error is None:
+        mine.update(status='SUCCEEDED', finished_at=now, last_error=None)
+        return 'succeeded'
+
+    if handler is None or claimed.attempts >= claimed.max_attempts:
+        logger.error(f"Giving up on job {claimed.name} #{claimed.pk} after {claimed.attempts} attempt(s): {error}")
+        mine.update(status='FAILED', finished_at=now, last_error=error)
+        return 'failed'
+
+    logger.warning(f"Job {claimed.name} #{claimed.pk} failed (attempt {claimed.attempts}), retrying: {error}")
+    mine.update(status='PENDING', run_at=now + retry_delay(claimed.attempts), last_error=error)
+    return 'retried'
+
+
+def release_stale_jobs(timeout=JOB_LOCK_TIMEOUT_SECONDS):
+    """
+    Requeue jobs left RUNNING by a worker that died, or fail them if out of attempts.
+
+    Returns:
+        int: Jobs released
+    """
+    now = timezone.now()
+    stale = Job.objects.filter(status='RUNNING', locked_at__lt=now - timedelta(seconds=timeout))
+    failed = stale.filter(attempts__gte=F('max_attempts')).update(
+        status='FAILED', finished_at=now, last_error='Worker lock expired'
+    )
+    requeued = stale.update(status='PENDING', run_at=now, last_error='Worker lock expired')
+    if failed or requeued:
+        logger.warning(f"Released stale jobs: {requeued} requeued, {failed} failed")
+    return failed + requeued
+
+
+def prune_finished_jobs(days=JOB_RETENTION_DAYS, batch_size=5000):
+    """
+    Delete SUCCEEDED and FAILED jobs finished more than `days` ago, in chunks.
+
+    Returns:
+        int: Jobs deleted
+    """
+    cutoff = timezone.now() - timedelta(days=days)
+    total = 0
+    for status in ('SUCCEEDED', 'FAILED'):
+        while True:
+            ids = list(
+                Job.objects.filter(status=status, finished_at__lt=cutoff)
+                .order_by('finished_at').values_list('pk', flat=True)[:batch_size]
+            )
+            if not ids:
+                break
+            deleted, _ = Job.objects.filter(pk__in=ids).delete()
+            total += deleted
+    return total
+
+
+def job_metrics():
+    """
+    Queue depth and outcomes per job name, from the jobs table.
+
+    Returns:
+        dict: {'jobs': {name: {status: count}}, 'due': int,
+               'oldest_due_seconds': float or None, 'running': int}
+    """
+    now = timezone.now()
+    by_name = {}
+    for row in Job.objects.values('name', 'status').annotate(count=Count('id')).order_by():
+        by_name.setdefault(row['name'], {})[row['status']] = row['count']
+
+    due = Job.objects.filter(status='PENDING', run_at__lte=now).aggregate(count=Count('id'), oldest=Min('run_at'))
+    return {
+        'jobs': by_name,
+        'due': due['count'],
+        'oldest_due_seconds': round((now - due['oldest']).total_seconds(), 1) if due['oldest'] else None,
+        'running': sum(statuses.get('RUNNING', 0) for statuses in by_name.values()),
+    }
+
+
+class WorkerStats:
+    """In-process counters for one worker: outcomes and run time per job name"""
+
+    def __init__(self):
+        self.by_name = {}
+        self._lock = threading.Lock()
+
+    def record(self, name, outcome, seconds):
+        with self._lock:
+            stats = self.by_name.setdefault(name, {'succeeded': 0, 'retried': 0, 'failed': 0, 'seconds': 0.0})
+            stats[outcome] += 1
+            stats['seconds'] += seconds
+
+    def summary(self):
+        with self._lock:
+            items = sorted((name, dict(stats)) for name, stats in self.by_name.items())
+        lines = []
+        for name, stats in items:
+            runs = stats['succeeded'] + stats['retried'] + stats['failed']
+            lines.append(
+                f"{name}: runs={runs} succeeded={stats['succeeded']} retried={stats['retried']} "
+                f"failed={stats['failed']} avg_ms={stats['seconds'] / runs * 1000:.1f}"
+            )
+        return lines
@@ -0,0 +1,81 @@
+"""
+Tests for the database-backed job queue.
+
+Handlers are registered under test-only names; JOB_HANDLERS is restored
+after each test.
+"""
+from datetime import timedelta
+from unittest import mock
+from django.test import TestCase
+from django.utils import timezone
+from . import queue
+from .models import Job
+from .queue import claim_jobs, enqueue, enqueue_many, job, prune_finished_jobs, release_stale_jobs, run_job
+
+
+class JobQueueTests(TestCase):
+    """enqueue -> claim -> run, retries, stale locks and pruning"""
+
+    def setUp(self):
+        patcher = mock.patch.dict(queue.JOB_HANDLERS)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.calls = []
+
+        @job('tests.record', max_attempts=2)
+        def record(value):
+            self.calls.append(value)
+
+        @job('tests.fail', max_attempts=2)
+        def fail():
+            raise RuntimeError('boom')
+
+    def test_unknown_jobs_are_rejected(self):
+        with self.assertRaises(ValueError):
+            enqueue('tests.missing')
+        with self.assertRaises(ValueError):
+            job('tests.record')(lambda value: None)
+
+    def test_claim_runs_due_jobs_once(self):
+        enqueue_many('tests.record', [{'value': 1}, {'value': 2}])
+        enqueue('tests.record', {'value': 3}, delay=3600)
+
+        claimed = claim_jobs('worker-a', 10)
+        self.assertEqual(len(claimed), 2)
+        self.assertEqual(claim_jobs('worker-b', 10), [])
+
+        self.assertEqual([run_job(claimed_job) for claimed_job in claimed], ['succeeded', 'succeeded'])
+        self.assertEqual(sorted(self.calls), [1, 2])
+        self.assertEqual(Job.objects.filter(status='SUCCEEDED').count(), 2)
+
+    def test_failures_retry_with_backoff_then_fail(self):
+        enqueue('tests.fail')
+        first = claim_jobs('worker-a', 1)[0]
+        self.assertEqual(run_job(first), 'retried')
+        retried = Job.objects.get()
+        self.assertEqual((retried.status, retried.last_error), ('PENDING', 'RuntimeError: boom'))
+        self.assertGreaterEqual(retried.run_at, timezone.now() + timedelta(seconds=9))
+
+        Job.objects.update(run_at=timezone.now())
+        self.assertEqual(run_job(claim_jobs('worker-a', 1)[0]), 'failed')
+        self.assertEqual(Job.objects.get().status, 'FAILED')
+
+    def test_stale_locks_are_released(self):
+        enqueue('tests.record', {'value': 1})
+        claimed = claim_jobs('worker-a', 1)[0]
+        Job.objects.update(locked_at=timezone.now() - timedelta(hours=1))
+
+        self.assertEqual(release_stale_jobs(timeout=60), 1)
+        self.assertEqual(Job.objects.get().status, 'PENDING')
+        # The dead worker's late result no longer owns the row
+        run_job(claimed)
+        self.assertEqual(Job.objects.get().status, 'PENDING')
+
+    def test_prune_keeps_recent_and_pending_jobs(self):
+        enqueue_many('tests.record', [{'value': i} for i in range(3)])
+        old, recent, pending = Job.objects.order_by('pk')
+        Job.objects.filter(pk=old.pk).update(status='SUCCEEDED', finished_at=timezone.now() - timedelta(days=30))
+        Job.objects.filter(pk=recent.pk).update(status='FAILED', finished_at=timezone.now())
+
+        self.assertEqual(prune_finished_jobs(days=7), 1)
+        self.assertEqual(set(Job.objects.values_list('pk', flat=True)), {recent.pk, pending.pk})